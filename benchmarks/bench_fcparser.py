@@ -0,0 +1,106 @@
+"""Compare the single-pass function call scanner with the old regex parser
+
+uv run benchmarks/bench_fcparser.py
+"""
+
+import argparse
+import re
+import time
+
+from chatbridge.fcparser import scan_function_calls
+
+
+# The patterns parse_function_call used before the scanner
+FUNCTION_CALL_PATTERN = (
+    r"<function_call>\s*<tool>(.*?)</tool>\s*<args>(.*?)</args>\s*</function_call>"
+)
+ARGS_PATTERN = r"<(\w+)>(.*?)</\1>"
+SIZES = [1 << 10, 16 << 10, 128 << 10, 1 << 20]
+FILLER = "The quick brown fox <b>jumps</b> over the lazy dog & keeps < going.\n"
+CALL = (
+    "<function_call>\n"
+    "  <tool>search</tool>\n"
+    "  <args>\n"
+    "    <query>weather in Paris</query>\n"
+    "    <limit>5</limit>\n"
+    "  </args>\n"
+    "</function_call>"
+)
+
+
+def regex_parse_function_call(response: str) -> dict:
+    """The regex implementation parse_function_call used to have"""
+    match = re.search(FUNCTION_CALL_PATTERN, response, re.DOTALL)
+    if not match:
+        return {}
+
+    function_name = match.group(1)
+    args_block = match.group(2)
+    arguments = re.findall(ARGS_PATTERN, args_block)
+
+    argument_set = {}
+    for arg in arguments:
+        if arg[0] == "empty":
+            argument_set = {}
+            break
+        else:
+            argument_set[arg[0]] = arg[1]
+
+    return {"function_name": function_name, "arguments": argument_set}
+
+
+def build_outputs(size: int) -> dict:
+    """Synthetic model outputs of roughly `size` characters"""
+    filler = (FILLER * (size // len(FILLER) + 1))[:size]
+    return {
+        "text": filler,
+        "call_at_end": "FC_USE\n" + filler + CALL,
+        "unclosed_call": "FC_USE\n<function_call><tool>search</tool><args>" + filler,
+        "many_unclosed": (
+            "FC_USE\n" + "<function_call><tool>search</tool><args>" * (size // 64)
+        )[:size],
+    }
+
+
+def measure(func, text: str, min_time: float) -> float:
+    """Average seconds per call, repeated for at least min_time"""
+    runs = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        func(text)
+        runs += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument(
+        "--max-regex-time",
+        type=float,
+        default=1.0,
+        help="skip larger sizes of a case once one regex run takes longer",
+    )
+    args = parser.parse_args()
+
+    too_slow = set()
+    print(f"{'case':<16}{'size':>10}{'regex (us)':>14}{'scanner (us)':>14}{'speedup':>10}")
+    for size in SIZES:
+        for case, text in build_outputs(size).items():
+            scanner = measure(scan_function_calls, text, args.min_time)
+            if case in too_slow:
+                print(f"{case:<16}{size:>10}{'skipped':>14}{scanner * 1e6:>14.1f}{'-':>10}")
+                continue
+            regex = measure(regex_parse_function_call, text, args.min_time)
+            if regex > args.max_regex_time:
+                too_slow.add(case)
+            print(
+                f"{case:<16}{size:>10}{regex * 1e6:>14.1f}{scanner * 1e6:>14.1f}"
+                f"{regex / scanner:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
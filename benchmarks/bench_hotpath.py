@@ -0,0 +1,274 @@
+"""Micro-benchmarks of the chatbridge request/response hot path
+
+uv run benchmarks/bench_hotpath.py                  # compare with the baseline
+uv run benchmarks/bench_hotpath.py --save-baseline  # store a new baseline
+uv run benchmarks/bench_hotpath.py --json out.json --filter transcript
+
+Conversations are synthetic: every case runs over a grid of turn counts,
+tool counts and message sizes. Results are seconds per call, the best of
+--repeat rounds. Cases slower than the baseline by more than --threshold
+are reported as regressions and make the exit status 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from chatbridge.chatbridge import (
+    FAST_JSON,
+    FINISH_REASON_NULL,
+    OBJECT_CHAT_COMPLETION_CHUNK,
+    PROVIDER_CHUTES,
+    ChatResponse,
+    ChunkTemplate,
+    TranscriptBuilder,
+    build_stream_chunk,
+    build_tool_message,
+    completion_response,
+    create_normal_response,
+    create_tool_calls_response,
+    is_function_call,
+    normal_body,
+    parse_function_call,
+    parse_function_calls,
+    prepare_prompt_with_tools,
+    prepare_prompt_without_tools,
+    render_transcript,
+    tool_calls_body,
+)
+from chatbridge.encoding import orjson
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline_hotpath.json")
+TURNS = [1, 8, 64]
+TOOLS = [1, 8, 32]
+MESSAGE_SIZES = [200, 4000]
+REPLY_SIZES = [200, 20000]
+WORDS = "the quick brown fox jumps over the lazy dog while ".split()
+
+
+def text_of(size: int, seed: int = 0) -> str:
+    words = []
+    length = 0
+    index = seed
+    while length < size:
+        word = WORDS[index % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+        index += 1
+    return " ".join(words)[:size]
+
+
+def synthetic_tools(count: int) -> list:
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": f"tool_{index}",
+                "description": f"Synthetic tool number {index}",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "What to look up"},
+                        "limit": {"type": "integer", "default": 10},
+                        "mode": {"type": "string", "enum": ["fast", "full"]},
+                        "filters": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                        },
+                    },
+                    "required": ["query"],
+                },
+            },
+        }
+        for index in range(count)
+    ]
+
+
+def synthetic_request(turns: int, size: int, tools: int = 0) -> ChatResponse:
+    """System prompt followed by `turns` user/assistant exchanges, ending on a user turn"""
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": text_of(size, turn)})
+        if turn < turns - 1:
+            messages.append({"role": "assistant", "content": text_of(size, turn + 7)})
+    body = {"model": "bench-model", "messages": messages}
+    if tools:
+        body["tools"] = synthetic_tools(tools)
+    return ChatResponse.model_validate(body)
+
+
+def tool_call_reply(size: int) -> str:
+    return (
+        "FC_USE\n"
+        + text_of(size)
+        + "\n<function_call>\n<tool>tool_1</tool>\n<args>\n"
+        "<query>weather in Paris</query>\n<limit>5</limit>\n</args>\n</function_call>"
+    )
+
+
+def build_cases() -> dict:
+    """name -> zero-argument callable"""
+    cases = {}
+    for turns in TURNS:
+        for size in MESSAGE_SIZES:
+            res = synthetic_request(turns, size)
+            messages = res.messages
+            cases[f"prepare_prompt_without_tools/turns={turns},size={size}"] = (
+                lambda messages=messages: prepare_prompt_without_tools(messages)
+            )
+            cases[f"transcript_cold/turns={turns},size={size}"] = (
+                lambda messages=messages: render_transcript("", messages)
+            )
+            warm = TranscriptBuilder()
+            warm.build("", messages[:-2])
+            cases[f"transcript_cached/turns={turns},size={size}"] = (
+                lambda messages=messages, warm=warm: warm.build("", messages)
+            )
+    for tools in TOOLS:
+        res = synthetic_request(8, 200, tools)
+        cases[f"build_tool_message/tools={tools}"] = (
+            lambda tools=res.tools: build_tool_message(tools)
+        )
+        cases[f"prepare_prompt_with_tools/turns=8,tools={tools}"] = (
+            lambda res=res: prepare_prompt_with_tools(res.messages, res.tools)
+        )
+    for size in REPLY_SIZES:
+        plain = text_of(size)
+        call = tool_call_reply(size)
+        cases[f"is_function_call/plain,size={size}"] = lambda plain=plain: (
+            is_function_call(plain)
+        )
+        cases[f"parse_function_call/size={size}"] = lambda call=call: (
+            parse_function_call(call)
+        )
+        cases[f"completion_response/size={size}"] = lambda plain=plain: (
+            completion_response(normal_body("bench-model", plain))
+        )
+        cases[f"CompletionRes.model_dump_json/size={size}"] = lambda plain=plain: (
+            create_normal_response("bench-model", plain).model_dump_json()
+        )
+    calls = parse_function_calls(tool_call_reply(200))
+    cases["completion_response/tool_calls"] = lambda: completion_response(
+        tool_calls_body("bench-model", calls)
+    )
+    cases["CompletionRes.model_dump_json/tool_calls"] = lambda: (
+        create_tool_calls_response("bench-model", calls).model_dump_json()
+    )
+    template = ChunkTemplate(
+        "chatcmpl-bench",
+        PROVIDER_CHUTES,
+        "bench-model",
+        OBJECT_CHAT_COMPLETION_CHUNK,
+        1700000000,
+        FINISH_REASON_NULL,
+    )
+    cases["stream_chunk/template"] = lambda: template.content("token ")
+    cases["stream_chunk/StreamCompletionRes"] = lambda: build_stream_chunk(
+        "chatcmpl-bench", "bench-model", 1700000000, {"content": "token "}, "null"
+    )
+    return cases
+
+
+def measure(func, min_time: float, repeat: int) -> float:
+    """Best of `repeat` rounds of average seconds per call"""
+    best = None
+    for _ in range(repeat):
+        runs = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            func()
+            runs += 1
+            elapsed = time.perf_counter() - start
+        per_call = elapsed / runs
+        best = per_call if best is None else min(best, per_call)
+    return best
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "fast_json": FAST_JSON,
+        "orjson": orjson is not None,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """(name, baseline, current, ratio) of every case slower than allowed"""
+    regressions = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before and seconds / before > 1 + threshold:
+            regressions.append((name, before, seconds, seconds / before))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-time", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="only cases containing this")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed slowdown against the baseline, 0.25 = 25%%",
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored["results"]
+        if stored["environment"] != environment():
+            print(f"Baseline was measured on {stored['environment']}")
+
+    results = {}
+    print(f"{'case':<58}{'us/call':>12}{'baseline':>12}{'ratio':>8}")
+    for name, func in build_cases().items():
+        if args.filter not in name:
+            continue
+        seconds = results[name] = measure(func, args.min_time, args.repeat)
+        before = baseline.get(name)
+        if before:
+            print(
+                f"{name:<58}{seconds * 1e6:>12.2f}{before * 1e6:>12.2f}"
+                f"{seconds / before:>8.2f}"
+            )
+        else:
+            print(f"{name:<58}{seconds * 1e6:>12.2f}{'-':>12}{'-':>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+    if args.save_baseline:
+        # A filtered run only replaces the cases it measured
+        saved = {**baseline, **results}
+        with open(args.baseline, "w") as f:
+            json.dump({"environment": environment(), "results": saved}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, seconds, ratio in regressions:
+        print(
+            f"REGRESSION {name}: {before * 1e6:.2f} -> {seconds * 1e6:.2f} us"
+            f" ({ratio:.2f}x)"
+        )
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
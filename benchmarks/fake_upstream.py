@@ -0,0 +1,185 @@
+"""Local stand-in for an upstream chat site, for load tests
+
+uv run benchmarks/fake_upstream.py --port 9100 --token-rate 50 --ttfb 0.2 --error-rate 0.01
+
+Every reply is --tokens words (fewer if max_tokens is lower), the first after
+--ttfb seconds and the others at --token-rate tokens per second (0 sends
+them as fast as possible). Endpoints:
+  POST /v1/chat/completions  OpenAI style SSE, data: {...} lines then data: [DONE]
+  POST /ndjson               one {"delta": ...} object per line, then {"done": true}
+  WS   /graphql              graphql-transport-ws, next payloads {"data": {"chat": {"delta": ...}}}
+--error-rate of the requests fail before the first token (HTTP 500 or a
+graphql-ws error message), --drop-rate are cut off halfway through.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+
+GRAPHQL_WS_PROTOCOL = "graphql-transport-ws"
+DEFAULT_PORT = 9100
+DEFAULT_TOKENS = 64
+WORDS = "the quick brown fox jumps over the lazy dog while ".split()
+
+
+def reply_tokens(count: int):
+    for index in range(count):
+        yield WORDS[index % len(WORDS)] + " "
+
+
+async def paced_tokens(count: int, ttfb: float, token_rate: float, drop: bool):
+    """Tokens of one reply with the configured timing, raising halfway if drop"""
+    await asyncio.sleep(ttfb)
+    interval = 1 / token_rate if token_rate > 0 else 0
+    for index, token in enumerate(reply_tokens(count)):
+        if drop and index == count // 2:
+            raise ConnectionResetError("dropped by the fake upstream")
+        if index and interval:
+            await asyncio.sleep(interval)
+        yield token
+
+
+def create_app(
+    tokens: int = DEFAULT_TOKENS,
+    token_rate: float = 0,
+    ttfb: float = 0,
+    error_rate: float = 0,
+    drop_rate: float = 0,
+) -> FastAPI:
+    app = FastAPI(title="fake-upstream")
+    counts = {"requests": 0, "errors": 0, "drops": 0}
+
+    def plan(body: dict):
+        """(fail, drop, token count) of one request"""
+        counts["requests"] += 1
+        if random.random() < error_rate:
+            counts["errors"] += 1
+            return True, False, 0
+        drop = random.random() < drop_rate
+        counts["drops"] += drop
+        return False, drop, min(body.get("max_tokens") or tokens, tokens)
+
+    @app.get("/health")
+    async def health():
+        return counts
+
+    @app.post("/v1/chat/completions")
+    async def sse(request: Request):
+        fail, drop, count = plan(await request.json())
+        if fail:
+            await asyncio.sleep(ttfb)
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+
+        async def events():
+            async for token in paced_tokens(count, ttfb, token_rate, drop):
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/ndjson")
+    async def ndjson(request: Request):
+        fail, drop, count = plan(await request.json())
+        if fail:
+            await asyncio.sleep(ttfb)
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+
+        async def lines():
+            async for token in paced_tokens(count, ttfb, token_rate, drop):
+                yield json.dumps({"delta": token}) + "\n"
+            yield '{"done": true}\n'
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.websocket("/graphql")
+    async def graphql(websocket: WebSocket):
+        await websocket.accept(subprotocol=GRAPHQL_WS_PROTOCOL)
+        send_lock = asyncio.Lock()
+        operations = {}
+
+        async def send(message: dict):
+            async with send_lock:
+                await websocket.send_text(json.dumps(message))
+
+        async def run(operation_id: str, variables: dict):
+            fail, drop, count = plan(variables)
+            if fail:
+                await asyncio.sleep(ttfb)
+                await send(
+                    {
+                        "id": operation_id,
+                        "type": "error",
+                        "payload": [{"message": "injected failure"}],
+                    }
+                )
+                return
+            try:
+                async for token in paced_tokens(count, ttfb, token_rate, drop):
+                    payload = {"data": {"chat": {"delta": token}}}
+                    await send({"id": operation_id, "type": "next", "payload": payload})
+            except ConnectionResetError:
+                # Like a site restarting: every operation on the connection is lost
+                await websocket.close(code=4500)
+                return
+            await send({"id": operation_id, "type": "complete"})
+
+        try:
+            while True:
+                message = json.loads(await websocket.receive_text())
+                kind = message.get("type")
+                if kind == "connection_init":
+                    await send({"type": "connection_ack"})
+                elif kind == "ping":
+                    await send({"type": "pong"})
+                elif kind == "subscribe":
+                    operation_id = message["id"]
+                    variables = message["payload"].get("variables") or {}
+                    operations[operation_id] = asyncio.create_task(
+                        run(operation_id, variables)
+                    )
+                    operations[operation_id].add_done_callback(
+                        lambda _, operation_id=operation_id: operations.pop(
+                            operation_id, None
+                        )
+                    )
+                elif kind == "complete":
+                    task = operations.pop(message.get("id"), None)
+                    if task is not None:
+                        task.cancel()
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            for task in list(operations.values()):
+                task.cancel()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--tokens", type=int, default=DEFAULT_TOKENS)
+    parser.add_argument(
+        "--token-rate", type=float, default=0, help="tokens/s, 0 = unpaced"
+    )
+    parser.add_argument(
+        "--ttfb", type=float, default=0, help="seconds before the first token"
+    )
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--drop-rate", type=float, default=0)
+    args = parser.parse_args()
+    app = create_app(
+        args.tokens, args.token_rate, args.ttfb, args.error_rate, args.drop_rate
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""End-to-end load test of a chatbridge app against a local fake upstream
+
+uv run benchmarks/loadtest.py
+uv run benchmarks/loadtest.py --protocol graphql-ws --concurrency 1,16,128 --duration 20
+uv run benchmarks/loadtest.py --trace requests.jsonl --token-rate 30 --ttfb 0.5 --json out.json
+
+Starts benchmarks/fake_upstream.py and, for every --mode, the chatbridge app
+of benchmarks/loadtest_app.py on it. Each concurrency level runs that many
+clients sending requests back to back for --duration seconds. Requests come
+from --trace (JSON lines of recorded OpenAI chat completion bodies) or are
+synthetic. Reported per mode and level: requests per second, latency
+percentiles, time to the first content chunk of streamed replies, errors,
+and CPU use and peak RSS of the server processes (Linux only).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+SERVER = (
+    "import sys\n"
+    "from chatbridge.launcher import serve\n"
+    "serve('loadtest_app:app', host='127.0.0.1', port=int(sys.argv[1]),"
+    " workers=int(sys.argv[2]), app_dir=sys.argv[3], log_level='warning')\n"
+)
+WORDS = "the quick brown fox jumps over the lazy dog while ".split()
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+RSS_SAMPLE_INTERVAL = 0.25
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def text_of(size: int, rng: random.Random) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def synthetic_trace(
+    count: int, turns: list, size: int, stream_ratio: float, seed: int
+) -> list:
+    """Chat completion bodies with a mix of conversation lengths"""
+    rng = random.Random(seed)
+    bodies = []
+    for _ in range(count):
+        messages = [{"role": "system", "content": "You are a helpful assistant."}]
+        turn_count = rng.choice(turns)
+        for turn in range(turn_count):
+            messages.append({"role": "user", "content": text_of(size, rng)})
+            if turn < turn_count - 1:
+                messages.append({"role": "assistant", "content": text_of(size, rng)})
+        bodies.append(
+            {
+                "model": "loadtest-model",
+                "messages": messages,
+                "stream": rng.random() < stream_ratio,
+            }
+        )
+    return bodies
+
+
+def load_trace(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def process_tree(pid: int) -> list:
+    """pid and its descendants, the workers of a multi-worker server"""
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f"/proc/{parent}/task"):
+                with open(f"/proc/{parent}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def cpu_seconds(pids: list):
+    """User plus system CPU time of pids, None where /proc is unavailable"""
+    total = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/stat") as f:
+                # Fields after the command name, which may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+    except (OSError, IndexError):
+        return None
+    return total / CLOCK_TICKS
+
+
+def rss_mb(pids: list):
+    total = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1])
+    except (OSError, IndexError):
+        return None
+    return total * PAGE_SIZE / (1 << 20)
+
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def send(client: httpx.AsyncClient, url: str, body: dict, sample: dict):
+    """One request, recording its latency and for streams the first content chunk"""
+    started = time.perf_counter()
+    try:
+        if not body.get("stream"):
+            response = await client.post(url, json=body)
+            response.raise_for_status()
+            response.json()
+        else:
+            async with client.stream("POST", url, json=body) as response:
+                response.raise_for_status()
+                events = 0
+                done = False
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    events += 1
+                    # The first event only carries the assistant role
+                    if events == 2:
+                        sample["ttft"].append(time.perf_counter() - started)
+                    if line == "data: [DONE]":
+                        done = True
+                if not done:
+                    raise ConnectionError("stream ended without [DONE]")
+    except (httpx.HTTPError, ConnectionError, ValueError) as e:
+        kind = (
+            f"http_{e.response.status_code}"
+            if isinstance(e, httpx.HTTPStatusError)
+            else type(e).__name__
+        )
+        sample["errors"][kind] = sample["errors"].get(kind, 0) + 1
+        return
+    sample["latency"].append(time.perf_counter() - started)
+
+
+async def run_level(
+    url: str, bodies, concurrency: int, duration: float, timeout: float, pids: list
+):
+    """Closed loop: concurrency clients each sending the next body until duration has passed"""
+    sample = {"latency": [], "ttft": [], "errors": {}}
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    peak_rss = None
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        deadline = time.perf_counter() + duration
+
+        async def user():
+            while time.perf_counter() < deadline:
+                await send(client, url, next(bodies), sample)
+
+        async def watch_rss():
+            nonlocal peak_rss
+            while True:
+                rss = rss_mb(pids)
+                if rss is not None:
+                    peak_rss = max(peak_rss or 0, rss)
+                await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+        watcher = asyncio.create_task(watch_rss())
+        cpu_before = cpu_seconds(pids)
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        cpu_after = cpu_seconds(pids)
+        watcher.cancel()
+    latency = sample["latency"]
+    return {
+        "concurrency": concurrency,
+        "requests": len(latency),
+        "errors": sample["errors"],
+        "rps": len(latency) / elapsed,
+        "p50": percentile(latency, 0.5),
+        "p90": percentile(latency, 0.9),
+        "p99": percentile(latency, 0.99),
+        "ttft_p50": percentile(sample["ttft"], 0.5),
+        "ttft_p99": percentile(sample["ttft"], 0.99),
+        "cpu": (
+            (cpu_after - cpu_before) / elapsed
+            if cpu_before is not None and cpu_after is not None
+            else None
+        ),
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up in {timeout} seconds")
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=40)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def child_env(**variables) -> dict:
+    env = dict(os.environ, **variables)
+    paths = [os.path.join(ROOT_DIR, "src"), ROOT_DIR, env.get("PYTHONPATH", "")]
+    env["PYTHONPATH"] = os.pathsep.join(path for path in paths if path)
+    return env
+
+
+def fmt(value, scale: float = 1, digits: int = 1) -> str:
+    return "-" if value is None else f"{value * scale:.{digits}f}"
+
+
+def print_result(mode: str, result: dict):
+    errors = sum(result["errors"].values())
+    print(
+        f"{mode:<6}{result['concurrency']:>6}{result['requests']:>9}{errors:>7}"
+        f"{result['rps']:>9.1f}{fmt(result['p50'], 1000):>9}{fmt(result['p90'], 1000):>9}"
+        f"{fmt(result['p99'], 1000):>9}{fmt(result['ttft_p50'], 1000):>10}"
+        f"{fmt(result['ttft_p99'], 1000):>10}{fmt(result['cpu'], 100):>7}"
+        f"{fmt(result['peak_rss_mb']):>9}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--mode", default="sync,async", help="decorator modes to compare"
+    )
+    parser.add_argument(
+        "--protocol", default="sse", choices=["sse", "ndjson", "graphql-ws"]
+    )
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="server worker processes"
+    )
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--trace", help="JSON lines of chat completion request bodies")
+    parser.add_argument("--synthetic-turns", default="1,4,16")
+    parser.add_argument("--message-size", type=int, default=400)
+    parser.add_argument("--stream-ratio", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--tokens", type=int, default=64, help="reply length without max_tokens"
+    )
+    parser.add_argument(
+        "--token-rate", type=float, default=0, help="tokens/s, 0 = unpaced"
+    )
+    parser.add_argument("--ttfb", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--drop-rate", type=float, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument(
+        "--server-log", help="write the server output here, e.g. with errors injected"
+    )
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        turns = [int(turn) for turn in args.synthetic_turns.split(",")]
+        trace = synthetic_trace(
+            256, turns, args.message_size, args.stream_ratio, args.seed
+        )
+    levels = [int(level) for level in args.concurrency.split(",")]
+    upstream_port = free_port()
+    upstream = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(BENCHMARKS_DIR, "fake_upstream.py"),
+            f"--port={upstream_port}",
+            f"--tokens={args.tokens}",
+            f"--token-rate={args.token_rate}",
+            f"--ttfb={args.ttfb}",
+            f"--error-rate={args.error_rate}",
+            f"--drop-rate={args.drop_rate}",
+        ],
+        env=child_env(),
+    )
+    report = {"config": vars(args), "requests_in_trace": len(trace), "results": {}}
+    try:
+        upstream_url = f"http://127.0.0.1:{upstream_port}"
+        wait_ready(upstream_url + "/health", upstream)
+        print(
+            f"{'mode':<6}{'conc':>6}{'requests':>9}{'errors':>7}{'rps':>9}{'p50ms':>9}"
+            f"{'p90ms':>9}{'p99ms':>9}{'ttft50ms':>10}{'ttft99ms':>10}{'cpu%':>7}"
+            f"{'rss_mb':>9}"
+        )
+        for mode in args.mode.split(","):
+            port = free_port()
+            log = open(args.server_log, "a") if args.server_log else subprocess.DEVNULL
+            server = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-c",
+                    SERVER,
+                    str(port),
+                    str(args.workers),
+                    BENCHMARKS_DIR,
+                ],
+                env=child_env(
+                    LOADTEST_UPSTREAM=upstream_url,
+                    LOADTEST_PROTOCOL=args.protocol,
+                    LOADTEST_MODE=mode,
+                ),
+                stdout=log,
+                stderr=log if args.server_log else None,
+            )
+            try:
+                base = f"http://127.0.0.1:{port}"
+                wait_ready(base + "/metrics", server)
+                url = base + "/v1/chat/completions"
+                pids = process_tree(server.pid)
+                bodies = itertools.cycle(trace)
+                if args.warmup:
+                    asyncio.run(
+                        run_level(url, bodies, 4, args.warmup, args.timeout, pids)
+                    )
+                results = report["results"][mode] = []
+                for level in levels:
+                    result = asyncio.run(
+                        run_level(url, bodies, level, args.duration, args.timeout, pids)
+                    )
+                    results.append(result)
+                    print_result(mode, result)
+            finally:
+                stop(server)
+                if args.server_log:
+                    log.close()
+    finally:
+        stop(upstream)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""chatbridge app wired to benchmarks/fake_upstream.py, started by loadtest.py
+
+LOADTEST_UPSTREAM  base URL of the fake upstream (http://127.0.0.1:9100)
+LOADTEST_PROTOCOL  sse, ndjson or graphql-ws
+LOADTEST_MODE      sync: a blocking generator under @chatCompletions, run on
+                   the backend executor (httpx.Client, one websocket per
+                   request for graphql-ws); async: an async generator under
+                   @async_chatCompletions (pooled client, shared graphql-ws
+                   connection)
+"""
+
+import json
+import os
+
+import httpx
+from fastapi import FastAPI
+from websockets.sync.client import connect
+
+from chatbridge.chatbridge import *
+from chatbridge.graphqlws import (
+    GRAPHQL_WS_PROTOCOL,
+    GraphQLWSError,
+    get_graphql_ws_client,
+    graphql_ws_lifespan,
+)
+
+UPSTREAM = os.getenv("LOADTEST_UPSTREAM", "http://127.0.0.1:9100")
+PROTOCOL = os.getenv("LOADTEST_PROTOCOL", "sse")
+MODE = os.getenv("LOADTEST_MODE", "async")
+PATHS = {"sse": "/v1/chat/completions", "ndjson": "/ndjson"}
+GRAPHQL_WS_URL = UPSTREAM.replace("http", "ws", 1) + "/graphql"
+CHAT_SUBSCRIPTION = (
+    "subscription Chat($prompt: String!, $model: String!, $max_tokens: Int) {\n"
+    "  chat(prompt: $prompt, model: $model, max_tokens: $max_tokens) { delta }\n}"
+)
+
+
+def upstream_payload(prompt: str, res: ChatResponse) -> dict:
+    return {
+        "model": res.model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": res.max_tokens,
+        "stream": True,
+    }
+
+
+def graphql_payload(prompt: str, res: ChatResponse) -> dict:
+    return {
+        "operationName": "Chat",
+        "query": CHAT_SUBSCRIPTION,
+        "variables": {
+            "prompt": prompt,
+            "model": res.model,
+            "max_tokens": res.max_tokens,
+        },
+    }
+
+
+def line_delta(line: str):
+    """(done, delta) of one SSE or NDJSON line"""
+    if PROTOCOL == "sse":
+        if not line.startswith("data: "):
+            return False, ""
+        if line == "data: [DONE]":
+            return True, ""
+        return False, json.loads(line[6:])["choices"][0]["delta"].get("content", "")
+    if not line:
+        return False, ""
+    data = json.loads(line)
+    return data.get("done", False), data.get("delta", "")
+
+
+sync_client = httpx.Client(limits=httpx.Limits(max_connections=None), timeout=60)
+
+
+def sync_backend(prompt: str, res: ChatResponse, new_session: bool):
+    if PROTOCOL == "graphql-ws":
+        return sync_graphql_deltas(graphql_payload(prompt, res))
+    return sync_http_deltas(upstream_payload(prompt, res))
+
+
+def sync_http_deltas(payload: dict):
+    with sync_client.stream(
+        "POST", UPSTREAM + PATHS[PROTOCOL], json=payload
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            done, delta = line_delta(line)
+            if done:
+                return
+            yield delta
+    raise ConnectionError("upstream stream ended early")
+
+
+def sync_graphql_deltas(payload: dict):
+    with connect(GRAPHQL_WS_URL, subprotocols=[GRAPHQL_WS_PROTOCOL]) as ws:
+        ws.send(json.dumps({"type": "connection_init"}))
+        while json.loads(ws.recv()).get("type") != "connection_ack":
+            pass
+        ws.send(json.dumps({"id": "1", "type": "subscribe", "payload": payload}))
+        while True:
+            message = json.loads(ws.recv())
+            kind = message.get("type")
+            if kind == "next":
+                yield message["payload"]["data"]["chat"]["delta"]
+            elif kind == "complete":
+                return
+            elif kind == "error":
+                raise GraphQLWSError(message.get("payload"))
+
+
+async def async_backend(prompt: str, res: ChatResponse, new_session: bool):
+    if PROTOCOL == "graphql-ws":
+        client = get_graphql_ws_client(GRAPHQL_WS_URL)
+        async for payload in client.subscribe(graphql_payload(prompt, res)):
+            yield payload["data"]["chat"]["delta"]
+        return
+    url = UPSTREAM + PATHS[PROTOCOL]
+    async with get_http_client(url).stream(
+        "POST", url, json=upstream_payload(prompt, res)
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            done, delta = line_delta(line)
+            if done:
+                return
+            yield delta
+    raise ConnectionError("upstream stream ended early")
+
+
+if PROTOCOL == "graphql-ws":
+    lifespan = graphql_ws_lifespan()
+else:
+    lifespan = http_lifespan()
+app = FastAPI(
+    title=f"loadtest-{MODE}-{PROTOCOL}", lifespan=chatbridge_lifespan(lifespan)
+)
+app.add_api_route("/metrics", metrics_endpoint)
+if MODE == "sync":
+    app.post("/v1/chat/completions")(chatCompletions(1)(sync_backend))
+else:
+    app.post("/v1/chat/completions")(async_chatCompletions(1)(async_backend))
@@ -0,0 +1,40 @@
+from chatbridge.gateway import Gateway
+from chatbridge.launcher import serve
+
+from dotenv import load_dotenv
+import importlib
+import os
+
+
+load_dotenv()
+
+# Adapter modules and the environment variables they need at import
+ADAPTER_SETTINGS = {
+    "gpt4vnet2api": (),
+    "sophnet2api": (),
+    "tenbin2api": ("session_id",),
+    "retool2api": ("accessToken", "x_xsrf_token", "url_header"),
+}
+# Comma separated adapter modules served by this process, by default the
+# configured ones so an unconfigured adapter is never imported
+BACKENDS = os.getenv("CHATBRIDGE_BACKENDS") or ",".join(
+    name
+    for name, settings in ADAPTER_SETTINGS.items()
+    if all(os.getenv(setting) for setting in settings)
+)
+
+gateway = Gateway()
+for module_name in BACKENDS.split(","):
+    module_name = module_name.strip()
+    if module_name:
+        gateway.include(importlib.import_module(module_name).app)
+
+app = gateway.app()
+
+
+def main():
+    serve("gateway2api:app", port=10000)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,54 @@
 from chatbridge.chatbridge import *
 
-# from curl_cffi import requests
-import requests
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from datetime import datetime
-import uvicorn
+import asyncio
 import hashlib
 import os
 import json
 
 
-app = FastAPI(title="retool2api")
+app = FastAPI(
+    title="retool2api",
+    lifespan=chatbridge_lifespan(
+        http_lifespan(prewarm=["https://gpt4vnet.erweima.ai/"])
+    ),
+)
+app.add_api_route("/metrics", metrics_endpoint)
+# Public model id -> model id in the upstream URL
+MODEL_ALIASES = {
+    "gpt-4o": "gpt4o",
+    "claude-3-5-sonnet": "claude3",
+    "DeepSeek-r1": "deepseek",
+}
 
 
-def getTaskId():
+async def getTaskId():
 
     url = "http://127.0.0.1:5000/turnstile?url=https://gpt4v.net&sitekey=0x4AAAAAAATOXAtQtziH-Rwq&action=issue_execution_token"
 
-    response = requests.get(url)
+    response = await get_http_client(url).get(url)
     response.raise_for_status()
     return response.json()["task_id"]
 
 
-def getCaptcha(task_id):
+async def getCaptcha(task_id):
 
     url = f"http://127.0.0.1:5000/result?id={task_id}"
 
     while True:
         try:
-            response = requests.get(url)
+            response = await get_http_client(url).get(url)
             response.raise_for_status()
             captcha = response.json().get("value", "")
             if captcha:
                 return captcha
             else:
-                time.sleep(1)
+                await asyncio.sleep(1)
         except Exception as e:
             print(e)
-            time.sleep(1)
+            await asyncio.sleep(1)
 
 
 @app.get("/v1/models")
@@ -53,17 +63,11 @@ def get_models():
 
 
 @app.post("/v1/chat/completions")
-@chatCompletions(build_all_prompt=1)
-def chat(prompt: str, res: ChatResponse, new_session: bool):
-    if res.model == "claude-3-5-sonnet":
-        res.model = "claude3"
-    elif res.model == "gpt-4o":
-        res.model = "gpt4o"
-    elif res.model == "DeepSeek-r1":
-        res.model = "deepseek"
+@async_chatCompletions(build_all_prompt=1, aliases=MODEL_ALIASES)
+async def chat(prompt: str, res: ChatResponse, new_session: bool):
     print(prompt, res.model, new_session)
-    task_id = getTaskId()
-    captcha = getCaptcha(task_id=task_id)
+    task_id = await getTaskId()
+    captcha = await getCaptcha(task_id=task_id)
     print(captcha)
     uuid = hashlib.md5(captcha.encode()).hexdigest()
     url = f"https://gpt4vnet.erweima.ai/api/v1/chat/{res.model}/chat"
@@ -119,36 +123,45 @@ def chat(prompt: str, res: ChatResponse, new_session: bool):
         "Cookie": "",
     }
 
-    response = requests.post(
-        url,
-        data=json.dumps(payload),
-        headers=headers,
-        stream=True,
+    client = get_http_client(url)
+    request = client.build_request(
+        "POST", url, content=json.dumps(payload), headers=headers
     )
-    response.raise_for_status()
-    lines = response.iter_lines()
-    content = ""
-    for line in lines:
-        try:
-            print(f"line: {line.decode()}")
-            if "DONE" in line.decode():
+    response = await client.send(request, stream=True)
+    try:
+        response.raise_for_status()
+    except Exception as e:
+        await response.aclose()
+        return {"error": str(e)}
+    return iter_content(response, res.model)
+
+
+async def iter_content(response, model: str):
+    try:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            print(f"line: {line}")
+            if "DONE" in line:
                 print("DONE")
                 break
-            if res.model == "claude3" or res.model == "gpt4o":
-                json_line = json.loads(line.decode())
+            try:
+                json_line = json.loads(line)
+            except Exception as e:
+                print(f"Error decoding line: {e}")
+                break
+            if model == "claude3" or model == "gpt4o":
                 if json_line.get("data", {}).get("recipient", "") == "title_generation":
                     continue
-                content += json_line.get("data", {}).get("message", "")
-            elif res.model == "deepseek":
-                json_line = json.loads(line.decode())
-                content += json_line.get("data", {}).get("content", "")
-        except Exception as e:
-            return {"error": str(e)}
-    return content
+                yield json_line.get("data", {}).get("message", "")
+            elif model == "deepseek":
+                yield json_line.get("data", {}).get("content", "")
+    finally:
+        await response.aclose()
 
 
 def main():
-    uvicorn.run("gpt4vnet2api:app", host="0.0.0.0", port=10006, reload=True)
+    serve("gpt4vnet2api:app", port=10006)
 
 
 if __name__ == "__main__":
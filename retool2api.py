@@ -1,17 +1,16 @@
 from curl_cffi import requests
+from curl_cffi.requests import AsyncSession
 from chatbridge.chatbridge import *
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from bs4 import BeautifulSoup
 
 import os
-import uvicorn
 import json
-import time
 
 load_dotenv()
-app = FastAPI(title="retool2api")
-chat_id = 0
+app = FastAPI(title="retool2api", lifespan=chatbridge_lifespan())
+app.add_api_route("/metrics", metrics_endpoint)
 access_token = os.getenv("accessToken")
 x_xsrf_token = os.getenv("x_xsrf_token")
 url_header = os.getenv("url_header")
@@ -40,18 +39,18 @@ def get_agent_id():
 
 
 agent_id = get_agent_id()
+client = AsyncSession()
+log_poller = get_poller("retool")
 
 
 @app.post("/v1/chat/completions")
-@chatCompletions(1)
-def retool(prompt: str, res: ChatResponse, new_session: bool):
-    global chat_id
-    print(new_session, chat_id)
-    set_model(model=res.model)
-    if new_session:
-        chat_id = 0
-    if chat_id != 0:
-        return retool2(chat_id, prompt)
+@async_chatCompletions(1)
+async def retool(prompt: str, res: ChatResponse, new_session: bool, session: Session):
+    print(new_session, session.handle)
+    await set_model(model=res.model)
+    if session.handle is not None:
+        # Continue the thread of this conversation with the new turn only
+        return await retool2(session.handle, prompt)
     url = f"{url_header}/api/agents/{agent_id}/threads"
     print(url)
     payload = {"name": f"tool use", "timezone": "Asia/Shanghai"}
@@ -65,17 +64,18 @@ def retool(prompt: str, res: ChatResponse, new_session: bool):
         "Cookie": f"accessToken={access_token}",
     }
 
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = await client.post(url, data=json.dumps(payload), headers=headers)
     json_res = response.json()
     chat_id = json_res.get("id")
     print(f"Chat ID: {chat_id}")
     if chat_id == None:
         return {"error": f"{response.text}"}
+    session.handle = chat_id
     print(prompt)
-    return retool2(chat_id, prompt)
+    return await retool2(chat_id, prompt)
 
 
-def retool2(id, prompt: str):
+async def retool2(id, prompt: str):
     url = f"{url_header}/api/agents/{agent_id}/threads/{id}/messages"
 
     payload = {"type": "text", "text": prompt, "timezone": "Asia/Shanghai"}
@@ -90,28 +90,30 @@ def retool2(id, prompt: str):
         "Cookie": f"accessToken={access_token}",
     }
 
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = await client.post(url, data=json.dumps(payload), headers=headers)
     json_res = response.json()
     run_id = json_res.get("content", {}).get("runId")
     print(f"Run ID: {run_id}")
-    return retool3(run_id)
+    return await retool3(run_id)
 
 
-def should_continue(url, headers):
-    # 等待一段时间以确保请求完成
-    index = 0
-    while index < 10:  # 尝试十次
-        index += 1
-        print(f"Checking status... Attempt {index}")
-        time.sleep(2)
-        res = requests.get(url, headers=headers)
-        json_res = res.json()
-        if json_res.get("status") == "COMPLETED":
-            print("Log completed.")
-            return json_res
+async def should_continue(url, headers):
+    # 轮询日志直到完成, 先快后慢, 超过 deadline 放弃
+    async def check():
+        res = await client.get(url, headers=headers)
+        return res.json()
+
+    try:
+        json_res = await log_poller.poll(
+            check, lambda json_res: json_res.get("status") == "COMPLETED"
+        )
+    except TimeoutError:
+        return None
+    print("Log completed.")
+    return json_res
 
 
-def retool3(id):
+async def retool3(id):
     url = f"{url_header}/api/agents/{agent_id}/logs/{id}"
 
     headers = {
@@ -123,7 +125,7 @@ def retool3(id):
         "accept-language": "zh-CN,zh;q=0.9",
         "Cookie": f"accessToken={access_token}",
     }
-    json_res = should_continue(url, headers)
+    json_res = await should_continue(url, headers)
     if json_res == None:
         return {"error": "Log not completed or not found."}
     trace = json_res.get("trace", [])
@@ -156,7 +158,7 @@ def get_models():
     return model_ids
 
 
-def set_model(model: str):
+async def set_model(model: str):
     provider = ""
     if model.startswith("gpt-") or model.startswith("o3"):
         provider = "openAI"
@@ -291,7 +293,7 @@ def set_model(model: str):
         "Cookie": f"accessToken={access_token}",
     }
 
-    response = requests.post(
+    response = await client.post(
         url, data=json.dumps(payload), headers=headers, impersonate="chrome"
     )
 
@@ -340,7 +342,7 @@ def del_thread():
 
 
 def main():
-    uvicorn.run("retool2api:app", host="0.0.0.0", port=10001, reload=True)
+    serve("retool2api:app", port=10001)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,14 @@
-import requests
 import json
 import re
 import time
 from chatbridge.chatbridge import *
 from camoufox.async_api import AsyncCamoufox
 from fastapi import FastAPI
-import uvicorn
 import asyncio
-import httpx
 
-token_list = []
+TOKEN_NAMESPACE = "sophnet"
+# Anonymous tokens expire upstream, fetch a new one after this many seconds
+TOKEN_TTL = 3600
 
 
 async def get_token():
@@ -41,17 +40,41 @@ async def get_token():
             print("Anonymous token not found.")
 
 
-app = FastAPI(title="sophnet2api")
+async def current_token():
+    """Anonymous token shared by all workers, fetched once per TOKEN_TTL
+
+    The shared store may block on a SQLite lock, so it is used from a
+    worker thread.
+    """
+    store = get_shared_store()
+    token = await asyncio.to_thread(store.get, TOKEN_NAMESPACE, "token")
+    if token is None:
+        token = await get_token()
+        if token:
+            await asyncio.to_thread(
+                store.set, TOKEN_NAMESPACE, "token", token, TOKEN_TTL
+            )
+    return token
+
+
+async def drop_token():
+    store = get_shared_store()
+    await asyncio.to_thread(store.delete, TOKEN_NAMESPACE, "token")
+
+
+MODELS_URL = "https://sophnet.com/api/public/playground/models?projectUuid=Ar79PWUQUAhjJOja2orHs"
+app = FastAPI(
+    title="sophnet2api",
+    lifespan=chatbridge_lifespan(http_lifespan(prewarm=["https://sophnet.com/"])),
+)
+app.add_api_route("/metrics", metrics_endpoint)
 
 
 @app.get("/v1/models")
 @async_get_model_list
 async def get_models():
-    global token_list
-    if len(token_list) == 0:
-        token_list.append(await get_token())
-    token = token_list[0]
-    url = "https://sophnet.com/api/public/playground/models?projectUuid=Ar79PWUQUAhjJOja2orHs"
+    token = await current_token()
+    url = MODELS_URL
 
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
@@ -61,9 +84,8 @@ async def get_models():
         "authorization": f"Bearer anon-{token}",
     }
     try:
-        # 使用 httpx 异步请求
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
+        # 使用共享的 httpx 连接池
+        response = await get_http_client(url).get(url, headers=headers)
 
         model_list = []
         model_lists = response.json().get("result", [])
@@ -74,18 +96,15 @@ async def get_models():
         return model_list
     except Exception as e:
         print(f"An error occurred: {e}")
-        token_list.clear()
+        await drop_token()
         return {"error": str(e)}
 
 
 @app.post("/v1/chat/completions")
 @async_chatCompletions(1)
 async def chat(prompt: str, res: ChatResponse, new_session: bool):
-    global token_list
     print(prompt, res.model, new_session, res)
-    if len(token_list) == 0:
-        token_list.append(await get_token())
-    token = token_list[0]
+    token = await current_token()
     url = f"https://sophnet.com/api/open-apis/projects/Ar79PWUQUAhjJOja2orHs/chat/completions"
 
     payload = {
@@ -111,35 +130,44 @@ async def chat(prompt: str, res: ChatResponse, new_session: bool):
         "accept-language": "en-US,en;q=0.5",
         "authorization": f"Bearer anon-{token}",
     }
+    client = get_http_client(url)
     try:
-        response = requests.post(
-            url, data=json.dumps(payload), headers=headers, stream=True
+        request = client.build_request(
+            "POST", url, content=json.dumps(payload), headers=headers
         )
-        content = ""
+        response = await client.send(request, stream=True)
+    except Exception as e:
+        await drop_token()
+        return {"error": str(e)}
+    try:
         response.raise_for_status()  # Check for HTTP errors
-        for line in response.iter_lines():
-            # print(line)
-            if b"[DONE]" in line:
+    except Exception as e:
+        await response.aclose()
+        await drop_token()
+        return {"error": str(e)}
+    return iter_content(response)
+
+
+async def iter_content(response):
+    try:
+        async for line in response.aiter_lines():
+            if "[DONE]" in line:
                 print("Stream ended.")
                 break
-            # content +=
-            line = line.decode().replace("data: ", "")
+            line = line.replace("data: ", "")
             if line.strip() and not line.startswith("[DONE]"):
                 try:
                     data = json.loads(line)
                     if "choices" in data and len(data["choices"]) > 0:
-                        content += data["choices"][0]["delta"].get("content", "")
+                        yield data["choices"][0]["delta"].get("content", "")
                 except json.JSONDecodeError:
                     print(f"Error decoding JSON: {line}")
-        print(f"Response content: {content}")
-        return content
-    except Exception as e:
-        token_list.clear()
-        return {"error": str(e)}
+    finally:
+        await response.aclose()
 
 
 def main():
-    uvicorn.run("sophnet2api:app", host="0.0.0.0", port=10007, reload=True)
+    serve("sophnet2api:app", port=10007)
 
 
 if __name__ == "__main__":
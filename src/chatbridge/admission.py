@@ -0,0 +1,172 @@
+from fastapi import HTTPException
+from typing import Any, Dict
+import asyncio
+import os
+import sys
+import time
+
+from chatbridge.metrics import call_when_sent, metrics_registry
+
+
+RETRY_AFTER_SECONDS = 1
+RSS_SAMPLE_INTERVAL = 1.0
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # No procfs, fall back to the peak RSS
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class AdmissionController:
+    """Bound the in-flight and queued calls of one backend
+
+    Up to max_in_flight calls run at once and up to max_queued wait for a
+    slot. Anything beyond that, or anything arriving while the process is
+    over max_rss_mb, is rejected right away with 429 and Retry-After.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: int,
+        max_queued: int = 0,
+        queue_timeout: float = None,
+        max_rss_mb: float = None,
+        retry_after: int = RETRY_AFTER_SECONDS,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_rss_mb = max_rss_mb
+        self.retry_after = retry_after
+        self.semaphore = None
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.backend_time_total = 0.0
+        self.backend_time_max = 0.0
+        self.rss_mb = 0.0
+        self.rss_checked_at = 0.0
+
+    def reject(self, reason: str):
+        """Fail fast with 429"""
+        raise HTTPException(
+            status_code=429,
+            detail=f"{self.name} is {reason}, retry later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def memory_high(self) -> bool:
+        """Check RSS against max_rss_mb, sampled at most once per interval"""
+        if self.max_rss_mb is None:
+            return False
+        now = time.monotonic()
+        if now - self.rss_checked_at >= RSS_SAMPLE_INTERVAL:
+            self.rss_mb = current_rss_mb()
+            self.rss_checked_at = now
+        return self.rss_mb > self.max_rss_mb
+
+    async def acquire(self) -> float:
+        """Wait for a slot, returning the time spent queued"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        if self.memory_high():
+            self.shed += 1
+            self.reject("shedding load")
+        if self.in_flight >= self.max_in_flight and self.queued >= self.max_queued:
+            self.rejected += 1
+            self.reject("overloaded")
+
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            self.reject("overloaded")
+        finally:
+            self.queued -= 1
+        waited = time.perf_counter() - start
+
+        self.in_flight += 1
+        self.admitted += 1
+        self.queue_wait_total += waited
+        self.queue_wait_max = max(self.queue_wait_max, waited)
+        return waited
+
+    def release(self, started: float):
+        """Free the slot taken at `started` (perf_counter)"""
+        elapsed = time.perf_counter() - started
+        self.backend_time_total += elapsed
+        self.backend_time_max = max(self.backend_time_max, elapsed)
+        self.completed += 1
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def hold_until_sent(self, response: Any, started: float) -> Any:
+        """Release now, or once a streaming response is done sending
+
+        That includes a client disconnecting before the first chunk.
+        """
+        return call_when_sent(response, lambda: self.release(started))
+
+    def stats(self) -> dict:
+        """Admission counters, queue wait and backend time are kept apart"""
+        return {
+            "name": self.name,
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "queue_wait_avg": self.queue_wait_total / (self.admitted or 1),
+            "queue_wait_max": self.queue_wait_max,
+            "backend_time_avg": self.backend_time_total / (self.completed or 1),
+            "backend_time_max": self.backend_time_max,
+            "rss_mb": self.rss_mb,
+        }
+
+
+admission_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_admission_stats() -> Dict[str, dict]:
+    """Stats of every admission controller"""
+    return {
+        name: controller.stats() for name, controller in admission_controllers.items()
+    }
+
+
+metrics_registry.collect_stats(
+    "chatbridge_admission",
+    get_admission_stats,
+    "backend",
+    {
+        "in_flight": ("gauge", "Completions admitted and not fully sent yet"),
+        "queued": ("gauge", "Completions waiting for admission"),
+        "admitted": ("counter", "Completions admitted"),
+        "rejected": ("counter", "Completions rejected with 429, queue full"),
+        "shed": ("counter", "Completions rejected with 429, memory limit"),
+        "timed_out": ("counter", "Completions that waited too long in the queue"),
+    },
+)
@@ -1,10 +1,132 @@
 from pydantic import BaseModel, Field
-from typing import List, Union, Callable, Any
+from typing import List, Union, Callable, Any, Dict
+from fastapi import HTTPException, Request
 from fastapi.responses import StreamingResponse
+from collections import OrderedDict
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
+import hashlib
+import inspect
+import json
+import threading
 import time
 import uuid
 from prompt.prompt import TOOLCALL_PRMPT
-import re
+from chatbridge.fcparser import scan_function_calls
+from chatbridge.transcript import TranscriptBuilder, render_transcript
+from chatbridge.lazyrequest import (
+    BlobRef,
+    LazyMessages,
+    parse_lazy_request,
+    validate_request,
+)
+from chatbridge.respcache import (
+    CACHE_BYPASS,
+    CACHE_HEADER,
+    CACHE_HIT,
+    CACHE_MISS,
+    ResponseCache,
+    cache_directives,
+    cache_key,
+    get_response_cache_stats,
+    record_deltas,
+    response_caches,
+)
+from chatbridge.singleflight import SingleFlight, get_single_flight_stats, single_flights
+from chatbridge.sessions import (
+    Session,
+    SessionStore,
+    SessionTurn,
+    get_session_stats,
+    session_stores,
+    turn_prompt,
+)
+from chatbridge.sharedstore import (
+    MemoryStore,
+    SQLiteStore,
+    get_shared_store,
+    set_shared_store,
+)
+from chatbridge.launcher import serve
+from chatbridge.metrics import (
+    STAGE_PARSE,
+    STAGE_PROMPT,
+    STAGE_QUEUE,
+    STAGE_SERIALIZE,
+    STAGE_TTFT,
+    STAGE_UPSTREAM,
+    MetricsRegistry,
+    completion_in_flight,
+    completion_requests,
+    count_error,
+    metrics_endpoint,
+    metrics_registry,
+    metric_model,
+    observe_stage,
+    request_labels,
+    call_when_sent,
+    record_request,
+    time_upstream,
+)
+from chatbridge.tracing import (
+    JSONLExporter,
+    Span,
+    StdoutExporter,
+    Tracer,
+    activate,
+    configure_tracing,
+    current_span,
+    end_span,
+    start_span,
+    trace_span,
+    tracer,
+)
+from chatbridge.tokens import (
+    TokenCounter,
+    TokenUsage,
+    count_text,
+    get_token_stats,
+    load_encoding,
+    token_counter,
+)
+from chatbridge.contextbudget import (
+    ContextBudget,
+    budget_for,
+    context_budgets,
+    get_context_budget_stats,
+)
+from chatbridge.poller import Poller, get_poller, get_poller_stats
+from chatbridge.modelcache import (
+    MODEL_LIST_REFRESH_AHEAD,
+    MODEL_LIST_RETRY_AFTER,
+    MODEL_LIST_TTL,
+    ModelRegistry,
+    get_model_registry_stats,
+    model_registries,
+)
+from chatbridge.encoding import FAST_JSON, ChunkTemplate, FastJSONResponse, dumps
+from chatbridge.admission import (
+    AdmissionController,
+    admission_controllers,
+    get_admission_stats,
+)
+from chatbridge.httppool import (
+    get_http_client,
+    get_http_pool_stats,
+    http_lifespan,
+)
+from chatbridge.watchdog import (
+    current_backend,
+    enable_loop_watchdog,
+    get_loop_stall_stats,
+    loop_watchdog,
+)
+from chatbridge.executor import (
+    BACKEND_EXECUTOR_WORKERS,
+    BackendExecutor,
+    get_backend_executor,
+    get_executor_stats,
+)
 
 
 # Constant definitions
@@ -19,10 +141,14 @@ ROLE_ASSISTANT = "assistant"
 ROLE_SYSTEM = "system"
 TOOL_TYPE_FUNCTION = "function"
 PROVIDER_CHUTES = "Chutes"
-FUNCTION_CALL_PATTERN = (
-    r"<function_call>\s*<tool>(.*?)</tool>\s*<args>(.*?)</args>\s*</function_call>"
-)
-ARGS_PATTERN = r"<(\w+)>(.*?)</\1>"
+STREAM_DONE = "data: [DONE]\n\n"
+FC_USE_MARKER = "FC_USE"
+FUNCTION_CALL_OPEN = "<function_call>"
+DETECT_PENDING = "pending"
+DETECT_TEXT = "text"
+DETECT_FC_USE = "fc_use"
+DETECT_HOLD = "hold"
+TOOL_PROMPT_CACHE_SIZE = 128
 
 
 # Request body
@@ -68,6 +194,10 @@ class Messages(BaseModel):
     tool_calls: List[ToolCalls] = Field(default_factory=list)
 
 
+class StreamOptions(BaseModel):
+    include_usage: bool = False
+
+
 # Default request
 class ChatResponse(BaseModel):
     messages: List[Messages]
@@ -79,6 +209,12 @@ class ChatResponse(BaseModel):
     frequency_penalty: float = 0.0
     presence_penalty: float = 0.0
     max_tokens: int = 16384
+    stream_options: StreamOptions = None
+
+
+# Request envelope for lazy parsing, messages are validated on first access
+class ChatEnvelope(ChatResponse):
+    messages: List[dict]
 
 
 # Response body
@@ -130,49 +266,124 @@ def generate_tool_call_id() -> str:
     return f"call_0_{uuid.uuid4().hex}"
 
 
-def create_usage_dict() -> dict:
+def create_usage_dict(prompt_tokens: int = 0, completion_tokens: int = 0) -> dict:
     """Create usage statistics dictionary"""
     return {
-        "prompt_tokens": 0,
-        "completion_tokens": 0,
-        "total_tokens": 0,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
     }
 
 
-def async_get_model_list(func: Callable) -> Callable:
-    """Get model list decorator"""
+def backend_name(func: Callable) -> str:
+    """Name of a backend in registries, metric labels and traces
+
+    Qualified by its module, adapters served by one gateway often share a
+    function name.
+    """
+    return f"{func.__module__}.{func.__name__}"
+
+
+def chatbridge_lifespan(*lifespans: Callable):
+    """FastAPI lifespan of a chatbridge app, running lifespans inside it
+
+    app = FastAPI(lifespan=chatbridge_lifespan(http_lifespan(prewarm=[...])))
+
+    Startup loads the tokenizer off the event loop, so no request waits for
+    its download; without it, token counts are estimated. Shutdown stops
+    the loop watchdog's heartbeat.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await asyncio.to_thread(load_encoding)
+        try:
+            async with AsyncExitStack() as stack:
+                for inner in lifespans:
+                    await stack.enter_async_context(inner(app))
+                yield
+        finally:
+            loop_watchdog.detach()
+
+    return lifespan
 
-    async def wrapper():
-        model_ids = await func()
-        now = get_current_timestamp()
-        models = Models(
-            object=OBJECT_LIST,
-            data=[
-                Model(id=mid, object=OBJECT_MODEL, created=now, owned_by=owner)
-                for mid, owner in model_ids
-            ],
+
+class KnownModels:
+    """Model ids a backend serves, for metric labels
+
+    Its aliases and the lists of the model registries defined in the
+    backend's module, read as they are refreshed.
+    """
+
+    def __init__(self, module: str, aliases: Dict[str, str]):
+        self.prefix = module + "."
+        self.aliases = set(aliases) | set(aliases.values())
+
+    def __contains__(self, model: str) -> bool:
+        if model in self.aliases:
+            return True
+        return any(
+            model in registry.ids
+            for name, registry in model_registries.items()
+            if name.startswith(self.prefix)
         )
-        return models
 
+
+def model_list_endpoint(func: Callable, fetch: Callable, **options) -> Callable:
+    """/v1/models endpoint serving the cached list of func"""
+    name = f"{func.__module__}.{func.__qualname__}"
+    registry = model_registries[name] = ModelRegistry(name, fetch, **options)
+
+    async def wrapper(request: Request):
+        return await registry.respond(request.headers.get("if-none-match"))
+
+    wrapper.registry = registry
     return wrapper
 
 
-def get_model_list(func: Callable) -> Callable:
-    """Get model list decorator"""
+def async_get_model_list(
+    func: Callable = None,
+    *,
+    ttl: float = MODEL_LIST_TTL,
+    refresh_ahead: float = MODEL_LIST_REFRESH_AHEAD,
+    retry_after: float = MODEL_LIST_RETRY_AFTER,
+) -> Callable:
+    """Get model list decorator
+
+    The list is cached for ttl seconds and refreshed in the background
+    before it expires, see ModelRegistry. Usable bare or with options.
+    """
 
-    def wrapper():
-        model_ids = func()
-        now = get_current_timestamp()
-        models = Models(
-            object=OBJECT_LIST,
-            data=[
-                Model(id=mid, object=OBJECT_MODEL, created=now, owned_by=owner)
-                for mid, owner in model_ids
-            ],
+    def decorator(func: Callable) -> Callable:
+        return model_list_endpoint(
+            func, func, ttl=ttl, refresh_ahead=refresh_ahead, retry_after=retry_after
         )
-        return models
 
-    return wrapper
+    if func is None:
+        return decorator
+    return decorator(func)
+
+
+def get_model_list(
+    func: Callable = None,
+    *,
+    ttl: float = MODEL_LIST_TTL,
+    refresh_ahead: float = MODEL_LIST_REFRESH_AHEAD,
+    retry_after: float = MODEL_LIST_RETRY_AFTER,
+) -> Callable:
+    """Get model list decorator, the list is fetched in a worker thread"""
+
+    def decorator(func: Callable) -> Callable:
+        async def fetch():
+            return await asyncio.to_thread(func)
+
+        return model_list_endpoint(
+            func, fetch, ttl=ttl, refresh_ahead=refresh_ahead, retry_after=retry_after
+        )
+
+    if func is None:
+        return decorator
+    return decorator(func)
 
 
 def extract_message_content(message: Messages) -> str:
@@ -188,21 +399,116 @@ def is_tool_system_message(message: Messages) -> bool:
     return message.role == ROLE_SYSTEM and "Tool" in message.content
 
 
+def render_property_schema(schema: Any, required: bool = False) -> str:
+    """Render a property schema compactly, e.g. "string, required: City name" """
+    if not isinstance(schema, dict):
+        return str(schema)
+    kind = schema.get("type", "any")
+    if isinstance(kind, list):
+        kind = "|".join(str(item) for item in kind)
+    items = schema.get("items")
+    if kind == "array" and isinstance(items, dict):
+        kind = f"array of {items.get('type', 'any')}"
+
+    parts = [str(kind)]
+    if required:
+        parts.append("required")
+    if "enum" in schema:
+        parts.append("one of " + "|".join(str(item) for item in schema["enum"]))
+    if "default" in schema:
+        parts.append(f"default {json.dumps(schema['default'], ensure_ascii=False)}")
+    text = ", ".join(parts)
+    if schema.get("description"):
+        text += f": {schema['description']}"
+    nested = schema.get("properties") or (items or {}).get("properties")
+    if isinstance(nested, dict) and nested:
+        text += " " + json.dumps(nested, ensure_ascii=False, separators=(",", ":"))
+    return text
+
+
 def build_tool_message(tools: List[Tools]) -> str:
     """Build tool message"""
-    tool_message = "<function_call>\n   "
+    parts = ["<function_call>\n"]
     for tool in tools:
-        tool_message += f"<tool>{tool.function.name}</tool>\n   "
+        parts.append(f"<tool>{tool.function.name}</tool>\n<args>\n")
         arguments = tool.function.parameters.get("properties", {})
-        tool_message += f"<args>\n      "
+        required = set(tool.function.parameters.get("required", []))
         if arguments:
             for key, value in arguments.items():
-                tool_message += f"<{key}>{value}</{key}>\n"
+                parts.append(
+                    f"<{key}>{render_property_schema(value, key in required)}</{key}>\n"
+                )
         else:
-            tool_message += "<empty>no arguments</empty>\n"
-        tool_message += "   </args>\n"
-    tool_message += "</function_call>"
-    return tool_message
+            parts.append("<empty>no arguments</empty>\n")
+        parts.append("</args>\n")
+    parts.append("</function_call>")
+    return "".join(parts)
+
+
+def tools_fingerprint(tools: List[Tools]) -> str:
+    """Stable hash of a tools list"""
+    digest = hashlib.sha256()
+    for tool in tools:
+        digest.update(tool.function.name.encode())
+        digest.update(b"\0")
+        digest.update(
+            json.dumps(
+                tool.function.parameters, sort_keys=True, separators=(",", ":")
+            ).encode()
+        )
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ToolPromptCache:
+    """Bounded LRU cache of rendered tool system prompts keyed by tools fingerprint"""
+
+    def __init__(self, maxsize: int = TOOL_PROMPT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, tools: List[Tools]) -> str:
+        """Return the tools system prompt, rendering it on a miss"""
+        key = tools_fingerprint(tools)
+        with self.lock:
+            system_prompt = self.entries.get(key)
+            if system_prompt is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return system_prompt
+            self.misses += 1
+
+        system_prompt = TOOLCALL_PRMPT.replace("{TOOLS_LIST}", build_tool_message(tools))
+        with self.lock:
+            self.entries[key] = system_prompt
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return system_prompt
+
+    def stats(self) -> dict:
+        """Hit/miss counters"""
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        """Drop all entries and reset counters"""
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+tool_prompt_cache = ToolPromptCache()
+transcript_builder = TranscriptBuilder()
 
 
 def prepare_prompt_without_tools(messages: List[Messages]) -> tuple[str, bool]:
@@ -232,8 +538,7 @@ def prepare_prompt_with_tools(
 ) -> tuple[str, bool]:
     """Prepare prompt with tools"""
     is_new_session = False
-    tool_message = build_tool_message(tools)
-    system_prompt = TOOLCALL_PRMPT.replace("{TOOLS_LIST}", tool_message)
+    system_prompt = tool_prompt_cache.get(tools)
 
     last_message = messages[-1]
     prompt = extract_message_content(last_message)
@@ -258,304 +563,815 @@ def is_function_call(response: str) -> bool:
     return "FC_USE" in response
 
 
+def parse_function_calls(response: str) -> List[dict]:
+    """Parse every function call in the response"""
+    return scan_function_calls(response)
+
+
 def parse_function_call(response: str) -> dict:
     """Parse function call"""
-    match = re.search(FUNCTION_CALL_PATTERN, response, re.DOTALL)
-    if not match:
+    calls = parse_function_calls(response)
+    if not calls:
         return {}
+    return calls[0]
+
+
+class FunctionCallDetector:
+    """Incrementally classify streamed deltas as plain text or an FC_USE turn
+
+    The first line decides the turn: an FC_USE turn is buffered until the end,
+    plain text is passed through right away. If a <function_call> block shows
+    up later in a text turn, everything from the opening tag on is held back.
+    """
+
+    def __init__(self):
+        self.state = DETECT_PENDING
+        self.pending = ""
+        self.held = []
+        self.tail = ""
+        self.seen_fc_use = False
+
+    def feed(self, delta: str) -> str:
+        """Consume a delta and return the text that can be sent now"""
+        if not delta:
+            return ""
+        if self.state in (DETECT_FC_USE, DETECT_HOLD):
+            self.held.append(delta)
+            return ""
+
+        self.pending += delta
+        if self.state == DETECT_PENDING:
+            head = self.pending.lstrip()
+            if head.startswith(FC_USE_MARKER):
+                self.state = DETECT_FC_USE
+                self.seen_fc_use = True
+                self.held.append(self.pending)
+                self.pending = ""
+                return ""
+            if FC_USE_MARKER.startswith(head):
+                return ""
+            self.state = DETECT_TEXT
+        return self._drain_text()
+
+    def _drain_text(self) -> str:
+        """Release pending text that cannot be the start of a function call"""
+        text = self.pending
+        start = text.find(FUNCTION_CALL_OPEN)
+        if start != -1:
+            self.state = DETECT_HOLD
+            self.held.append(text[start:])
+            text = text[:start]
+            self.pending = ""
+        else:
+            # Keep a suffix that could still grow into "<function_call>"
+            keep = 0
+            for size in range(min(len(FUNCTION_CALL_OPEN) - 1, len(text)), 0, -1):
+                if text.endswith(FUNCTION_CALL_OPEN[:size]):
+                    keep = size
+                    break
+            self.pending = text[len(text) - keep :]
+            text = text[: len(text) - keep]
+
+        if FC_USE_MARKER in self.tail + text:
+            self.seen_fc_use = True
+        self.tail = (self.tail + text)[-len(FC_USE_MARKER) :]
+        return text
+
+    def finish(self) -> tuple[str, List[dict]]:
+        """Flush the stream, returning leftover text and the parsed function calls"""
+        held = "".join(self.held)
+        self.held = []
+        if self.seen_fc_use and held:
+            func_calls = parse_function_calls(held)
+            if func_calls:
+                self.pending = ""
+                return "", func_calls
+        text = self.pending + held
+        self.pending = ""
+        return text, []
+
+
+def tool_call_dicts(func_calls: List[dict]) -> List[dict]:
+    """Tool calls as plain dicts, shaped like ToolCalls.model_dump()"""
+    return [
+        {
+            "index": index,
+            "id": generate_tool_call_id(),
+            "type": TOOL_TYPE_FUNCTION,
+            "function": {
+                "name": func_call["function_name"],
+                "arguments": str(func_call["arguments"]),
+            },
+        }
+        for index, func_call in enumerate(func_calls)
+    ]
+
+
+def build_tool_calls(func_calls: List[dict]) -> List[ToolCalls]:
+    """Build tool calls from parsed function calls"""
+    return [ToolCalls(**tool_call) for tool_call in tool_call_dicts(func_calls)]
+
+
+def completion_body(
+    model: str, message: dict, finish_reason: str, usage: dict = None
+) -> dict:
+    """Non-streaming response body, shaped like CompletionRes.model_dump()"""
+    return {
+        "id": generate_chat_completion_id(),
+        "object": OBJECT_CHAT_COMPLETION,
+        "created": get_current_timestamp(),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": usage or create_usage_dict(),
+    }
 
-    function_name = match.group(1)
-    args_block = match.group(2)
-    arguments = re.findall(ARGS_PATTERN, args_block)
 
-    argument_set = {}
-    for arg in arguments:
-        if arg[0] == "empty":
-            argument_set = {}
-            break
-        else:
-            argument_set[arg[0]] = arg[1]
+def tool_calls_body(model: str, func_calls: List[dict], usage: dict = None) -> dict:
+    """Tool call response body"""
+    message = {
+        "content": "",
+        "role": ROLE_ASSISTANT,
+        "tool_calls": tool_call_dicts(func_calls),
+    }
+    return completion_body(model, message, FINISH_REASON_TOOL_CALLS, usage)
+
+
+def normal_body(model: str, response: str, usage: dict = None) -> dict:
+    """Normal response body"""
+    message = {"content": response, "role": ROLE_ASSISTANT, "tool_calls": []}
+    return completion_body(model, message, FINISH_REASON_STOP, usage)
 
-    return {"function_name": function_name, "arguments": argument_set}
+
+def completion_response(body: dict) -> Any:
+    """Serialize a response body, through CompletionRes when FAST_JSON is off"""
+    if FAST_JSON:
+        return FastJSONResponse(body)
+    return CompletionRes(**body)
+
+
+def create_tool_calls_response(model: str, func_calls: List[dict]) -> CompletionRes:
+    """Create tool call response with one or more calls"""
+    return CompletionRes(**tool_calls_body(model, func_calls))
 
 
 def create_tool_call_response(
     model: str, function_name: str, arguments: dict
 ) -> CompletionRes:
     """Create tool call response"""
-    toolcalls = ToolCalls(
-        index=0,
-        id=generate_tool_call_id(),
-        type=TOOL_TYPE_FUNCTION,
-        function=ToolCallFunction(name=function_name, arguments=str(arguments)),
-    )
-
-    return CompletionRes(
-        id=generate_chat_completion_id(),
-        object=OBJECT_CHAT_COMPLETION,
-        created=get_current_timestamp(),
-        model=model,
-        choices=[
-            Choice(
-                index=0,
-                message=Messages(
-                    content="", role=ROLE_ASSISTANT, tool_calls=[toolcalls]
-                ),
-                finish_reason=FINISH_REASON_TOOL_CALLS,
-            )
-        ],
-        usage=create_usage_dict(),
+    return create_tool_calls_response(
+        model, [{"function_name": function_name, "arguments": arguments}]
     )
 
 
 def create_normal_response(model: str, response: str) -> CompletionRes:
     """Create normal response"""
-    return CompletionRes(
-        id=generate_chat_completion_id(),
-        object=OBJECT_CHAT_COMPLETION,
-        created=get_current_timestamp(),
+    return CompletionRes(**normal_body(model, response))
+
+
+def build_stream_chunk(
+    completion_id: str,
+    model: str,
+    created: int,
+    delta: dict,
+    finish_reason: str = FINISH_REASON_NULL,
+) -> str:
+    """Build one SSE chunk"""
+    result = StreamCompletionRes(
+        id=completion_id,
+        provider=PROVIDER_CHUTES,
         model=model,
-        choices=[
-            Choice(
-                index=0,
-                message=Messages(content=response, role=ROLE_ASSISTANT),
-                finish_reason=FINISH_REASON_STOP,
-            )
-        ],
-        usage=create_usage_dict(),
+        object=OBJECT_CHAT_COMPLETION_CHUNK,
+        created=created,
+        choices=[ChoiceDelta(index=0, delta=delta, finish_reason=finish_reason)],
     )
+    return f"data: {result.model_dump_json()}\n\n"
 
 
-def create_stream_tool_call_response(model: str, function_name: str, arguments: dict):
-    """Create streaming tool call response"""
+class PydanticChunkEncoder:
+    """Chunk encoder going through StreamCompletionRes, used when FAST_JSON is off"""
 
-    def event_stream():
-        toolcalls = ToolCalls(
-            index=0,
-            id=generate_tool_call_id(),
-            type=TOOL_TYPE_FUNCTION,
-            function=ToolCallFunction(name=function_name, arguments=str(arguments)),
+    def __init__(self, completion_id: str, model: str, created: int):
+        self.completion_id = completion_id
+        self.model = model
+        self.created = created
+
+    def encode(self, delta: dict, finish_reason: str) -> str:
+        return build_stream_chunk(
+            self.completion_id, self.model, self.created, delta, finish_reason
         )
 
-        result = StreamCompletionRes(
-            id=generate_chat_completion_id(),
+    def content(self, text: str) -> str:
+        return self.encode({"content": text}, FINISH_REASON_NULL)
+
+    def usage(self, usage: dict) -> str:
+        body = StreamCompletionRes(
+            id=self.completion_id,
             provider=PROVIDER_CHUTES,
-            model=model,
+            model=self.model,
             object=OBJECT_CHAT_COMPLETION_CHUNK,
-            created=get_current_timestamp(),
-            choices=[
-                ChoiceDelta(
-                    index=0,
-                    delta={"tool_calls": [toolcalls.model_dump()]},
-                    finish_reason=FINISH_REASON_TOOL_CALLS,
-                )
-            ],
+            created=self.created,
+            choices=[],
+        ).model_dump()
+        body["usage"] = usage
+        return f"data: {json.dumps(body, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def create_chunk_encoder(model: str) -> Union[ChunkTemplate, PydanticChunkEncoder]:
+    """Chunk encoder of a new stream"""
+    completion_id = generate_chat_completion_id()
+    created = get_current_timestamp()
+    if FAST_JSON:
+        return ChunkTemplate(
+            completion_id,
+            PROVIDER_CHUTES,
+            model,
+            OBJECT_CHAT_COMPLETION_CHUNK,
+            created,
+            FINISH_REASON_NULL,
         )
-        yield f"data: {result.model_dump_json()}\n\n"
+    return PydanticChunkEncoder(completion_id, model, created)
+
+
+def create_stream_tool_calls_response(
+    model: str, func_calls: List[dict], usage: dict = None
+):
+    """Create streaming tool call response with one or more calls"""
+
+    def event_stream():
+        encoder = create_chunk_encoder(model)
+        yield encoder.encode(
+            {"tool_calls": tool_call_dicts(func_calls)}, FINISH_REASON_TOOL_CALLS
+        )
+        if usage is not None:
+            yield encoder.usage(usage)
+        yield STREAM_DONE
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
-def create_stream_normal_response(model: str, response: str):
-    """Create streaming normal response"""
+def create_stream_tool_call_response(model: str, function_name: str, arguments: dict):
+    """Create streaming tool call response"""
+    return create_stream_tool_calls_response(
+        model, [{"function_name": function_name, "arguments": arguments}]
+    )
 
-    def event_stream():
-        result = StreamCompletionRes(
-            id=generate_chat_completion_id(),
-            provider=PROVIDER_CHUTES,
-            model=model,
-            object=OBJECT_CHAT_COMPLETION_CHUNK,
-            created=get_current_timestamp(),
-            choices=[
-                ChoiceDelta(
-                    index=0,
-                    delta={"content": response},
-                    finish_reason=FINISH_REASON_STOP,
+
+def build_stream_tail(
+    encoder: Union[ChunkTemplate, PydanticChunkEncoder],
+    detector: FunctionCallDetector = None,
+    usage: dict = None,
+) -> list:
+    """Build the closing SSE chunks of a delta stream, usage goes in before [DONE]"""
+    chunks = []
+    if detector is not None:
+        text, func_calls = detector.finish()
+        if text:
+            chunks.append(encoder.content(text))
+        if func_calls:
+            chunks.append(
+                encoder.encode(
+                    {"tool_calls": tool_call_dicts(func_calls)},
+                    FINISH_REASON_TOOL_CALLS,
                 )
-            ],
-        )
-        yield f"data: {result.model_dump_json()}\n\n"
+            )
+            if usage is not None:
+                chunks.append(encoder.usage(usage))
+            chunks.append(STREAM_DONE)
+            return chunks
+    chunks.append(encoder.encode({}, FINISH_REASON_STOP))
+    if usage is not None:
+        chunks.append(encoder.usage(usage))
+    chunks.append(STREAM_DONE)
+    return chunks
+
+
+def create_stream_delta_response(
+    model: str,
+    deltas,
+    detect_tool_calls: bool = False,
+    usage: TokenUsage = None,
+    include_usage: bool = False,
+):
+    """Create streaming response from an async iterator of content deltas
+
+    Blocking generators reach this as async iterators driven from the
+    backend executor, see call_backend. usage counts the tokens of the
+    deltas as they stream, include_usage sends the counts in a last chunk.
+    """
+    encoder = create_chunk_encoder(model)
+    detector = FunctionCallDetector() if detect_tool_calls else None
+    labels = request_labels.get()
+
+    async def event_stream():
+        # Encoding and tool call detection time, summed over the stream
+        serialize = parse = 0.0
+        yield encoder.encode({"role": ROLE_ASSISTANT, "content": ""}, FINISH_REASON_NULL)
+        async for delta in deltas:
+            if usage is not None:
+                usage.feed(delta)
+            if detector is not None:
+                started = time.perf_counter()
+                delta = detector.feed(delta)
+                parse += time.perf_counter() - started
+            if delta:
+                started = time.perf_counter()
+                chunk = encoder.content(delta)
+                serialize += time.perf_counter() - started
+                yield chunk
+        counts = await usage.finish() if usage is not None else None
+        started = time.perf_counter()
+        tail = build_stream_tail(encoder, detector, counts if include_usage else None)
+        parse += time.perf_counter() - started
+        if labels is not None:
+            observe_stage(STAGE_SERIALIZE, serialize, labels)
+            if detector is not None:
+                observe_stage(STAGE_PARSE, parse, labels)
+        span = current_span()
+        if span is not None:
+            span.set(serialize_seconds=serialize)
+            if detector is not None:
+                span.set(parse_seconds=parse)
+        for chunk in tail:
+            yield chunk
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
-def chatCompletions(build_all_prompt: int = 0):
-    """Chat completion decorator"""
+def create_stream_normal_response(model: str, response: str, usage: dict = None):
+    """Create streaming normal response, usage adds the include_usage chunk"""
 
-    def decorator(func: Callable) -> Callable:
-        """Decorator function"""
+    def event_stream():
+        encoder = create_chunk_encoder(model)
+        yield encoder.encode({"role": ROLE_ASSISTANT, "content": ""}, FINISH_REASON_NULL)
+        if response:
+            yield encoder.content(response)
+        yield from build_stream_tail(encoder, usage=usage)
 
-        def wrapper(res: ChatResponse):
-            model = res.model
-            messages = res.messages
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
-            # Prepare prompt and session state
-            if not res.tools:
-                prompt, is_new_session = prepare_prompt_without_tools(messages)
-            else:
-                prompt, is_new_session, tools_system_prompt = prepare_prompt_with_tools(
-                    messages, res.tools
-                )
 
-            # For 2api websites, sometimes continuous conversation is not supported, so all messages need to be concatenated into one prompt
-            if build_all_prompt:
-                is_new_session = True
-                if res.tools:
-                    prompt = tools_system_prompt
-                else:
-                    prompt = ""
-                for msg in messages:
-                    role = msg.role
-                    content = msg.content
-                    if isinstance(content, list):
-                        # Simple handling of multimodal content, only extract text parts
-                        content = " ".join(
-                            [
-                                item.get("text", "")
-                                for item in content
-                                if item.get("type") == "text"
-                            ]
-                        )
-
-                    # Add to prompt
-                    if role == "system":
-                        # System messages as prefix for Human messages
-                        prompt += f"\n\nHuman: <system>{content}</system>"
-                    elif role == "user":
-                        prompt += f"\n\nHuman: {content}"
-                    elif role == "assistant" and not msg.tool_calls:
-                        prompt += f"\n\nAssistant: {content}"
-                    elif role == "assistant" and msg.tool_calls:
-                        prompt += f"\n\nAssistant: 正在调用: {msg.tool_calls[0].function.name}({msg.tool_calls[0].function.arguments})"
-                    elif role == "tool":
-                        # Tool messages as prefix for Tool messages
-                        prompt += f"\n\nTool: <tool>{content}</tool>"
-                        # prompt += f"\n\nTool: {content}"
-
-            # Get model response
-            response = func(prompt, new_session=is_new_session, res=res)
-            if response is None:
-                return {"error": "No response from model"}
-
-            # Check if it's a function call
-            if is_function_call(response):
-                # Parse function call
-                func_call_data = parse_function_call(response)
-                if func_call_data:
-                    if res.stream:
-                        # Streaming function call response
-                        return create_stream_tool_call_response(
-                            model,
-                            func_call_data["function_name"],
-                            func_call_data["arguments"],
-                        )
-                    else:
-                        # Non-streaming function call response
-                        return create_tool_call_response(
-                            model,
-                            func_call_data["function_name"],
-                            func_call_data["arguments"],
-                        )
-
-            # Normal response
-            if res.stream:
-                # Streaming normal response
-                return create_stream_normal_response(model, response)
-            else:
-                # Non-streaming normal response
-                return create_normal_response(model, response)
+def is_delta_stream(response: Any) -> bool:
+    """Check if the backend returned a generator of content deltas"""
+    return inspect.isgenerator(response) or inspect.isasyncgen(response)
+
+
+async def async_collect_deltas(deltas) -> str:
+    """Join an async iterator of content deltas into the full response"""
+    return "".join([delta async for delta in deltas if delta])
+
+
+async def call_backend(
+    func: Callable,
+    executor: BackendExecutor,
+    prompt: str,
+    is_new_session: bool,
+    res: ChatResponse,
+    session: Session = None,
+) -> Any:
+    """Call a sync or async backend, sync work runs on the backend executor"""
+    kwargs = {"new_session": is_new_session, "res": res}
+    if session is not None:
+        kwargs["session"] = session
+    if inspect.isasyncgenfunction(func):
+        response = func(prompt, **kwargs)
+    elif inspect.iscoroutinefunction(func):
+        response = await func(prompt, **kwargs)
+    else:
+        response = await executor.run(func, prompt, **kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+
+    # Blocking generators are driven from the executor as well
+    if inspect.isgenerator(response):
+        response = executor.iterate(response)
+    return response
+
+
+def accepts_session(func: Callable) -> bool:
+    """Check if a backend takes a session argument"""
+    return "session" in inspect.signature(func).parameters
+
+
+def completion_key(
+    backend: str, res: ChatResponse, prompt: str, is_new_session: bool
+) -> Union[str, None]:
+    """Canonical key of a request, None when the prompt does not determine the reply"""
+    if not is_new_session:
+        # Continues a conversation held upstream
+        return None
+    return cache_key(
+        backend=backend,
+        model=res.model,
+        prompt=prompt,
+        tools=tools_fingerprint(res.tools) if res.tools else "",
+        temperature=res.temperature,
+        top_p=res.top_p,
+        frequency_penalty=res.frequency_penalty,
+        presence_penalty=res.presence_penalty,
+        max_tokens=res.max_tokens,
+    )
 
-        return wrapper
 
-    return decorator
+def mark_cache_status(response: Any, status: str) -> Any:
+    """Report the response cache status in a response header, if there is a cache"""
+    headers = getattr(response, "headers", None)
+    if status is not None and headers is not None:
+        headers[CACHE_HEADER] = status
+    return response
+
+
+async def run_completion(
+    func: Callable,
+    executor: BackendExecutor,
+    res: ChatResponse,
+    build_all_prompt: int = 0,
+    response_cache: ResponseCache = None,
+    cache_lookup: bool = True,
+    cache_store: bool = True,
+    single_flight: SingleFlight = None,
+    sessions: SessionStore = None,
+    aliases: Dict[str, str] = None,
+    context_budget: Union[ContextBudget, Dict[str, ContextBudget]] = None,
+):
+    """Completion pipeline shared by chatCompletions and async_chatCompletions"""
+    messages = res.messages
+    # Responses keep the model id the client asked for, the backend sees the upstream id
+    model = res.model
+    if aliases:
+        res.model = aliases.get(model, model)
+    started = time.perf_counter()
+    span = start_span("prompt", tools=len(res.tools or ()))
+
+    # Prepare prompt and session state
+    if not res.tools:
+        prompt, is_new_session = prepare_prompt_without_tools(messages)
+    else:
+        prompt, is_new_session, tools_system_prompt = prepare_prompt_with_tools(
+            messages, res.tools
+        )
 
+    # For 2api websites, sometimes continuous conversation is not supported, so all messages need to be concatenated into one prompt
+    if build_all_prompt:
+        is_new_session = True
+        header = tools_system_prompt if res.tools else ""
+        budget = budget_for(context_budget, res.model)
+        if budget is None:
+            prompt = render_transcript(header, messages)
+        else:
+            prompt = transcript_builder.build(header, messages, budget)
+    observe_stage(STAGE_PROMPT, time.perf_counter() - started)
+    end_span(span, chars=len(prompt))
+    # Tokens are only counted when the response reports them, after the backend
+    usage = None
+    if not res.stream or (res.stream_options and res.stream_options.include_usage):
+        usage = TokenUsage(
+            token_counter, messages, tools_system_prompt if res.tools else ""
+        )
 
-def async_chatCompletions(build_all_prompt: int = 0):
-    """Chat completion decorator"""
+    # Session backends continue the upstream conversation of earlier turns
+    turn = None
+    if sessions is not None:
+        header = f"{backend_name(func)}\n{res.model}\n{tools_system_prompt if res.tools else ''}"
+        with trace_span("session") as span:
+            turn = await sessions.begin(
+                transcript_builder.prefix_keys(header, messages), messages
+            )
+            if span is not None:
+                span.set(resumed=turn.resumed)
+        if turn.resumed:
+            prompt = turn_prompt(messages[turn.length :])
+            is_new_session = False
+
+    try:
+        response = await respond(
+            func,
+            executor,
+            res,
+            model,
+            prompt,
+            is_new_session,
+            response_cache,
+            cache_lookup,
+            cache_store,
+            single_flight,
+            turn,
+            usage,
+        )
+    except BaseException:
+        if turn is not None:
+            turn.finish(False)
+        raise
+    if turn is not None:
+        response = call_when_sent(response, lambda: turn.finish(turn.ok))
+    return response
+
+
+async def respond(
+    func: Callable,
+    executor: BackendExecutor,
+    res: ChatResponse,
+    model: str,
+    prompt: str,
+    is_new_session: bool,
+    response_cache: ResponseCache = None,
+    cache_lookup: bool = True,
+    cache_store: bool = True,
+    single_flight: SingleFlight = None,
+    turn: SessionTurn = None,
+    usage: TokenUsage = None,
+):
+    """Get the reply for a prepared prompt and build the response"""
+    session = turn.session if turn is not None else None
+    include_usage = bool(res.stream_options and res.stream_options.include_usage)
+
+    # Identical deterministic requests may be answered from the response cache
+    # or share one in-flight backend call
+    key = cached = store_key = cache_status = None
+    if response_cache is not None or single_flight is not None:
+        key = completion_key(backend_name(func), res, prompt, is_new_session)
+    if response_cache is not None:
+        cache_status = CACHE_BYPASS
+        cacheable = key is not None and response_cache.cacheable(res.temperature)
+        if cacheable and cache_lookup:
+            cached = await response_cache.get(key)
+            cache_status = CACHE_HIT if cached is not None else CACHE_MISS
+        else:
+            response_cache.bypassed += 1
+        if cacheable and cache_store:
+            store_key = key
+
+    if cached is not None:
+        response = cached
+    else:
+        # Get model response
+        started = time.perf_counter()
+        span = start_span(
+            "backend", backend=backend_name(func), new_session=is_new_session
+        )
+        coalesce = single_flight is not None and key is not None and res.temperature == 0
+        try:
+            with activate(span):
+                if coalesce:
+                    response, leader = await single_flight.join(
+                        key,
+                        lambda: call_backend(
+                            func, executor, prompt, is_new_session, res, session
+                        ),
+                    )
+                    if not leader:
+                        store_key = None
+                else:
+                    response = await call_backend(
+                        func, executor, prompt, is_new_session, res, session
+                    )
+        except BaseException as e:
+            end_span(span, e)
+            raise
+        if response is None:
+            count_error("empty")
+            end_span(span, "no response")
+            return {"error": "No response from model"}
+        if isinstance(response, dict):
+            # Backends report failures as {"error": ...}
+            count_error("backend")
+            end_span(span, response.get("error"))
+            return response
+
+        # Generator backends: stream deltas as they arrive, tool calls are detected on the fly
+        if is_delta_stream(response):
+            response = time_upstream(response, started, span)
+            if store_key is not None:
+                response = record_deltas(response_cache, store_key, response)
+            if turn is not None:
+                response = turn.track(response)
+            if res.stream:
+                return mark_cache_status(
+                    create_stream_delta_response(
+                        model,
+                        response,
+                        detect_tool_calls=bool(res.tools),
+                        usage=usage,
+                        include_usage=include_usage,
+                    ),
+                    cache_status,
+                )
+            response = await async_collect_deltas(response)
+        else:
+            elapsed = time.perf_counter() - started
+            observe_stage(STAGE_TTFT, elapsed)
+            observe_stage(STAGE_UPSTREAM, elapsed)
+            end_span(span)
+            if store_key is not None and isinstance(response, str):
+                response_cache.put(store_key, response)
+        if turn is not None:
+            turn.ok = isinstance(response, str)
+
+    # Check if it's a function call
+    func_calls = None
+    if is_function_call(response):
+        # Parse function calls
+        started = time.perf_counter()
+        func_calls = parse_function_calls(response)
+        observe_stage(STAGE_PARSE, time.perf_counter() - started)
+
+    counts = await usage.finish(response) if usage is not None else None
+    if res.stream and not include_usage:
+        counts = None
+    started = time.perf_counter()
+    span = start_span("serialize")
+    if func_calls:
+        if res.stream:
+            # Streaming function call response
+            result = create_stream_tool_calls_response(model, func_calls, counts)
+        else:
+            # Non-streaming function call response
+            result = completion_response(tool_calls_body(model, func_calls, counts))
+    elif res.stream:
+        # Streaming normal response
+        result = create_stream_normal_response(model, response, counts)
+    else:
+        # Non-streaming normal response
+        result = completion_response(normal_body(model, response, counts))
+    observe_stage(STAGE_SERIALIZE, time.perf_counter() - started)
+    end_span(span, tool_calls=len(func_calls or ()))
+    return mark_cache_status(result, cache_status)
+
+
+def chatCompletions(
+    build_all_prompt: int = 0,
+    max_workers: int = BACKEND_EXECUTOR_WORKERS,
+    max_in_flight: int = None,
+    max_queued: int = 0,
+    queue_timeout: float = None,
+    max_rss_mb: float = None,
+    lazy_parse: bool = False,
+    response_cache: ResponseCache = None,
+    coalesce: bool = False,
+    sessions: SessionStore = None,
+    aliases: Dict[str, str] = None,
+    context_budget: Union[ContextBudget, Dict[str, ContextBudget]] = None,
+):
+    """Chat completion decorator
+
+    Sync backends run on a dedicated executor of max_workers threads.
+    With max_in_flight set, at most max_in_flight calls run at once and
+    max_queued wait; the rest get 429 with Retry-After.
+    With lazy_parse, messages are validated only when read and base64
+    images stay in the raw body as BlobRef.
+    With response_cache, replies to temperature 0 requests are cached.
+    With coalesce, concurrent identical temperature 0 requests share one
+    backend call.
+    Backends taking a session argument get the upstream Session of the
+    conversation, kept in sessions (a default SessionStore if not given,
+    on the shared store when several workers run).
+    aliases maps public model ids to the ids the backend expects in
+    res.model; responses keep the public id.
+    context_budget (a ContextBudget, or one per upstream model id with "*"
+    as the default) bounds build_all_prompt transcripts.
+    """
 
     def decorator(func: Callable) -> Callable:
         """Decorator function"""
-
-        async def wrapper(res: ChatResponse):
-            model = res.model
-            messages = res.messages
-
-            # Prepare prompt and session state
-            if not res.tools:
-                prompt, is_new_session = prepare_prompt_without_tools(messages)
-            else:
-                prompt, is_new_session, tools_system_prompt = prepare_prompt_with_tools(
-                    messages, res.tools
+        name = backend_name(func)
+        executor = get_backend_executor(name, max_workers)
+        loop_watchdog.register_backend(func, name)
+        admission = None
+        if max_in_flight is not None:
+            admission = admission_controllers[name] = AdmissionController(
+                name, max_in_flight, max_queued, queue_timeout, max_rss_mb
+            )
+        if response_cache is not None:
+            response_caches[name] = response_cache
+        if isinstance(context_budget, dict):
+            for model, budget in context_budget.items():
+                context_budgets[f"{name}/{model}"] = budget
+        elif context_budget is not None:
+            context_budgets[name] = context_budget
+        session_store = None
+        if accepts_session(func):
+            session_store = sessions
+            if session_store is None:
+                store = get_shared_store()
+                session_store = SessionStore(
+                    name, shared=store if store.shared else None
                 )
+            session_stores[name] = session_store
+        single_flight = None
+        if coalesce:
+            single_flight = single_flights[name] = SingleFlight(name)
+        known_models = KnownModels(func.__module__, aliases or {})
+
+        async def complete(res: ChatResponse, request: Request):
+            lookup, store = cache_directives(request.headers if request else None)
+            return await run_completion(
+                func,
+                executor,
+                res,
+                build_all_prompt,
+                response_cache,
+                lookup,
+                store,
+                single_flight,
+                session_store,
+                aliases,
+                context_budget,
+            )
 
-            # For 2api websites, sometimes continuous conversation is not supported, so all messages need to be concatenated into one prompt
-            if build_all_prompt:
-                is_new_session = True
-                if res.tools:
-                    prompt = tools_system_prompt
+        async def admitted(res: ChatResponse, request: Request):
+            if admission is None:
+                return await complete(res, request)
+
+            with trace_span("queue"):
+                observe_stage(STAGE_QUEUE, await admission.acquire())
+            started = time.perf_counter()
+            try:
+                response = await complete(res, request)
+            except BaseException:
+                admission.release(started)
+                raise
+            return admission.hold_until_sent(response, started)
+
+        async def wrapper(res: ChatResponse, request: Request):
+            current_backend.set(name)
+            loop_watchdog.ensure_started()
+            labels = (name, metric_model(res.model, known_models))
+            request_labels.set(labels)
+            completion_requests.inc(labels + ("true" if res.stream else "false",))
+            completion_in_flight.inc(labels[:1])
+            started = time.perf_counter()
+            span = tracer.start_trace(
+                "chat.completion",
+                request.headers.get("traceparent") if request else None,
+                backend=name,
+                model=res.model,
+                stream=res.stream,
+                messages=len(res.messages),
+            )
+            try:
+                response = await admitted(res, request)
+            except BaseException as e:
+                completion_in_flight.dec(labels[:1])
+                if isinstance(e, HTTPException):
+                    count_error(f"http_{e.status_code}")
+                elif isinstance(e, asyncio.CancelledError):
+                    count_error("cancelled")
                 else:
-                    prompt = ""
-                for msg in messages:
-                    role = msg.role
-                    content = msg.content
-                    if isinstance(content, list):
-                        # Simple handling of multimodal content, only extract text parts
-                        content = " ".join(
-                            [
-                                item.get("text", "")
-                                for item in content
-                                if item.get("type") == "text"
-                            ]
-                        )
-
-                    # Add to prompt
-                    if role == "system":
-                        # System messages as prefix for Human messages
-                        prompt += f"\n\nHuman: <system>{content}</system>"
-                    elif role == "user":
-                        prompt += f"\n\nHuman: {content}"
-                    elif role == "assistant" and not msg.tool_calls:
-                        prompt += f"\n\nAssistant: {content}"
-                    elif role == "assistant" and msg.tool_calls:
-                        prompt += f"\n\nAssistant: 正在调用: {msg.tool_calls[0].function.name}({msg.tool_calls[0].function.arguments})"
-                    elif role == "tool":
-                        # Tool messages as prefix for Tool messages
-                        prompt += f"\n\nTool: <tool>{content}</tool>"
-                        # prompt += f"\n\nTool: {content}"
-
-            # Get model response
-            response = await func(prompt, new_session=is_new_session, res=res)
-            if response is None:
-                return {"error": "No response from model"}
-
-            # Check if it's a function call
-            if is_function_call(response):
-                # Parse function call
-                func_call_data = parse_function_call(response)
-                if func_call_data:
-                    if res.stream:
-                        # Streaming function call response
-                        return create_stream_tool_call_response(
-                            model,
-                            func_call_data["function_name"],
-                            func_call_data["arguments"],
-                        )
-                    else:
-                        # Non-streaming function call response
-                        return create_tool_call_response(
-                            model,
-                            func_call_data["function_name"],
-                            func_call_data["arguments"],
-                        )
-
-            # Normal response
-            if res.stream:
-                # Streaming normal response
-                return create_stream_normal_response(model, response)
-            else:
-                # Non-streaming normal response
-                return create_normal_response(model, response)
+                    count_error("exception")
+                end_span(span, e)
+                raise
+
+            def done():
+                record_request(labels, started)
+                end_span(span)
 
-        return wrapper
+            return call_when_sent(response, done)
+
+        if lazy_parse:
+
+            async def lazy_wrapper(request: Request):
+                body = await request.body()
+                res = parse_lazy_request(body, ChatEnvelope, Messages)
+                return await wrapper(res, request)
+
+            endpoint = lazy_wrapper
+        else:
+            endpoint = wrapper
+        # Read by the gateway to route requests without going through FastAPI
+        endpoint.backend = name
+        endpoint.aliases = dict(aliases or {})
+        endpoint.lazy_parse = lazy_parse
+        endpoint.complete = wrapper
+        return endpoint
 
     return decorator
+
+
+def async_chatCompletions(
+    build_all_prompt: int = 0,
+    max_workers: int = BACKEND_EXECUTOR_WORKERS,
+    max_in_flight: int = None,
+    max_queued: int = 0,
+    queue_timeout: float = None,
+    max_rss_mb: float = None,
+    lazy_parse: bool = False,
+    response_cache: ResponseCache = None,
+    coalesce: bool = False,
+    sessions: SessionStore = None,
+    aliases: Dict[str, str] = None,
+    context_budget: Union[ContextBudget, Dict[str, ContextBudget]] = None,
+):
+    """Chat completion decorator"""
+    return chatCompletions(
+        build_all_prompt,
+        max_workers,
+        max_in_flight,
+        max_queued,
+        queue_timeout,
+        max_rss_mb,
+        lazy_parse,
+        response_cache,
+        coalesce,
+        sessions,
+        aliases,
+        context_budget,
+    )
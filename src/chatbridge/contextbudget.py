@@ -0,0 +1,219 @@
+from typing import Any, Dict, List, Union
+import threading
+
+from chatbridge.metrics import metrics_registry, request_labels
+from chatbridge.tokens import token_counter
+from chatbridge.transcript import message_text, render_message, render_transcript
+
+
+CONTEXT_KEEP_RECENT = 6
+CONTEXT_MAX_TOOL_CHARS = 8000
+CONTEXT_COMPACT_CHARS = 1000
+CONTEXT_DEDUPE_MIN_CHARS = 256
+# Where a truncated text is cut: this share from its start, the rest from its end
+TRUNCATE_HEAD = 2 / 3
+ACTION_TRUNCATED = "truncated"
+ACTION_DEDUPLICATED = "deduplicated"
+ACTION_COMPACTED = "compacted"
+ACTION_DROPPED = "dropped"
+DEDUPLICATED_TOOL_OUTPUT = "[identical to a later tool result]"
+
+context_messages = metrics_registry.counter(
+    "chatbridge_context_messages",
+    "Transcript messages shortened or left out to fit the context budget,"
+    " by action: truncated, deduplicated, compacted, dropped",
+    ("backend", "model", "action"),
+)
+context_saved_chars = metrics_registry.counter(
+    "chatbridge_context_saved_chars",
+    "Characters the context budget kept out of transcripts",
+    ("backend", "model"),
+)
+
+
+def truncate_text(text: str, limit: int) -> str:
+    """Start and end of text with a note of how much was cut in between"""
+    omitted = len(text) - limit
+    head = int(limit * TRUNCATE_HEAD)
+    return (
+        f"{text[:head]}\n[... {omitted} characters omitted ...]\n"
+        f"{text[len(text) - (limit - head):]}"
+    )
+
+
+class ContextBudget:
+    """Size limit of build_all_prompt transcripts
+
+    A transcript within max_chars (or max_tokens) is sent unchanged. One over
+    the limit, or any transcript of a budget without a limit, is compacted.
+    The header (system and tool prompt) and leading system messages are
+    always kept. Of the other messages, the keep_recent most recent are kept
+    as they are, except tool results over max_tool_chars, which are cut to
+    their start and end. Older messages are compacted to compact_chars each.
+    A tool result repeated later in the conversation is replaced by a short
+    note, only the latest copy is sent. If the transcript is still larger
+    than max_chars (or max_tokens), the oldest messages are dropped; the
+    last message always stays and is counted first. A transcript still over
+    the limit, because the last message alone exceeds it, counts as
+    over_budget.
+    """
+
+    def __init__(
+        self,
+        max_chars: int = None,
+        max_tokens: int = None,
+        keep_recent: int = CONTEXT_KEEP_RECENT,
+        max_tool_chars: int = CONTEXT_MAX_TOOL_CHARS,
+        compact_chars: int = CONTEXT_COMPACT_CHARS,
+    ):
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.max_tool_chars = max_tool_chars
+        self.compact_chars = compact_chars
+        self.lock = threading.Lock()
+        self.builds = 0
+        self.within_budget = 0
+        self.over_budget = 0
+        self.actions = dict.fromkeys(
+            (ACTION_TRUNCATED, ACTION_DEDUPLICATED, ACTION_COMPACTED, ACTION_DROPPED), 0
+        )
+        self.saved_chars = 0
+
+    def size(self, text: str) -> int:
+        if self.max_tokens is None:
+            return len(text)
+        return token_counter.text_count(text)
+
+    def limit(self) -> int:
+        return self.max_tokens if self.max_tokens is not None else self.max_chars
+
+    @staticmethod
+    def shorten(text: str, limit: int, action: str):
+        """(content, action) of text cut to limit, (None, None) if that saves nothing"""
+        if len(text) <= limit:
+            return None, None
+        content = truncate_text(text, limit)
+        if len(content) >= len(text):
+            return None, None
+        return content, action
+
+    def build(self, header: str, messages: List[Any], transcript: str = None) -> str:
+        """Transcript of header and messages within the budget
+
+        transcript is their full rendering when the caller already has it,
+        e.g. from the TranscriptBuilder cache.
+        """
+        limit = self.limit()
+        if limit is not None:
+            if transcript is None:
+                transcript = render_transcript(header, messages)
+            if self.size(transcript) <= limit:
+                with self.lock:
+                    self.builds += 1
+                    self.within_budget += 1
+                return transcript
+        return self.compact(header, messages)
+
+    def compact(self, header: str, messages: List[Any]) -> str:
+        """Transcript of header and messages, shortened to fit the budget"""
+        limit = self.limit()
+        actions = dict.fromkeys(self.actions, 0)
+        saved = 0
+        lead = 0
+        while lead < len(messages) and messages[lead].role == "system":
+            lead += 1
+        parts = [header]
+        parts.extend(render_message(message) for message in messages[:lead])
+        used = sum(self.size(part) for part in parts) if limit is not None else 0
+        recent = max(lead, len(messages) - self.keep_recent)
+        seen = set()
+        kept = []
+        first = lead
+        for index in range(len(messages) - 1, lead - 1, -1):
+            message = messages[index]
+            text = message_text(message) or ""
+            content = None
+            action = None
+            if message.role == "tool" and len(text) >= CONTEXT_DEDUPE_MIN_CHARS:
+                if text in seen:
+                    content, action = DEDUPLICATED_TOOL_OUTPUT, ACTION_DEDUPLICATED
+                seen.add(text)
+            if content is None:
+                if index < recent:
+                    content, action = self.shorten(
+                        text, self.compact_chars, ACTION_COMPACTED
+                    )
+                elif message.role == "tool":
+                    content, action = self.shorten(
+                        text, self.max_tool_chars, ACTION_TRUNCATED
+                    )
+            rendered = render_message(message, content)
+            if limit is not None:
+                # The last message comes first and is always kept, older
+                # messages fill what it leaves of the budget
+                cost = self.size(rendered)
+                if index < len(messages) - 1 and used + cost > limit:
+                    first = index + 1
+                    break
+                used += cost
+            kept.append(rendered)
+            if action is not None:
+                actions[action] += 1
+                saved += len(text) - len(content)
+
+        if first > lead:
+            dropped = messages[lead:first]
+            actions[ACTION_DROPPED] = len(dropped)
+            saved += sum(len(message_text(message) or "") for message in dropped)
+            note = f"\n\n[{len(dropped)} earlier messages omitted]"
+            parts.append(note)
+            if limit is not None:
+                used += self.size(note)
+        parts.extend(reversed(kept))
+        self.record(actions, saved, limit is not None and used > limit)
+        return "".join(parts)
+
+    def record(self, actions: Dict[str, int], saved: int, over: bool):
+        with self.lock:
+            self.builds += 1
+            self.over_budget += over
+            for action, count in actions.items():
+                self.actions[action] += count
+            self.saved_chars += saved
+        labels = request_labels.get()
+        if labels is None or not saved:
+            return
+        for action, count in actions.items():
+            if count:
+                context_messages.inc((labels[0], labels[1], action), count)
+        context_saved_chars.inc(labels, saved)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "max_chars": self.max_chars,
+                "max_tokens": self.max_tokens,
+                "builds": self.builds,
+                "within_budget": self.within_budget,
+                "over_budget": self.over_budget,
+                "saved_chars": self.saved_chars,
+                **self.actions,
+            }
+
+
+context_budgets: Dict[str, ContextBudget] = {}
+
+
+def budget_for(
+    budget: Union[ContextBudget, Dict[str, ContextBudget]], model: str
+) -> ContextBudget:
+    """The budget of model, from a per-model dict with "*" as the default"""
+    if isinstance(budget, dict):
+        return budget.get(model, budget.get("*"))
+    return budget
+
+
+def get_context_budget_stats() -> Dict[str, dict]:
+    """Stats of every context budget"""
+    return {name: budget.stats() for name, budget in context_budgets.items()}
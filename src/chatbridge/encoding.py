@@ -0,0 +1,85 @@
+from fastapi.responses import JSONResponse
+from typing import Any, Dict
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Set CHATBRIDGE_FAST_JSON=0 to serialize responses through the pydantic models
+FAST_JSON = os.getenv("CHATBRIDGE_FAST_JSON", "1") not in ("", "0")
+CHUNK_TAIL = b"}]}\n\n"
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON, non-ASCII kept as is, with orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps instead of the stdlib encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ChunkTemplate:
+    """Byte template of the SSE chunks of one stream
+
+    id, provider, model, object and created are the same in every chunk of a
+    stream, so they are encoded once; each chunk only encodes its delta.
+    Produces the same JSON as StreamCompletionRes.model_dump_json().
+    """
+
+    def __init__(
+        self,
+        completion_id: str,
+        provider: str,
+        model: str,
+        object: str,
+        created: int,
+        content_finish_reason: str,
+    ):
+        self.base = b"".join(
+            [
+                b'data: {"id":',
+                dumps(completion_id),
+                b',"provider":',
+                dumps(provider),
+                b',"model":',
+                dumps(model),
+                b',"object":',
+                dumps(object),
+                b',"created":',
+                dumps(created),
+            ]
+        )
+        self.prefix = self.base + b',"choices":[{"index":0,"finish_reason":'
+        self.heads: Dict[str, bytes] = {}
+        self.content_head = self.head(content_finish_reason) + b'{"content":'
+
+    def head(self, finish_reason: str) -> bytes:
+        """Everything up to the delta, per finish_reason"""
+        head = self.heads.get(finish_reason)
+        if head is None:
+            head = self.heads[finish_reason] = (
+                self.prefix + dumps(finish_reason) + b',"delta":'
+            )
+        return head
+
+    def encode(self, delta: dict, finish_reason: str) -> bytes:
+        """One SSE chunk"""
+        return self.head(finish_reason) + dumps(delta) + CHUNK_TAIL
+
+    def content(self, text: str) -> bytes:
+        """One content delta chunk, the per-token hot path"""
+        return self.content_head + dumps(text) + b"}" + CHUNK_TAIL
+
+    def usage(self, usage: dict) -> bytes:
+        """The stream_options.include_usage chunk, no choices and the usage"""
+        return self.base + b',"choices":[],"usage":' + dumps(usage) + b"}\n\n"
@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import asyncio
+import contextvars
+import functools
+import threading
+
+from chatbridge.metrics import metrics_registry
+
+
+BACKEND_EXECUTOR_WORKERS = 16
+
+
+class BackendExecutor:
+    """Dedicated thread pool for one sync backend
+
+    Every sync backend gets its own pool instead of sharing the server's
+    default threadpool, so a backend that blocks for seconds can only
+    exhaust its own workers.
+    """
+
+    def __init__(self, name: str, max_workers: int = BACKEND_EXECUTOR_WORKERS):
+        self.name = name
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"chatbridge-{name}"
+        )
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self.peak_queued = 0
+        self.lock = threading.Lock()
+
+    def _call(self, func: Callable, args: tuple, kwargs: dict) -> Any:
+        with self.lock:
+            self.started += 1
+            self.active += 1
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func in the pool without blocking the event loop"""
+        with self.lock:
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self.submitted - self.started)
+        loop = asyncio.get_running_loop()
+        # Keep context variables (backend name, active span) in the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.pool, context.run, functools.partial(self._call, func, args, kwargs)
+        )
+
+    async def iterate(self, iterator):
+        """Drive a blocking iterator from the pool, one item per call"""
+        sentinel = object()
+        try:
+            while True:
+                item = await self.run(next, iterator, sentinel)
+                if item is sentinel:
+                    break
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await self.run(close)
+
+    def stats(self) -> dict:
+        """Queue depth and saturation of the pool"""
+        with self.lock:
+            queued = self.submitted - self.started
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": queued,
+                "peak_queued": self.peak_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "saturated": self.active >= self.max_workers,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker threads"""
+        self.pool.shutdown(wait=wait)
+
+
+backend_executors: Dict[str, BackendExecutor] = {}
+
+
+def get_backend_executor(
+    name: str, max_workers: int = BACKEND_EXECUTOR_WORKERS
+) -> BackendExecutor:
+    """Get or create the executor of a backend"""
+    executor = backend_executors.get(name)
+    if executor is None:
+        executor = backend_executors[name] = BackendExecutor(name, max_workers)
+    return executor
+
+
+def get_executor_stats() -> Dict[str, dict]:
+    """Stats of every backend executor"""
+    return {name: executor.stats() for name, executor in backend_executors.items()}
+
+
+metrics_registry.collect_stats(
+    "chatbridge_executor",
+    get_executor_stats,
+    "backend",
+    {
+        "active": ("gauge", "Backend calls running on the backend's thread pool"),
+        "queued": ("gauge", "Backend calls waiting for a thread"),
+        "completed": ("counter", "Backend calls finished on the thread pool"),
+        "failed": ("counter", "Backend calls that raised on the thread pool"),
+    },
+)
@@ -0,0 +1,150 @@
+import re
+from typing import List, Tuple, Union
+
+
+FUNCTION_CALL_TAG = "function_call"
+TOOL_TAG = "tool"
+ARGS_TAG = "args"
+EMPTY_TAG = "empty"
+CDATA_CLOSE = "]]>"
+MAX_DEPTH = 32
+# <![CDATA[, </name>, <name> or <name/>; stray "<" characters never match
+TOKEN = re.compile(r"<(?:(!\[CDATA\[)|(/?)([A-Za-z_][\w.:-]*)\s*(/?)>)")
+
+Value = Union[str, dict, list]
+
+
+class Element:
+    """Parsed element: ordered children plus the raw inner text span"""
+
+    __slots__ = ("name", "children", "parts", "start", "end")
+
+    def __init__(self, name: str, start: int):
+        self.name = name
+        self.children: List[Tuple[str, "Element"]] = []
+        self.parts: List[str] = []
+        self.start = start
+        self.end = start
+
+    def text(self) -> str:
+        """Leaf text with CDATA sections unwrapped"""
+        return "".join(self.parts)
+
+    def value(self, source: str) -> Value:
+        """Convert to a python value: str for leaves, dict for nested elements"""
+        if not self.children:
+            return self.text()
+        if self.text().strip():
+            # Mixed content, keep it verbatim
+            return source[self.start : self.end]
+        return merge_children(self.children, source)
+
+
+def merge_children(children: List[Tuple[str, Element]], source: str) -> dict:
+    """Build a dict from child elements, repeated names become lists"""
+    result = {}
+    for name, child in children:
+        value = child.value(source)
+        if name in result:
+            if not isinstance(result[name], list):
+                result[name] = [result[name]]
+            result[name].append(value)
+        else:
+            result[name] = value
+    return result
+
+
+def parse_block(text: str, name: str, pos: int) -> Tuple[Element, int]:
+    """Parse the body of <name> starting at pos in one pass
+
+    Unclosed elements are closed by the end tag of an ancestor, by the next
+    <name> (blocks do not nest) or by the end of the input, so the scan never
+    backtracks. Returns the element and the position where scanning stopped.
+    """
+    root = Element(name, pos)
+    stack = [root]
+    cursor = pos
+    length = len(text)
+    search = TOKEN.search
+    while cursor < length:
+        current = stack[-1]
+        match = search(text, cursor)
+        if not match:
+            current.parts.append(text[cursor:])
+            cursor = length
+            break
+        start, token_end = match.span()
+        if start > cursor:
+            current.parts.append(text[cursor:start])
+        cdata, slash, tag, self_closing = match.groups()
+
+        if cdata:
+            close = text.find(CDATA_CLOSE, token_end)
+            if close == -1:
+                current.parts.append(text[token_end:])
+                cursor = length
+                break
+            current.parts.append(text[token_end:close])
+            cursor = close + len(CDATA_CLOSE)
+            continue
+
+        if slash:
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth].name == tag:
+                    break
+            else:
+                # Stray end tag, keep it as text
+                current.parts.append(match.group(0))
+                cursor = token_end
+                continue
+            for element in stack[depth:]:
+                element.end = start
+            del stack[depth:]
+            cursor = token_end
+            if not stack:
+                return root, cursor
+            continue
+
+        if tag == name:
+            cursor = start
+            break
+        if len(stack) >= MAX_DEPTH:
+            current.parts.append(match.group(0))
+            cursor = token_end
+            continue
+        child = Element(tag, token_end)
+        current.children.append((tag, child))
+        if not self_closing:
+            stack.append(child)
+        cursor = token_end
+
+    for element in stack:
+        element.end = cursor
+    return root, cursor
+
+
+def scan_function_calls(text: str) -> List[dict]:
+    """Scan every <function_call> block in a single left-to-right pass"""
+    calls = []
+    open_tag = f"<{FUNCTION_CALL_TAG}>"
+    cursor = 0
+    while True:
+        start = text.find(open_tag, cursor)
+        if start == -1:
+            break
+        block, cursor = parse_block(text, FUNCTION_CALL_TAG, start + len(open_tag))
+        current = None
+        for name, child in block.children:
+            if name == TOOL_TAG:
+                current = {"function_name": child.text().strip(), "arguments": {}}
+                calls.append(current)
+            elif name == ARGS_TAG and current is not None:
+                current["arguments"] = parse_arguments(child, text)
+    return [call for call in calls if call["function_name"]]
+
+
+def parse_arguments(args: Element, source: str) -> dict:
+    """Convert an <args> element into an argument dict"""
+    if any(name == EMPTY_TAG for name, _ in args.children):
+        return {}
+    return merge_children(args.children, source)
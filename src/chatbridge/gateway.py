@@ -0,0 +1,214 @@
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Callable, Dict, List, Tuple
+import asyncio
+import inspect
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+
+from chatbridge.chatbridge import (
+    ChatEnvelope,
+    ChatResponse,
+    Messages,
+    Model,
+    ModelRegistry,
+    Models,
+    chatbridge_lifespan,
+    model_registries,
+    parse_lazy_request,
+    validate_request,
+)
+from chatbridge.metrics import metrics_endpoint
+
+
+CHAT_COMPLETIONS_PATH = "/v1/chat/completions"
+MODELS_PATH = "/v1/models"
+MODEL_INDEX_MIN_REFRESH = 30.0
+
+
+class Backend:
+    """One registered completion endpoint and its model list"""
+
+    def __init__(self, name: str, completions: Callable, models: Callable = None):
+        self.name = name
+        self.completions = completions
+        self.models = models
+        self.aliases: Dict[str, str] = getattr(completions, "aliases", {})
+        self.lazy_parse = getattr(completions, "lazy_parse", False)
+        self.model_list: List[Model] = []
+        self.routed = 0
+        self.errors = 0
+
+
+class Gateway:
+    """Serve several backends behind one /v1/chat/completions and /v1/models
+
+    Every backend contributes the ids of its model list and its aliases to
+    one index, so a request is routed by res.model with a dict lookup. A
+    model offered by several backends goes to the one registered first;
+    "backend/model" always reaches a specific backend. All backends share
+    the gateway's event loop and connection pools.
+
+    /v1/models is served by a ModelRegistry whose fetch rebuilds the index,
+    so the merged list gets the same ETag and stale-while-revalidate
+    handling as a single backend's.
+    """
+
+    def __init__(self, min_refresh: float = MODEL_INDEX_MIN_REFRESH, **registry_options):
+        self.min_refresh = min_refresh
+        self.registry = model_registries["gateway"] = ModelRegistry(
+            "gateway", self.fetch_models, **registry_options
+        )
+        self.backends: Dict[str, Backend] = {}
+        self.index: Dict[str, Tuple[Backend, str]] = {}
+        self.lifespans = []
+        self.refresh_lock = asyncio.Lock()
+        self.refreshed_at = 0.0
+        self.refreshes = 0
+        self.conflicts = 0
+        self.unknown = 0
+
+    def add(self, completions: Callable, models: Callable = None, name: str = None):
+        """Register an endpoint made with chatCompletions and its model list endpoint"""
+        if not hasattr(completions, "complete"):
+            raise ValueError(f"{completions!r} is not a chatCompletions endpoint")
+        name = name or completions.backend
+        if name in self.backends:
+            raise ValueError(f"backend {name} is already registered")
+        self.backends[name] = Backend(name, completions, models)
+
+    def include(self, app: FastAPI, name: str = None):
+        """Register the backend served by an adapter app, and run its lifespan"""
+        endpoints = {}
+        for route in app.routes:
+            if getattr(route, "path", None) in (CHAT_COMPLETIONS_PATH, MODELS_PATH):
+                endpoints[route.path] = route.endpoint
+        if CHAT_COMPLETIONS_PATH not in endpoints:
+            raise ValueError(f"{app.title} has no {CHAT_COMPLETIONS_PATH} route")
+        self.add(endpoints[CHAT_COMPLETIONS_PATH], endpoints.get(MODELS_PATH), name)
+        self.lifespans.append((app, app.router.lifespan_context))
+
+    async def list_models(self, backend: Backend) -> List[Model]:
+        registry = getattr(backend.models, "registry", None)
+        if registry is not None:
+            return Models.model_validate(await registry.get()).data
+        result = backend.models()
+        if inspect.isawaitable(result):
+            result = await result
+        if not isinstance(result, Models):
+            raise ValueError(f"unexpected model list: {result!r}")
+        return result.data
+
+    async def refresh(self):
+        """Rebuild the index from the model list of every backend
+
+        A backend whose model list fails keeps the models it had before.
+        """
+        backends = [b for b in self.backends.values() if b.models is not None]
+        results = await asyncio.gather(
+            *(self.list_models(backend) for backend in backends),
+            return_exceptions=True,
+        )
+        for backend, result in zip(backends, results):
+            if isinstance(result, Exception):
+                print(f"Model list of {backend.name} failed: {result}")
+            else:
+                backend.model_list = result
+
+        index = {}
+        conflicts = 0
+        for backend in self.backends.values():
+            model_ids = [model.id for model in backend.model_list]
+            model_ids += list(backend.aliases) + list(backend.aliases.values())
+            for model_id in model_ids:
+                index[f"{backend.name}/{model_id}"] = (backend, model_id)
+                owner = index.setdefault(model_id, (backend, model_id))[0]
+                if owner is not backend:
+                    conflicts += 1
+                    print(f"Model {model_id} of {backend.name} is served by {owner.name}")
+        self.index = index
+        self.conflicts = conflicts
+        self.refreshes += 1
+        self.refreshed_at = time.monotonic()
+
+    async def resolve(self, model: str) -> Tuple[Backend, str]:
+        """(backend, model id) for a requested model, refreshing the index on a miss"""
+        route = self.index.get(model)
+        if route is None and time.monotonic() - self.refreshed_at >= self.min_refresh:
+            async with self.refresh_lock:
+                if time.monotonic() - self.refreshed_at >= self.min_refresh:
+                    await self.registry.refresh()
+            route = self.index.get(model)
+        if route is None:
+            self.unknown += 1
+            raise HTTPException(status_code=404, detail=f"model {model} not found")
+        return route
+
+    async def chat_completions(self, request: Request):
+        body = await request.body()
+        # The envelope is enough to route, the backend parses what it needs
+        res = parse_lazy_request(body, ChatEnvelope, Messages)
+        backend, model = await self.resolve(res.model)
+        if not backend.lazy_parse:
+            res = validate_request(res, ChatResponse)
+        res.model = model
+        backend.routed += 1
+        try:
+            return await backend.completions.complete(res, request)
+        except Exception:
+            backend.errors += 1
+            raise
+
+    async def fetch_models(self) -> List[Tuple[str, str]]:
+        """(id, owned_by) of every model, after rebuilding the index"""
+        await self.refresh()
+        seen = set()
+        model_ids = []
+        for backend in self.backends.values():
+            for model in backend.model_list:
+                if model.id not in seen:
+                    seen.add(model.id)
+                    model_ids.append((model.id, model.owned_by))
+        return model_ids
+
+    async def list_all_models(self, request: Request):
+        return await self.registry.respond(request.headers.get("if-none-match"))
+
+    def lifespan(self):
+        """Lifespan running the included apps' lifespans and building the index"""
+
+        @asynccontextmanager
+        async def lifespan(app):
+            async with AsyncExitStack() as stack:
+                for included, context in self.lifespans:
+                    await stack.enter_async_context(context(included))
+                await self.registry.refresh()
+                yield
+
+        return lifespan
+
+    def app(self, **options) -> FastAPI:
+        """FastAPI app serving every registered backend"""
+        options.setdefault("title", "chatbridge gateway")
+        app = FastAPI(lifespan=chatbridge_lifespan(self.lifespan()), **options)
+        app.post(CHAT_COMPLETIONS_PATH)(self.chat_completions)
+        app.get(MODELS_PATH)(self.list_all_models)
+        app.add_api_route("/metrics", metrics_endpoint)
+        return app
+
+    def stats(self) -> dict:
+        """Index size and requests routed to each backend"""
+        return {
+            "models": len(self.index),
+            "refreshes": self.refreshes,
+            "conflicts": self.conflicts,
+            "unknown": self.unknown,
+            "backends": {
+                name: {
+                    "models": len(backend.model_list),
+                    "routed": backend.routed,
+                    "errors": backend.errors,
+                }
+                for name, backend in self.backends.items()
+            },
+        }
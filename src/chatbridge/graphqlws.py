@@ -0,0 +1,313 @@
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+import asyncio
+import json
+import time
+import uuid
+
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from chatbridge.metrics import metrics_registry
+from chatbridge.tracing import end_span, start_span
+
+
+GRAPHQL_WS_PROTOCOL = "graphql-transport-ws"
+GRAPHQL_WS_CONNECT_TIMEOUT = 10.0
+GRAPHQL_WS_CONNECT_ATTEMPTS = 5
+GRAPHQL_WS_RETRY_DELAY = 0.5
+GRAPHQL_WS_MAX_RETRY_DELAY = 8.0
+GRAPHQL_WS_RESUBSCRIBE_ATTEMPTS = 3
+MESSAGE_NEXT = "next"
+MESSAGE_ERROR = "error"
+MESSAGE_COMPLETE = "complete"
+MESSAGE_LOST = "lost"
+
+
+class GraphQLWSError(Exception):
+    """Errors reported by the server for one subscription"""
+
+    def __init__(self, errors: Any):
+        super().__init__(json.dumps(errors, ensure_ascii=False))
+        self.errors = errors
+
+
+class Subscription:
+    """One operation running over the shared connection"""
+
+    def __init__(self, payload: dict):
+        self.id = str(uuid.uuid4())
+        self.payload = payload
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.ws: ClientConnection = None
+        self.received = False
+        self.finished = False
+
+
+class GraphQLWSClient:
+    """graphql-transport-ws client multiplexing subscriptions over one connection
+
+    The connection is opened on first use and shared by every concurrent
+    subscription, each identified by its operation id. After a disconnect
+    the next subscription reconnects; subscriptions that had not received
+    anything yet are sent again on the new connection, up to
+    resubscribe_attempts times, the others fail with ConnectionError since
+    the server has dropped their state.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: Dict[str, str] = None,
+        init_payload: dict = None,
+        connect_timeout: float = GRAPHQL_WS_CONNECT_TIMEOUT,
+        connect_attempts: int = GRAPHQL_WS_CONNECT_ATTEMPTS,
+        resubscribe_attempts: int = GRAPHQL_WS_RESUBSCRIBE_ATTEMPTS,
+    ):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.init_payload = init_payload
+        self.connect_timeout = connect_timeout
+        self.connect_attempts = connect_attempts
+        self.resubscribe_attempts = resubscribe_attempts
+        self.ws: ClientConnection = None
+        self.reader: asyncio.Task = None
+        self.lock = asyncio.Lock()
+        self.closed = False
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.connects = 0
+        self.disconnects = 0
+        self.started = 0
+        self.resubscribed = 0
+        self.failed = 0
+        self.malformed = 0
+        self.peak_active = 0
+
+    async def open(self) -> ClientConnection:
+        """Connect and complete the connection_init handshake"""
+        user_agent = self.headers.get("User-Agent")
+        headers = {k: v for k, v in self.headers.items() if k != "User-Agent"}
+        ws = await connect(
+            self.url,
+            additional_headers=headers,
+            user_agent_header=user_agent,
+            subprotocols=[GRAPHQL_WS_PROTOCOL],
+            open_timeout=self.connect_timeout,
+        )
+        try:
+            init = {"type": "connection_init"}
+            if self.init_payload is not None:
+                init["payload"] = self.init_payload
+            await ws.send(json.dumps(init))
+            async with asyncio.timeout(self.connect_timeout):
+                while True:
+                    message = json.loads(await ws.recv())
+                    if message.get("type") == "connection_ack":
+                        break
+                    if message.get("type") == "ping":
+                        await ws.send(json.dumps({"type": "pong"}))
+        except BaseException:
+            await ws.close()
+            raise
+        return ws
+
+    async def connection(self) -> ClientConnection:
+        """The shared connection, reconnecting with backoff if it is gone"""
+        async with self.lock:
+            if self.ws is not None:
+                return self.ws
+            if self.closed:
+                raise ConnectionError(f"client for {self.url} is closed")
+            delay = GRAPHQL_WS_RETRY_DELAY
+            for attempt in range(1, self.connect_attempts + 1):
+                try:
+                    ws = await self.open()
+                    break
+                except (OSError, TimeoutError, InvalidHandshake, ConnectionClosed) as e:
+                    print(f"Connecting to {self.url} failed (attempt {attempt}): {e}")
+                    if attempt == self.connect_attempts:
+                        raise ConnectionError(f"cannot connect to {self.url}") from e
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, GRAPHQL_WS_MAX_RETRY_DELAY)
+            self.ws = ws
+            self.connects += 1
+            self.reader = asyncio.create_task(self.read(ws))
+            return ws
+
+    async def read(self, ws: ClientConnection):
+        """Route server messages to their subscription"""
+        try:
+            async for raw in ws:
+                try:
+                    message = json.loads(raw)
+                    kind = message.get("type")
+                except (ValueError, AttributeError) as e:
+                    # One bad frame must not take down every subscription
+                    self.malformed += 1
+                    print(f"Ignoring malformed message from {self.url}: {e}")
+                    continue
+                if kind == "ping":
+                    await ws.send(json.dumps({"type": "pong"}))
+                    continue
+                subscription = self.subscriptions.get(message.get("id"))
+                if subscription is not None and kind in (
+                    MESSAGE_NEXT,
+                    MESSAGE_ERROR,
+                    MESSAGE_COMPLETE,
+                ):
+                    subscription.queue.put_nowait((kind, message.get("payload")))
+        except ConnectionClosed:
+            pass
+        finally:
+            if self.ws is ws:
+                self.ws = None
+                self.disconnects += 1
+            for subscription in list(self.subscriptions.values()):
+                if subscription.ws is ws:
+                    subscription.queue.put_nowait((MESSAGE_LOST, None))
+
+    async def start(self, subscription: Subscription):
+        ws = await self.connection()
+        subscription.ws = ws
+        message = {
+            "id": subscription.id,
+            "type": "subscribe",
+            "payload": subscription.payload,
+        }
+        try:
+            await ws.send(json.dumps(message))
+        except ConnectionClosed:
+            # The reader reports the loss and the subscription is sent again
+            pass
+
+    async def subscribe(self, payload: dict):
+        """Run one operation, yielding the payload of every next message"""
+        subscription = Subscription(payload)
+        self.subscriptions[subscription.id] = subscription
+        self.started += 1
+        self.peak_active = max(self.peak_active, len(self.subscriptions))
+        span = start_span(
+            "graphql-ws",
+            url=self.url,
+            operation=payload.get("operationName"),
+            id=subscription.id,
+        )
+        messages = resubscribed = 0
+        error = None
+        try:
+            await self.start(subscription)
+            while True:
+                kind, data = await subscription.queue.get()
+                if kind == MESSAGE_NEXT:
+                    if not subscription.received and span is not None:
+                        span.set(first_message=time.perf_counter() - span.started)
+                    subscription.received = True
+                    messages += 1
+                    yield data
+                elif kind == MESSAGE_COMPLETE:
+                    subscription.finished = True
+                    return
+                elif kind == MESSAGE_ERROR:
+                    subscription.finished = True
+                    self.failed += 1
+                    raise GraphQLWSError(data)
+                elif subscription.received:
+                    subscription.finished = True
+                    self.failed += 1
+                    raise ConnectionError(f"connection to {self.url} lost mid-stream")
+                elif resubscribed >= self.resubscribe_attempts:
+                    subscription.finished = True
+                    self.failed += 1
+                    raise ConnectionError(
+                        f"connection to {self.url} lost {resubscribed + 1} times"
+                    )
+                else:
+                    self.resubscribed += 1
+                    resubscribed += 1
+                    await self.start(subscription)
+        except BaseException as e:
+            # GeneratorExit is the consumer stopping early, not a failure
+            if not isinstance(e, GeneratorExit):
+                error = e
+            raise
+        finally:
+            end_span(span, error, messages=messages, resubscribed=resubscribed)
+            self.subscriptions.pop(subscription.id, None)
+            ws = subscription.ws
+            if not subscription.finished and ws is not None and ws is self.ws:
+                # Tell the server to stop an operation we no longer listen to
+                try:
+                    await ws.send(
+                        json.dumps({"id": subscription.id, "type": MESSAGE_COMPLETE})
+                    )
+                except ConnectionClosed:
+                    pass
+
+    async def aclose(self):
+        """Close the connection, running subscriptions end with ConnectionError"""
+        self.closed = True
+        ws, self.ws = self.ws, None
+        if ws is not None:
+            await ws.close()
+        if self.reader is not None:
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Connection and subscription counters"""
+        return {
+            "url": self.url,
+            "connected": self.ws is not None,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "active": len(self.subscriptions),
+            "peak_active": self.peak_active,
+            "subscriptions": self.started,
+            "resubscribed": self.resubscribed,
+            "failed": self.failed,
+            "malformed": self.malformed,
+        }
+
+
+graphql_ws_clients: Dict[str, GraphQLWSClient] = {}
+
+
+def get_graphql_ws_client(url: str, **options) -> GraphQLWSClient:
+    """Shared client of a graphql-ws endpoint, created on first use"""
+    client = graphql_ws_clients.get(url)
+    if client is None:
+        client = graphql_ws_clients[url] = GraphQLWSClient(url, **options)
+    return client
+
+
+def get_graphql_ws_stats() -> Dict[str, dict]:
+    """Stats of every graphql-ws client"""
+    return {url: client.stats() for url, client in graphql_ws_clients.items()}
+
+
+metrics_registry.collect_stats(
+    "chatbridge_graphql_ws",
+    get_graphql_ws_stats,
+    "url",
+    {
+        "active": ("gauge", "Subscriptions running on the shared connection"),
+        "connects": ("counter", "graphql-ws connections opened"),
+        "disconnects": ("counter", "graphql-ws connections lost"),
+        "resubscribed": ("counter", "Subscriptions sent again after a disconnect"),
+        "failed": ("counter", "Subscriptions that ended with an error"),
+    },
+)
+
+
+def graphql_ws_lifespan():
+    """FastAPI lifespan closing the shared graphql-ws connections on shutdown"""
+
+    @asynccontextmanager
+    async def lifespan(app):
+        try:
+            yield
+        finally:
+            clients = list(graphql_ws_clients.values())
+            graphql_ws_clients.clear()
+            await asyncio.gather(*(client.aclose() for client in clients))
+
+    return lifespan
@@ -0,0 +1,214 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable
+from urllib.parse import urlsplit
+import asyncio
+import time
+
+import httpx
+
+from chatbridge.metrics import metrics_registry
+from chatbridge.tracing import Span, start_span
+
+
+HTTP_MAX_CONNECTIONS_PER_HOST = 32
+HTTP_MAX_KEEPALIVE_PER_HOST = 16
+HTTP_KEEPALIVE_EXPIRY = 60.0
+HTTP_TIMEOUT = httpx.Timeout(300.0, connect=10.0)
+
+
+def origin_of(url: str) -> str:
+    """scheme://host:port of a URL"""
+    parts = urlsplit(url if "://" in url else f"https://{url}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TracedStream(httpx.AsyncByteStream):
+    """Response body that ends the request's span once it is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, span: Span):
+        self.stream = stream
+        self.span = span
+        self.size = 0
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.size += len(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.span.end(bytes=self.size)
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Report every exchange of a traced request as an "http" span"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        span = start_span(
+            "http",
+            method=request.method,
+            url=str(request.url.copy_with(query=None)),
+        )
+        if span is None:
+            return await self.transport.handle_async_request(request)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as e:
+            span.end(e)
+            raise
+        span.set(status=response.status_code, ttfb=time.perf_counter() - span.started)
+        response.stream = TracedStream(response.stream, span)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class HTTPClientPool:
+    """Pooled keep-alive httpx clients shared by all adapters, one per upstream host
+
+    Each host gets its own client so connection limits apply per host, and a
+    slow upstream cannot use up the connections of the others.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+        max_keepalive_per_host: int = HTTP_MAX_KEEPALIVE_PER_HOST,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        http2: bool = False,
+        timeout: httpx.Timeout = HTTP_TIMEOUT,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and not http2_available():
+            print("h2 is not installed, falling back to HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.timeout = timeout
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """Client for the host of url, created on first use"""
+        origin = origin_of(url)
+        client = self.clients.get(origin)
+        if client is None or client.is_closed:
+            self.requests.setdefault(origin, 0)
+            self.errors.setdefault(origin, 0)
+
+            async def count_request(request: httpx.Request):
+                self.requests[origin] += 1
+
+            async def count_error(response: httpx.Response):
+                if response.status_code >= 500:
+                    self.errors[origin] += 1
+
+            transport = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+            client = self.clients[origin] = httpx.AsyncClient(
+                transport=TracingTransport(transport),
+                timeout=self.timeout,
+                event_hooks={"request": [count_request], "response": [count_error]},
+            )
+        return client
+
+    async def prewarm(self, urls: Iterable[str]):
+        """Open a connection to every url ahead of the first real request"""
+
+        async def warm(url: str):
+            try:
+                await self.client(url).head(url)
+            except httpx.HTTPError as e:
+                print(f"Prewarming {url} failed: {e}")
+
+        await asyncio.gather(*(warm(url) for url in urls))
+
+    async def aclose(self):
+        """Close every client and its connections"""
+        clients = list(self.clients.values())
+        self.clients.clear()
+        await asyncio.gather(*(client.aclose() for client in clients))
+
+    def stats(self) -> Dict[str, dict]:
+        """Per host request counts and open/idle connections"""
+        stats = {}
+        for origin, client in self.clients.items():
+            # httpx has no public pool introspection, read httpcore's pool if present
+            transport = getattr(getattr(client, "_transport", None), "transport", None)
+            pool = getattr(transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+            stats[origin] = {
+                "requests": self.requests.get(origin, 0),
+                "server_errors": self.errors.get(origin, 0),
+                "connections": len(connections),
+                "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+                "max_connections": self.limits.max_connections,
+                "http2": self.http2,
+            }
+        return stats
+
+
+http_pool = HTTPClientPool()
+
+
+def get_http_client(url: str) -> httpx.AsyncClient:
+    """Shared pooled client for the host of url"""
+    return http_pool.client(url)
+
+
+def get_http_pool_stats() -> Dict[str, dict]:
+    """Connection pool stats of every upstream host"""
+    return http_pool.stats()
+
+
+def http_lifespan(prewarm: Iterable[str] = (), http2: bool = False, **limits):
+    """FastAPI lifespan owning the shared HTTP pool
+
+    app = FastAPI(lifespan=http_lifespan(prewarm=["https://upstream/"]))
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        global http_pool
+        if http2 or limits:
+            await http_pool.aclose()
+            http_pool = HTTPClientPool(http2=http2, **limits)
+        await http_pool.prewarm(prewarm)
+        try:
+            yield
+        finally:
+            await http_pool.aclose()
+
+    return lifespan
+
+
+metrics_registry.collect_stats(
+    "chatbridge_http_pool",
+    get_http_pool_stats,
+    "origin",
+    {
+        "requests": ("counter", "Upstream HTTP requests per host"),
+        "server_errors": ("counter", "Upstream HTTP 5xx responses per host"),
+        "connections": ("gauge", "Open upstream connections per host"),
+        "idle_connections": ("gauge", "Idle upstream connections per host"),
+    },
+)
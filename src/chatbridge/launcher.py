@@ -0,0 +1,43 @@
+from importlib.util import find_spec
+import os
+import tempfile
+
+import uvicorn
+
+from chatbridge.sharedstore import SHARED_STORE_ENV
+
+
+WORKERS_ENV = "CHATBRIDGE_WORKERS"
+GRACEFUL_SHUTDOWN_TIMEOUT = 30
+
+
+def serve(app: str, host: str = "0.0.0.0", port: int = 8000, workers: int = None, **options):
+    """Run app ("module:app") with uvicorn
+
+    Without workers and CHATBRIDGE_WORKERS this is the development server
+    with reload. Otherwise workers processes serve the app (0 means one per
+    CPU), on uvloop and httptools when installed. Several workers share
+    sessions and state through a SQLite store (CHATBRIDGE_STORE, by default
+    a file in the temp dir), and on SIGTERM every worker stops accepting,
+    finishes running requests for up to 30 seconds and closes its pools.
+    """
+    if workers is None:
+        if os.getenv(WORKERS_ENV) is None:
+            uvicorn.run(app, host=host, port=port, reload=True, **options)
+            return
+        workers = int(os.environ[WORKERS_ENV])
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        # Inherited by the workers, so they all use one store
+        os.environ.setdefault(
+            SHARED_STORE_ENV,
+            os.path.join(tempfile.gettempdir(), f"chatbridge-{port}.db"),
+        )
+    options.setdefault("loop", "uvloop" if find_spec("uvloop") else "asyncio")
+    options.setdefault("http", "httptools" if find_spec("httptools") else "h11")
+    options.setdefault("timeout_graceful_shutdown", GRACEFUL_SHUTDOWN_TIMEOUT)
+    print(
+        f"Serving {app} on {host}:{port} with {workers} workers"
+        f" ({options['loop']}, {options['http']})"
+    )
+    uvicorn.run(app, host=host, port=port, workers=workers, **options)
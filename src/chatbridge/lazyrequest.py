@@ -0,0 +1,178 @@
+from collections.abc import Sequence
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from typing import Any, List, Tuple, Type
+import re
+
+
+BLOB_MARKER = b";base64,"
+BLOB_MIN_SIZE = 4096
+BLOB_PREFIX_MAX = 128
+BLOB_PLACEHOLDER = "\x00blob:"
+BLOB_PLACEHOLDER_JSON = b"\\u0000blob:%d"
+BLOB_PLACEHOLDER_PATTERN = re.compile(r"\x00blob:(\d+)")
+
+
+class BlobRef:
+    """A base64 data URL left in the raw request body
+
+    Holds only offsets into the body, nothing is decoded until a backend
+    asks for the value.
+    """
+
+    __slots__ = ("body", "start", "end")
+
+    def __init__(self, body: bytes, start: int, end: int):
+        self.body = body
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __bytes__(self) -> bytes:
+        return self.body[self.start : self.end]
+
+    def __str__(self) -> str:
+        return self.body[self.start : self.end].decode("ascii")
+
+    def __repr__(self) -> str:
+        return f"<BlobRef {len(self)} bytes>"
+
+
+def extract_blobs(body: bytes) -> Tuple[bytes, List[BlobRef]]:
+    """Cut large data:...;base64, strings out of a JSON body
+
+    Each one is replaced by a short placeholder string. Base64 has no quotes
+    or escapes, so the closing quote ends the span and no JSON decoding is
+    needed to find it.
+    """
+    parts, blobs = [], []
+    view = memoryview(body)
+    pos = 0
+    marker = body.find(BLOB_MARKER)
+    while marker != -1:
+        start = body.rfind(b'"', max(pos, marker - BLOB_PREFIX_MAX), marker) + 1
+        end = body.find(b'"', marker)
+        if end == -1:
+            break
+        if (
+            start
+            and body.startswith(b"data:", start)
+            and end - start >= BLOB_MIN_SIZE
+            and body.find(b"\\", start, end) == -1
+        ):
+            parts.append(view[pos:start])
+            parts.append(BLOB_PLACEHOLDER_JSON % len(blobs))
+            blobs.append(BlobRef(body, start, end))
+            pos = end
+        marker = body.find(BLOB_MARKER, end)
+    if not blobs:
+        return body, blobs
+    parts.append(view[pos:])
+    return b"".join(parts), blobs
+
+
+def restore_blobs(value: Any, blobs: List[BlobRef]) -> Any:
+    """Swap placeholders back for their BlobRef"""
+    if isinstance(value, str):
+        if value.startswith(BLOB_PLACEHOLDER):
+            match = BLOB_PLACEHOLDER_PATTERN.fullmatch(value)
+            if match:
+                return blobs[int(match.group(1))]
+        return value
+    if isinstance(value, list):
+        return [restore_blobs(item, blobs) for item in value]
+    if isinstance(value, dict):
+        return {key: restore_blobs(item, blobs) for key, item in value.items()}
+    return value
+
+
+class LazyMessages(Sequence):
+    """Messages validated one by one on first access"""
+
+    def __init__(self, raw: List[dict], model: Type[BaseModel], blobs: List[BlobRef]):
+        self.raw = raw
+        self.model = model
+        self.blobs = blobs
+        self.items: List[Any] = [None] * len(raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def materialize(self, index: int) -> Any:
+        item = self.items[index]
+        if item is None:
+            raw = self.raw[index]
+            if self.blobs:
+                raw = restore_blobs(raw, self.blobs)
+            try:
+                item = self.items[index] = self.model.model_validate(raw)
+            except ValidationError as e:
+                errors = e.errors()
+                for error in errors:
+                    error["loc"] = ("body", "messages", index) + tuple(error["loc"])
+                raise RequestValidationError(errors)
+            self.raw[index] = None
+        return item
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.materialize(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        return self.materialize(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.materialize(index)
+
+    def materialized(self) -> int:
+        """How many messages have been validated so far"""
+        return sum(1 for item in self.items if item is not None)
+
+
+def parse_lazy_request(
+    body: bytes, envelope: Type[BaseModel], message_model: Type[BaseModel]
+) -> Any:
+    """Validate the request envelope now and its messages on demand"""
+    body, blobs = extract_blobs(body)
+    try:
+        request = envelope.model_validate_json(body)
+    except ValidationError as e:
+        errors = e.errors()
+        for error in errors:
+            error["loc"] = ("body",) + tuple(error["loc"])
+        raise RequestValidationError(errors)
+    request.messages = LazyMessages(request.messages, message_model, blobs)
+    return request
+
+
+def validate_request(request: Any, model: Type[BaseModel]) -> Any:
+    """Turn a request from parse_lazy_request into a fully validated model
+
+    For callers that parsed the envelope first and then need every message,
+    so the body is not parsed again. Data URLs come back as plain strings.
+    """
+    messages = request.messages
+    blobs = [str(blob) for blob in messages.blobs]
+    raw = []
+    for index, item in enumerate(messages.items):
+        if item is not None:
+            raw.append(item)
+        elif blobs:
+            raw.append(restore_blobs(messages.raw[index], blobs))
+        else:
+            raw.append(messages.raw[index])
+    # Unset fields keep the model's defaults, which are not validated
+    fields = {name: getattr(request, name) for name in request.model_fields_set}
+    fields["messages"] = raw
+    try:
+        return model.model_validate(fields)
+    except ValidationError as e:
+        errors = e.errors()
+        for error in errors:
+            error["loc"] = ("body",) + tuple(error["loc"])
+        raise RequestValidationError(errors)
@@ -0,0 +1,372 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from fastapi.responses import Response, StreamingResponse
+from typing import Any, Callable, Dict, List, Tuple
+import time
+
+from chatbridge.tracing import Span, activate, end_span
+
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+STAGE_QUEUE = "queue"
+STAGE_PROMPT = "prompt"
+STAGE_TTFT = "ttft"
+STAGE_UPSTREAM = "upstream"
+STAGE_PARSE = "parse"
+STAGE_SERIALIZE = "serialize"
+# Model label of requests for models the backend does not list
+MODEL_OTHER = "other"
+
+# (backend, model) of the completion running in this task
+request_labels: ContextVar[Tuple[str, str]] = ContextVar(
+    "chatbridge_request_labels", default=None
+)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter per label values, updated from the event loop"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}_total{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    """Value that goes up and down per label values"""
+
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, labels: tuple, value: float):
+        self.values[labels] = value
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Histogram:
+    """Bucketed observations per label values
+
+    observe is a bisect and two additions, cheap enough for every request.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self.series.items():
+            count = 0
+            for bound, bucket in zip(self.buckets, counts):
+                count += bucket
+                le = format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            count += counts[-1]
+            le = format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            plain = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_count{plain} {count}")
+            lines.append(f"{self.name}_sum{plain} {total}")
+        return lines
+
+
+class CollectedMetric:
+    """Metric read from another module's stats when /metrics is rendered
+
+    collect returns {label values: value}. Requests pay nothing for it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Dict[tuple, float]],
+        labelnames: Tuple[str, ...] = (),
+        kind: str = "gauge",
+    ):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labelnames = labelnames
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        suffix = "_total" if self.kind == "counter" else ""
+        return [
+            f"{self.name}{suffix}{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.collect().items()
+        ]
+
+
+def stats_field(get_stats: Callable[[], Dict[str, dict]], field: str) -> Callable:
+    """Collect one field of a get_*_stats() function, labelled by its keys"""
+
+    def collect() -> Dict[tuple, float]:
+        return {(name,): float(stats[field]) for name, stats in get_stats().items()}
+
+    return collect
+
+
+class MetricsRegistry:
+    """Every metric of the process, rendered in the OpenMetrics text format"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collected(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Dict[tuple, float]],
+        labelnames: Tuple[str, ...] = (),
+        kind: str = "gauge",
+    ) -> CollectedMetric:
+        return self.register(CollectedMetric(name, help, collect, labelnames, kind))
+
+    def collect_stats(
+        self,
+        prefix: str,
+        get_stats: Callable[[], Dict[str, dict]],
+        label: str,
+        fields: Dict[str, Tuple[str, str]],
+    ):
+        """Export fields of a get_*_stats() function, {field: (kind, help)}"""
+        for field, (kind, help) in fields.items():
+            self.collected(
+                f"{prefix}_{field}", help, stats_field(get_stats, field), (label,), kind
+            )
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.extend(metric.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+completion_requests = metrics_registry.counter(
+    "chatbridge_requests", "Chat completion requests", ("backend", "model", "stream")
+)
+completion_errors = metrics_registry.counter(
+    "chatbridge_errors", "Failed chat completions", ("backend", "model", "kind")
+)
+completion_in_flight = metrics_registry.gauge(
+    "chatbridge_in_flight", "Chat completions not fully sent yet", ("backend",)
+)
+completion_seconds = metrics_registry.histogram(
+    "chatbridge_request_seconds",
+    "Time from request to the last byte of the response",
+    ("backend", "model"),
+)
+stage_seconds = metrics_registry.histogram(
+    "chatbridge_stage_seconds",
+    "Time spent per pipeline stage: queue, prompt, ttft, upstream, parse, serialize",
+    ("backend", "model", "stage"),
+)
+
+
+def metric_model(model: str, known: Any) -> str:
+    """model as a metric label, MODEL_OTHER unless it is in known
+
+    Clients pick res.model freely; labelling every value they send would
+    grow the series without bound.
+    """
+    return model if model in known else MODEL_OTHER
+
+
+def observe_stage(stage: str, seconds: float, labels: Tuple[str, str] = None):
+    """Record a stage of the completion running in this task"""
+    if labels is None:
+        labels = request_labels.get()
+    if labels is not None:
+        stage_seconds.observe((labels[0], labels[1], stage), seconds)
+
+
+def count_error(kind: str):
+    labels = request_labels.get()
+    if labels is not None:
+        completion_errors.inc((labels[0], labels[1], kind))
+
+
+async def time_upstream(deltas, started: float, span: Span = None):
+    """Pass deltas through, recording time to first token and total upstream time
+
+    span, the backend call's trace span, is active while the backend produces
+    each delta, so spans the backend starts nest under it. It ends with the
+    stream.
+    """
+    labels = request_labels.get()
+    first = True
+    chunks = 0
+    error = None
+    try:
+        while True:
+            with activate(span):
+                try:
+                    delta = await anext(deltas)
+                except StopAsyncIteration:
+                    break
+            if first and delta:
+                first = False
+                ttft = time.perf_counter() - started
+                observe_stage(STAGE_TTFT, ttft, labels)
+                if span is not None:
+                    span.set(ttft=ttft)
+            chunks += 1
+            yield delta
+    except Exception as e:
+        error = e
+        if labels is not None:
+            completion_errors.inc((labels[0], labels[1], "stream"))
+        raise
+    finally:
+        try:
+            await deltas.aclose()
+        finally:
+            end_span(span, error, chunks=chunks)
+    observe_stage(STAGE_UPSTREAM, time.perf_counter() - started, labels)
+
+
+def record_request(labels: Tuple[str, str], started: float):
+    """Record a completion that has been fully sent"""
+    completion_in_flight.dec(labels[:1])
+    completion_seconds.observe(labels, time.perf_counter() - started)
+
+
+class SentCallbacks:
+    """Mixin running sent_callbacks once the response is done sending
+
+    They run when __call__ returns or raises: after the last chunk, on a
+    failed send, on cancellation, and when the client disconnects before
+    the first chunk, in which case the body iterator never starts.
+    """
+
+    sent_callbacks: List[Callable[[], None]]
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            callbacks, self.sent_callbacks = self.sent_callbacks, []
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Callback after sending a response failed: {e!r}")
+
+
+sent_callback_classes: Dict[type, type] = {}
+
+
+def call_when_sent(response, callback: Callable[[], None]):
+    """Call callback now, or once a streaming response is done sending
+
+    Callbacks run in the order they were added.
+    """
+    if not isinstance(response, StreamingResponse):
+        callback()
+        return response
+    if not isinstance(response, SentCallbacks):
+        cls = type(response)
+        watched = sent_callback_classes.get(cls)
+        if watched is None:
+            watched = sent_callback_classes[cls] = type(
+                cls.__name__, (SentCallbacks, cls), {}
+            )
+        response.__class__ = watched
+        response.sent_callbacks = []
+    response.sent_callbacks.append(callback)
+    return response
+
+
+def metrics_endpoint() -> Response:
+    """/metrics in the OpenMetrics text format"""
+    return Response(metrics_registry.render(), media_type=OPENMETRICS_CONTENT_TYPE)
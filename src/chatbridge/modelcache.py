@@ -0,0 +1,156 @@
+from fastapi import HTTPException
+from fastapi.responses import Response
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import hashlib
+import time
+
+from chatbridge.encoding import dumps
+
+
+MODEL_LIST_TTL = 300.0
+MODEL_LIST_REFRESH_AHEAD = 0.8
+MODEL_LIST_RETRY_AFTER = 10.0
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches etag, ignoring weak prefixes"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ModelRegistry:
+    """Cached model list of a backend, served as pre-serialized JSON
+
+    The list is fetched on first use and kept for ttl seconds. Once it is
+    refresh_ahead * ttl old, a request starts a refresh in the background
+    and is still served the cached list, so clients never wait on the
+    upstream after the first fetch. A failed refresh keeps serving the
+    last good list and is retried after retry_after seconds. At most one
+    fetch runs at a time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fetch: Callable[[], Awaitable[List[Tuple[str, str]]]],
+        ttl: float = MODEL_LIST_TTL,
+        refresh_ahead: float = MODEL_LIST_REFRESH_AHEAD,
+        retry_after: float = MODEL_LIST_RETRY_AFTER,
+    ):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.retry_after = retry_after
+        self.model_ids: List[Tuple[str, str]] = None
+        self.ids: frozenset = frozenset()
+        self.data: Dict[str, Any] = None
+        self.body: bytes = None
+        self.etag: str = None
+        self.fetched_at = 0.0
+        self.failed_at: float = None
+        self.last_error: str = None
+        self.task: asyncio.Task = None
+        self.requests = 0
+        self.not_modified = 0
+        self.stale_served = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    async def refresh(self):
+        """Fetch the list, keeping the previous one if that fails"""
+        self.refreshes += 1
+        try:
+            model_ids = await self.fetch()
+            # Backends report failures as {"error": ...}
+            if not isinstance(model_ids, (list, tuple)):
+                raise ValueError(f"unexpected model list: {model_ids!r}")
+            model_ids = [(mid, owner) for mid, owner in model_ids]
+        except Exception as e:
+            self.failures += 1
+            self.failed_at = time.monotonic()
+            self.last_error = str(e)
+            print(f"Model list of {self.name} failed: {e}")
+            return
+        self.fetched_at = time.monotonic()
+        self.failed_at = None
+        if model_ids == self.model_ids:
+            # Same list, keep created and the ETag stable
+            return
+        created = int(time.time())
+        self.model_ids = model_ids
+        self.ids = frozenset(mid for mid, _ in model_ids)
+        self.data = {
+            "object": "list",
+            "data": [
+                {"id": mid, "object": "model", "created": created, "owned_by": owner}
+                for mid, owner in model_ids
+            ],
+        }
+        self.body = dumps(self.data)
+        self.etag = '"%s"' % hashlib.sha256(self.body).hexdigest()[:32]
+
+    def start_refresh(self) -> asyncio.Task:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.refresh())
+        return self.task
+
+    async def get(self) -> Dict[str, Any]:
+        """The model list, fetching it if nothing is cached yet"""
+        now = time.monotonic()
+        if self.body is None:
+            await asyncio.shield(self.start_refresh())
+            if self.body is None:
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"model list unavailable: {self.last_error}",
+                )
+            return self.data
+        age = now - self.fetched_at
+        retry_due = self.failed_at is None or now - self.failed_at >= self.retry_after
+        if age >= self.ttl * self.refresh_ahead and retry_due:
+            self.start_refresh()
+        if age >= self.ttl:
+            self.stale_served += 1
+        return self.data
+
+    async def respond(self, if_none_match: str = None) -> Response:
+        """The cached body, or 304 when the client already has it"""
+        self.requests += 1
+        await self.get()
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"max-age={max(0, int(self.ttl - (time.monotonic() - self.fetched_at)))}",
+        }
+        if etag_matches(if_none_match, self.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        """Fetch and conditional request counters"""
+        return {
+            "name": self.name,
+            "models": len(self.model_ids or ()),
+            "age": time.monotonic() - self.fetched_at if self.body else None,
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "stale_served": self.stale_served,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+model_registries: Dict[str, ModelRegistry] = {}
+
+
+def get_model_registry_stats() -> Dict[str, dict]:
+    """Stats of every model list cache"""
+    return {name: registry.stats() for name, registry in model_registries.items()}
@@ -0,0 +1,175 @@
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import random
+import time
+
+from chatbridge.metrics import metrics_registry
+
+
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 2.0
+POLL_BACKOFF = 1.6
+POLL_JITTER = 0.2
+POLL_DEADLINE = 60.0
+POLL_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+poll_seconds = metrics_registry.histogram(
+    "chatbridge_poll_seconds",
+    "Latency of one status check of a job-style upstream",
+    ("poller",),
+    POLL_LATENCY_BUCKETS,
+)
+
+
+class Poller:
+    """Poll a job-style upstream until it reports completion
+
+    The first checks come quickly, then the delay grows by backoff up to
+    max_delay, with +-jitter so many jobs do not poll in lockstep. Polling
+    stops with TimeoutError once deadline seconds have passed, and stops
+    right away when the calling task is cancelled.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_delay: float = POLL_INITIAL_DELAY,
+        max_delay: float = POLL_MAX_DELAY,
+        backoff: float = POLL_BACKOFF,
+        jitter: float = POLL_JITTER,
+        deadline: float = POLL_DEADLINE,
+    ):
+        self.name = name
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.jobs = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.pushed = 0
+        self.polls = 0
+        self.wait_total = 0.0
+        self.latency_counts = [0] * (len(POLL_LATENCY_BUCKETS) + 1)
+        self.latency_total = 0.0
+
+    def delays(self):
+        """Delay before each check"""
+        delay = self.initial_delay
+        while True:
+            yield delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay = min(delay * self.backoff, self.max_delay)
+
+    def observe(self, latency: float):
+        self.polls += 1
+        self.latency_total += latency
+        self.latency_counts[bisect_left(POLL_LATENCY_BUCKETS, latency)] += 1
+        poll_seconds.observe((self.name,), latency)
+
+    async def poll_until(
+        self, check: Callable[[], Awaitable[Any]], done: Callable[[Any], bool]
+    ) -> Any:
+        for delay in self.delays():
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            result = await check()
+            self.observe(time.perf_counter() - started)
+            if done(result):
+                return result
+
+    async def poll(
+        self,
+        check: Callable[[], Awaitable[Any]],
+        done: Callable[[Any], bool] = bool,
+        push: Optional[Callable[[], Awaitable[Any]]] = None,
+        deadline: float = None,
+    ) -> Any:
+        """Call check until done(result), and return that result
+
+        When the upstream offers a push or stream endpoint, pass push: it is
+        awaited alongside polling and whichever finishes first wins. A push
+        that fails leaves polling to finish the job.
+        """
+        self.jobs += 1
+        started = time.monotonic()
+        polling = asyncio.ensure_future(self.poll_until(check, done))
+        waiting = {polling}
+        pushing = None
+        if push is not None:
+            pushing = asyncio.ensure_future(push())
+            waiting.add(pushing)
+        try:
+            async with asyncio.timeout(deadline or self.deadline):
+                while True:
+                    finished, waiting = await asyncio.wait(
+                        waiting, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if polling in finished:
+                        result = polling.result()
+                        break
+                    if pushing.exception() is None:
+                        self.pushed += 1
+                        result = pushing.result()
+                        break
+                    print(f"{self.name} push failed, polling: {pushing.exception()}")
+            self.completed += 1
+            return result
+        except TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            for task in (polling, pushing):
+                if task is not None and not task.done():
+                    task.cancel()
+            self.wait_total += time.monotonic() - started
+
+    def stats(self) -> dict:
+        """Job counters and the per-poll latency histogram"""
+        buckets = {}
+        count = 0
+        for bound, bucket in zip(POLL_LATENCY_BUCKETS, self.latency_counts):
+            count += bucket
+            buckets[str(bound)] = count
+        buckets["+Inf"] = self.polls
+        return {
+            "name": self.name,
+            "jobs": self.jobs,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "pushed": self.pushed,
+            "polls": self.polls,
+            "polls_per_job": self.polls / (self.jobs or 1),
+            "wait_avg": self.wait_total / (self.jobs or 1),
+            "poll_latency_avg": self.latency_total / (self.polls or 1),
+            "poll_latency_buckets": buckets,
+        }
+
+
+pollers: Dict[str, Poller] = {}
+
+
+def get_poller(name: str, **options) -> Poller:
+    """Get or create the poller of an upstream"""
+    poller = pollers.get(name)
+    if poller is None:
+        poller = pollers[name] = Poller(name, **options)
+    return poller
+
+
+def get_poller_stats() -> Dict[str, dict]:
+    """Stats of every poller"""
+    return {name: poller.stats() for name, poller in pollers.items()}
+
+
+metrics_registry.collect_stats(
+    "chatbridge_poll_jobs",
+    get_poller_stats,
+    "poller",
+    {
+        "jobs": ("counter", "Jobs polled"),
+        "completed": ("counter", "Jobs polled to completion"),
+        "timed_out": ("counter", "Jobs that passed the polling deadline"),
+    },
+)
@@ -0,0 +1,282 @@
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+import asyncio
+import atexit
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from chatbridge.metrics import metrics_registry
+
+
+RESPONSE_CACHE_TTL = 3600.0
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_CHARS = 32 * 1024 * 1024
+RESPONSE_CACHE_PRUNE_EVERY = 1000
+RESPONSE_CACHE_FLUSH_INTERVAL = 0.5
+CACHE_HEADER = "X-ChatBridge-Cache"
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_BYPASS = "bypass"
+
+
+def cache_key(**fields: Any) -> str:
+    """Canonical hash of the fields that determine a reply"""
+    canonical = json.dumps(
+        fields, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def cache_directives(headers: Optional[Mapping[str, str]]) -> Tuple[bool, bool]:
+    """(lookup, store) allowed by the request headers
+
+    Cache-Control: no-cache or X-ChatBridge-Cache: refresh skip the lookup
+    but store the new reply; Cache-Control: no-store or
+    X-ChatBridge-Cache: bypass skip the cache entirely.
+    """
+    if not headers:
+        return True, True
+    control = headers.get("cache-control", "").lower()
+    mode = headers.get(CACHE_HEADER, "").lower()
+    if "no-store" in control or mode == CACHE_BYPASS:
+        return False, False
+    if "no-cache" in control or mode == "refresh":
+        return False, True
+    return True, True
+
+
+class ResponseCache:
+    """Replies of deterministic requests, in memory with an optional SQLite tier
+
+    The memory tier is an LRU bounded by entry count and total characters,
+    the SQLite tier at path survives restarts. Entries expire after ttl
+    seconds in both tiers. Only requests with temperature 0 are cached
+    unless deterministic_only is False.
+
+    The SQLite tier is never touched from the event loop: lookups run in a
+    worker thread, and stored replies are written in one transaction per
+    flush_interval, also from a worker thread.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        maxsize: int = RESPONSE_CACHE_SIZE,
+        max_chars: int = RESPONSE_CACHE_CHARS,
+        path: str = None,
+        deterministic_only: bool = True,
+        flush_interval: float = RESPONSE_CACHE_FLUSH_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_chars = max_chars
+        self.path = path
+        self.deterministic_only = deterministic_only
+        self.flush_interval = flush_interval
+        self.entries = OrderedDict()
+        # Stored replies not written to the SQLite tier yet
+        self.pending: Dict[str, Tuple[str, float]] = {}
+        self.flush_task: asyncio.Task = None
+        self.flushes = 0
+        self.written = 0
+        self.chars = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expired = 0
+        self.lock = threading.Lock()
+        # Serializes use of the SQLite connection, held only in worker threads
+        self.db_lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses"
+                " (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.prune()
+            atexit.register(self.flush)
+
+    def cacheable(self, temperature: float) -> bool:
+        """Whether a request with this temperature may be cached"""
+        return not self.deterministic_only or temperature == 0
+
+    async def get(self, key: str) -> Optional[str]:
+        """Cached reply, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self.drop(key)
+                self.expired += 1
+            if self.db is None:
+                self.misses += 1
+                return None
+            entry = self.pending.get(key)
+        if entry is not None and entry[1] > now:
+            row = entry
+        else:
+            row = await asyncio.to_thread(self.read, key)
+        with self.lock:
+            if row is not None and row[1] > now:
+                self.insert(key, row[0], row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[0]
+            self.misses += 1
+        return None
+
+    def read(self, key: str) -> Optional[Tuple[str, float]]:
+        """(value, expires_at) of key in the SQLite tier"""
+        with self.db_lock:
+            return self.db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+    def put(self, key: str, value: str):
+        """Store a reply in both tiers, the SQLite tier with the next flush"""
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self.insert(key, value, expires_at)
+            self.stores += 1
+            if self.db is None:
+                return
+            self.pending[key] = (value, expires_at)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        task = self.flush_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self.flush_task = loop.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await asyncio.to_thread(self.flush)
+
+    def flush(self):
+        """Write the pending replies to the SQLite tier in one transaction"""
+        if self.db is None:
+            return
+        with self.db_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return
+            self.db.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, (value, expires_at) in pending.items()],
+            )
+            self.db.commit()
+            self.flushes += 1
+            before, self.written = self.written, self.written + len(pending)
+            if before // RESPONSE_CACHE_PRUNE_EVERY != self.written // RESPONSE_CACHE_PRUNE_EVERY:
+                self.prune_rows()
+
+    def insert(self, key: str, value: str, expires_at: float):
+        """Insert into the memory tier, evicting least recently used entries"""
+        if len(value) > self.max_chars:
+            return
+        self.drop(key)
+        self.entries[key] = (expires_at, value)
+        self.chars += len(value)
+        while self.entries and (
+            len(self.entries) > self.maxsize or self.chars > self.max_chars
+        ):
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.chars -= len(evicted)
+            self.evictions += 1
+
+    def drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.chars -= len(entry[1])
+
+    def prune(self):
+        """Delete expired rows from the SQLite tier"""
+        with self.db_lock:
+            self.prune_rows()
+
+    def prune_rows(self):
+        self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.pending.clear()
+            self.chars = 0
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+
+    def stats(self) -> dict:
+        """Cache counters and hit ratio"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "chars": self.chars,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "disk": self.path,
+                "disk_pending": len(self.pending),
+                "disk_flushes": self.flushes,
+            }
+
+
+response_caches: Dict[str, ResponseCache] = {}
+
+
+def get_response_cache_stats() -> Dict[str, dict]:
+    """Stats of every response cache"""
+    return {name: cache.stats() for name, cache in response_caches.items()}
+
+
+metrics_registry.collect_stats(
+    "chatbridge_response_cache",
+    get_response_cache_stats,
+    "backend",
+    {
+        "hits": ("counter", "Completions served from the response cache"),
+        "misses": ("counter", "Response cache lookups that found nothing"),
+        "hit_ratio": ("gauge", "Share of response cache lookups that hit"),
+        "size": ("gauge", "Replies in the response cache memory tier"),
+    },
+)
+
+
+async def record_deltas(cache: ResponseCache, key: str, deltas):
+    """Pass deltas through, caching the full reply once the stream completes"""
+    parts = []
+    try:
+        async for delta in deltas:
+            if delta:
+                parts.append(delta)
+            yield delta
+    finally:
+        aclose = getattr(deltas, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    cache.put(key, "".join(parts))
@@ -0,0 +1,269 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import asyncio
+import time
+
+from chatbridge.transcript import message_text, render_message
+
+
+SESSION_TTL = 1800.0
+SESSION_STORE_SIZE = 1024
+SESSION_LOCK_TIMEOUT = 300.0
+ROLE_ASSISTANT = "assistant"
+ROLE_USER = "user"
+
+
+class Session:
+    """Upstream conversation of a backend, e.g. a thread id
+
+    The backend sets handle when it opens the upstream conversation; turns
+    that continue the same client conversation get the same Session back.
+    """
+
+    def __init__(self):
+        self.handle: Any = None
+        self.key: tuple = None
+        self.length = 0
+        self.turns = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+
+def turn_prompt(messages: List[Any]) -> str:
+    """Prompt of the messages a resumed session has not seen yet
+
+    Assistant replies are already upstream and are skipped. A single new
+    user message is sent as is, anything else as a transcript.
+    """
+    messages = [message for message in messages if message.role != ROLE_ASSISTANT]
+    if len(messages) == 1 and messages[0].role == ROLE_USER:
+        return message_text(messages[0])
+    return "".join(render_message(message) for message in messages).strip()
+
+
+class SessionTurn:
+    """One request running on a session, holding its lock until finished"""
+
+    def __init__(self, store: "SessionStore", session: Session, length: int, key: tuple):
+        self.store = store
+        self.session = session
+        self.length = length
+        self.key = key
+        self.locked = True
+        self.ok = False
+
+    @property
+    def resumed(self) -> bool:
+        return self.length > 0
+
+    def finish(self, ok: bool):
+        """Keep the session for the next turn if the reply made it through"""
+        if self.locked:
+            self.locked = False
+            self.store.release(self, ok)
+
+    async def track(self, deltas):
+        """Pass deltas through, marking the turn ok once the stream completes
+
+        The turn is finished once the response is done sending, see
+        run_completion, since a client can disconnect before this starts.
+        """
+        async for delta in deltas:
+            yield delta
+        self.ok = True
+
+
+def shared_key(key: tuple) -> str:
+    length, digest = key
+    return "%d:%s" % (length, digest.hex())
+
+
+class SessionStore:
+    """Map client conversations to upstream sessions
+
+    A conversation is identified by the rolling hash of its message prefix:
+    a turn is stored under the hash of all its messages, and the next
+    request, which repeats them followed by the reply and a new message,
+    finds it again. Concurrent turns on one conversation are serialized,
+    idle sessions expire after ttl and the least recently used are evicted
+    beyond maxsize.
+
+    With a shared store (a SQLiteStore when several workers run), sessions
+    live there instead, so a conversation continues on any worker. A turn
+    takes its session out of the store and puts it back when it finishes;
+    a concurrent turn on the same conversation starts a new session
+    instead of waiting. Handles must then be JSON serializable. The shared
+    store is only used from worker threads, never on the event loop.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        ttl: float = SESSION_TTL,
+        maxsize: int = SESSION_STORE_SIZE,
+        lock_timeout: float = SESSION_LOCK_TIMEOUT,
+        shared=None,
+    ):
+        self.name = name
+        self.shared = shared
+        self.namespace = f"session:{name}"
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.lock_timeout = lock_timeout
+        self.entries = OrderedDict()
+        self.pending_writes = set()
+        self.resumed = 0
+        self.started = 0
+        self.kept = 0
+        self.dropped = 0
+        self.evictions = 0
+        self.expired = 0
+        self.lock_waits = 0
+
+    def find(self, keys: List[tuple], messages: List[Any]) -> Tuple[int, Session]:
+        """Longest stored prefix followed by an assistant reply"""
+        now = time.monotonic()
+        for index in range(len(keys) - 2, -1, -1):
+            session = self.entries.get(keys[index])
+            if session is None:
+                continue
+            if now - session.last_used > self.ttl:
+                self.remove(keys[index])
+                self.expired += 1
+                continue
+            length = index + 1
+            if messages[length].role == ROLE_ASSISTANT:
+                return length, session
+        return 0, None
+
+    def take_shared(self, candidates: List[Tuple[int, str]]) -> Tuple[int, Session]:
+        """First of the (length, shared key) candidates found in the shared store
+
+        Blocking, run in a worker thread.
+        """
+        for length, key in candidates:
+            state = self.shared.take(self.namespace, key)
+            if state is not None:
+                session = Session()
+                session.handle = state["handle"]
+                session.turns = state["turns"]
+                session.length = length
+                return length, session
+        return 0, None
+
+    async def begin(self, keys: List[tuple], messages: List[Any]) -> SessionTurn:
+        """Start a turn, resuming the session of the conversation if there is one"""
+        if self.shared is not None:
+            # Longest prefix followed by an assistant reply first
+            candidates = [
+                (index + 1, shared_key(keys[index]))
+                for index in range(len(keys) - 2, -1, -1)
+                if messages[index + 1].role == ROLE_ASSISTANT
+            ]
+            length, session = 0, None
+            if candidates:
+                length, session = await asyncio.to_thread(self.take_shared, candidates)
+            if session is None:
+                session = Session()
+                self.started += 1
+            else:
+                self.resumed += 1
+            await session.lock.acquire()
+            return SessionTurn(self, session, length, keys[-1] if keys else None)
+
+        while True:
+            length, session = self.find(keys, messages)
+            if session is None:
+                break
+            if session.lock.locked():
+                self.lock_waits += 1
+            try:
+                await asyncio.wait_for(session.lock.acquire(), self.lock_timeout)
+            except asyncio.TimeoutError:
+                break
+            if session.key == keys[length - 1]:
+                self.entries.move_to_end(session.key)
+                self.resumed += 1
+                return SessionTurn(self, session, length, keys[-1] if keys else None)
+            # Another turn advanced the session meanwhile, look again
+            session.lock.release()
+
+        session = Session()
+        await session.lock.acquire()
+        self.started += 1
+        return SessionTurn(self, session, 0, keys[-1] if keys else None)
+
+    def release(self, turn: SessionTurn, ok: bool):
+        session = turn.session
+        if self.shared is not None:
+            if ok and session.handle is not None and turn.key is not None:
+                state = {"handle": session.handle, "turns": session.turns + 1}
+                self.put_shared(shared_key(turn.key), state)
+                self.kept += 1
+            else:
+                self.dropped += 1
+            session.lock.release()
+            return
+        if session.key is not None:
+            self.remove(session.key)
+        if ok and session.handle is not None and turn.key is not None:
+            session.key = turn.key
+            # Prefix keys are (message count, hash)
+            session.length = turn.key[0]
+            session.turns += 1
+            session.last_used = time.monotonic()
+            self.entries[turn.key] = session
+            self.kept += 1
+            while len(self.entries) > self.maxsize:
+                _, evicted = self.entries.popitem(last=False)
+                evicted.key = None
+                self.evictions += 1
+        else:
+            session.key = None
+            self.dropped += 1
+        session.lock.release()
+
+    def put_shared(self, key: str, state: dict):
+        """Store a finished turn in the shared store from a worker thread"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.shared.set(self.namespace, key, state, self.ttl)
+            return
+        future = loop.run_in_executor(
+            None, self.shared.set, self.namespace, key, state, self.ttl
+        )
+        self.pending_writes.add(future)
+        future.add_done_callback(self.write_done)
+
+    def write_done(self, future: asyncio.Future):
+        self.pending_writes.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Storing session of {self.name} failed: {future.exception()}")
+
+    def remove(self, key: tuple):
+        session = self.entries.pop(key, None)
+        if session is not None:
+            session.key = None
+
+    def stats(self) -> dict:
+        """Session counters"""
+        return {
+            "name": self.name,
+            "size": len(self.entries),
+            "resumed": self.resumed,
+            "started": self.started,
+            "kept": self.kept,
+            "dropped": self.dropped,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "lock_waits": self.lock_waits,
+        }
+
+
+session_stores: Dict[str, SessionStore] = {}
+
+
+def get_session_stats() -> Dict[str, dict]:
+    """Stats of every session store"""
+    return {name: store.stats() for name, store in session_stores.items()}
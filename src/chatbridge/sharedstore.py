@@ -0,0 +1,158 @@
+from typing import Any, Dict, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+SHARED_STORE_ENV = "CHATBRIDGE_STORE"
+SHARED_STORE_PRUNE_EVERY = 1000
+
+
+class MemoryStore:
+    """Key-value store local to the process, the default with one worker
+
+    Values expire after their ttl. Any object with the same get, set, take
+    and delete methods can replace it through set_shared_store.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.entries: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self.entries[(namespace, key)]
+                return default
+            return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self.lock:
+            self.entries[(namespace, key)] = (expires_at, value)
+
+    def take(self, namespace: str, key: str) -> Any:
+        """Remove and return a value, so only one caller gets it"""
+        with self.lock:
+            entry = self.entries.pop((namespace, key), None)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def delete(self, namespace: str, key: str):
+        with self.lock:
+            self.entries.pop((namespace, key), None)
+
+    def stats(self) -> dict:
+        return {"kind": "memory", "size": len(self.entries)}
+
+
+class SQLiteStore:
+    """Key-value store in a SQLite file, shared by the workers of one host
+
+    Values are stored as JSON. take runs in an immediate transaction, so of
+    several workers racing for one key exactly one gets the value.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.db = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state (namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM shared_state WHERE namespace = ? AND key = ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO shared_state VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+            self.writes += 1
+            if self.writes % SHARED_STORE_PRUNE_EVERY == 0:
+                self.db.execute(
+                    "DELETE FROM shared_state WHERE expires_at <= ?", (time.time(),)
+                )
+
+    def take(self, namespace: str, key: str) -> Any:
+        """Remove and return a value, so only one worker gets it"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT value, expires_at FROM shared_state"
+                    " WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                ).fetchone()
+                if row is not None:
+                    self.db.execute(
+                        "DELETE FROM shared_state WHERE namespace = ? AND key = ?",
+                        (namespace, key),
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def delete(self, namespace: str, key: str):
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM shared_state WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+
+    def stats(self) -> dict:
+        with self.lock:
+            size = self.db.execute("SELECT COUNT(*) FROM shared_state").fetchone()[0]
+        return {"kind": "sqlite", "path": self.path, "size": size}
+
+
+shared_store = None
+
+
+def get_shared_store():
+    """The store of this process, a SQLiteStore when CHATBRIDGE_STORE is a path"""
+    global shared_store
+    if shared_store is None:
+        path = os.getenv(SHARED_STORE_ENV, "")
+        shared_store = SQLiteStore(path) if path else MemoryStore()
+    return shared_store
+
+
+def set_shared_store(store):
+    """Replace the store, e.g. with a client of an external key-value server"""
+    global shared_store
+    shared_store = store
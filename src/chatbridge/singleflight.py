@@ -0,0 +1,169 @@
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import inspect
+
+from chatbridge.metrics import metrics_registry
+
+
+class Flight:
+    """One backend call shared by identical requests
+
+    A pump task drives the backend and appends every delta to a shared
+    list; each request follows the list from the start, so late joiners get
+    the deltas produced so far replayed and then follow live.
+    """
+
+    def __init__(self):
+        self.deltas: List[str] = []
+        self.result: Any = None
+        self.streaming = False
+        self.done = False
+        self.error: BaseException = None
+        self.started = asyncio.Event()
+        self.changed = asyncio.Event()
+        self.waiters = 0
+        self.task: asyncio.Task = None
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def pump(self, call: Callable[[], Awaitable[Any]]):
+        try:
+            response = await call()
+            if inspect.isasyncgen(response):
+                self.streaming = True
+                self.started.set()
+                try:
+                    async for delta in response:
+                        if delta:
+                            self.deltas.append(delta)
+                            self.notify()
+                finally:
+                    await response.aclose()
+            elif isinstance(response, str):
+                self.streaming = True
+                self.deltas.append(response)
+            else:
+                # None or an {"error": ...} dict, handed to every waiter as is
+                self.result = response
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.done = True
+            self.started.set()
+            self.notify()
+
+    async def follow(self, leave: Callable[[], None]):
+        """Replay the deltas produced so far, then follow live"""
+        index = 0
+        try:
+            while True:
+                changed = self.changed
+                while index < len(self.deltas):
+                    yield self.deltas[index]
+                    index += 1
+                if self.done:
+                    break
+                await changed.wait()
+            if self.error is not None:
+                raise self.error
+        finally:
+            leave()
+
+
+class SingleFlight:
+    """Coalesce concurrent identical completions into one backend call"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[str, Flight] = {}
+        self.calls = 0
+        self.joined = 0
+        self.cancelled = 0
+        self.peak_waiters = 0
+
+    async def join(
+        self, key: str, call: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """(response, leader) for the call under key, starting it if needed
+
+        response is an async generator of deltas, or the backend's None or
+        error dict. leader is True for the request that started the call.
+        """
+        flight = self.flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self.flights[key] = Flight()
+            self.calls += 1
+            flight.task = asyncio.create_task(self.run(key, flight, call))
+        else:
+            self.joined += 1
+        flight.waiters += 1
+        self.peak_waiters = max(self.peak_waiters, flight.waiters)
+
+        def leave():
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.done:
+                # Nobody is listening anymore, stop the backend
+                self.cancelled += 1
+                flight.task.cancel()
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+
+        try:
+            await flight.started.wait()
+        except BaseException:
+            leave()
+            raise
+        if flight.error is not None and not flight.streaming:
+            leave()
+            raise flight.error
+        if not flight.streaming:
+            leave()
+            return flight.result, leader
+        return flight.follow(leave), leader
+
+    async def run(self, key: str, flight: Flight, call: Callable[[], Awaitable[Any]]):
+        try:
+            await flight.pump(call)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def stats(self) -> dict:
+        """Backend calls made and requests that shared one"""
+        return {
+            "name": self.name,
+            "in_flight": len(self.flights),
+            "waiters": sum(flight.waiters for flight in self.flights.values()),
+            "peak_waiters": self.peak_waiters,
+            "backend_calls": self.calls,
+            "coalesced": self.joined,
+            "cancelled": self.cancelled,
+        }
+
+
+single_flights: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight_stats() -> Dict[str, dict]:
+    """Stats of every single-flight group"""
+    return {name: group.stats() for name, group in single_flights.items()}
+
+
+metrics_registry.collect_stats(
+    "chatbridge_single_flight",
+    get_single_flight_stats,
+    "backend",
+    {
+        "in_flight": ("gauge", "Shared backend calls running"),
+        "backend_calls": ("counter", "Backend calls made for coalesced requests"),
+        "coalesced": ("counter", "Requests that joined a running backend call"),
+        "cancelled": ("counter", "Shared backend calls stopped with no listener left"),
+    },
+)
@@ -0,0 +1,315 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Tuple
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+
+from chatbridge.lazyrequest import LazyMessages
+from chatbridge.metrics import metrics_registry, request_labels
+from chatbridge.transcript import message_text
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# tiktoken encoding name, or "approx" for the built-in estimate
+TOKENIZER_ENV = "CHATBRIDGE_TOKENIZER"
+TOKEN_PROCESSES_ENV = "CHATBRIDGE_TOKEN_PROCESSES"
+DEFAULT_ENCODING = "o200k_base"
+TOKEN_CACHE_SIZE = 4096
+TOKEN_OFFLOAD_CHARS = 32 * 1024
+TOKEN_KEY_SIZE = 16
+# Streamed text without whitespace (e.g. Chinese) is counted in chunks of this size
+STREAM_CHUNK_CHARS = 4096
+# Framing OpenAI counts around every message and before the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+# Roughly what BPE tokenizers produce for English text and code: words of up
+# to 8 letters, numbers of up to 3 digits, single symbols and whitespace runs
+APPROX_TOKEN_PATTERN = re.compile(r" ?[A-Za-z]{1,8}| ?\d{1,3}| ?[^\sA-Za-z\d]|\s+")
+
+tokens_counted = metrics_registry.counter(
+    "chatbridge_tokens",
+    "Prompt and completion tokens counted by chatbridge",
+    ("backend", "model", "kind"),
+)
+
+encoding = None
+encoding_loaded = False
+encoding_lock = threading.Lock()
+
+
+def load_encoding():
+    """tiktoken encoding named by CHATBRIDGE_TOKENIZER, None for the estimate
+
+    The first call may download the encoding, chatbridge_lifespan runs it
+    at startup off the event loop.
+    """
+    global encoding, encoding_loaded
+    with encoding_lock:
+        if not encoding_loaded:
+            name = os.getenv(TOKENIZER_ENV, DEFAULT_ENCODING)
+            if tiktoken is not None and name != "approx":
+                try:
+                    encoding = tiktoken.get_encoding(name)
+                except Exception as e:
+                    print(f"Loading tokenizer {name} failed, estimating tokens: {e}")
+            encoding_loaded = True
+    return encoding
+
+
+def count_text(text: str) -> int:
+    """Tokens of text, exact once the tiktoken encoding is loaded, estimated before"""
+    if not text:
+        return 0
+    current = encoding
+    if current is not None:
+        return len(current.encode_ordinary(text))
+    return len(APPROX_TOKEN_PATTERN.findall(text))
+
+
+def count_texts(texts: List[str]) -> List[int]:
+    """count_text of every text, run in a worker thread or the token process pool"""
+    return [count_text(text) for text in texts]
+
+
+def part_key(role: str, text: str) -> bytes:
+    """Cache key of a counted text, BLAKE2b so different texts never share a count"""
+    digest = hashlib.blake2b(role.encode(), digest_size=TOKEN_KEY_SIZE)
+    digest.update(b"\x00")
+    digest.update(text.encode("utf-8", "surrogatepass"))
+    return digest.digest()
+
+
+def counted_text(message: Any) -> str:
+    """What a message contributes to the prompt: text parts and tool calls"""
+    text = message_text(message) or ""
+    for tool_call in message.tool_calls or ():
+        text += tool_call.function.name + tool_call.function.arguments
+    return text
+
+
+def raw_counted_text(raw: dict) -> str:
+    """counted_text of a message still in its raw JSON form"""
+    content = raw.get("content")
+    if isinstance(content, list):
+        text = " ".join(
+            [
+                str(item.get("text", ""))
+                for item in content
+                if isinstance(item, dict) and item.get("type") == "text"
+            ]
+        )
+    else:
+        text = content if isinstance(content, str) else ""
+    for tool_call in raw.get("tool_calls") or ():
+        function = tool_call.get("function") or {}
+        text += str(function.get("name", "")) + str(function.get("arguments", ""))
+    return text
+
+
+def prompt_parts(messages: List[Any]) -> List[Tuple[str, str]]:
+    """(role, counted text) of every message
+
+    Messages of a lazily parsed request that have not been validated yet are
+    read from their raw JSON, so counting does not materialize them.
+    """
+    if not isinstance(messages, LazyMessages):
+        return [(message.role, counted_text(message)) for message in messages]
+    parts = []
+    for item, raw in zip(messages.items, messages.raw):
+        if item is not None:
+            parts.append((item.role, counted_text(item)))
+        else:
+            parts.append((str(raw.get("role", "")), raw_counted_text(raw)))
+    return parts
+
+
+class TokenCounter:
+    """Prompt token counts with per-message counts cached by content hash
+
+    A conversation resends its whole history every turn, so only messages
+    not seen before are tokenized. Text over offload_chars is tokenized off
+    the event loop: in a process pool when processes is set, in a worker
+    thread otherwise.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = TOKEN_CACHE_SIZE,
+        processes: int = 0,
+        offload_chars: int = TOKEN_OFFLOAD_CHARS,
+    ):
+        self.maxsize = maxsize
+        self.processes = processes
+        self.offload_chars = offload_chars
+        self.pool: ProcessPoolExecutor = None
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tokenized_chars = 0
+        self.offloaded = 0
+
+    def lookup(self, key: Any):
+        with self.lock:
+            count = self.entries.get(key)
+            if count is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return count
+
+    def store(self, keys: List[Any], counts: List[int]):
+        with self.lock:
+            for key, count in zip(keys, counts):
+                self.entries[key] = count
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    async def prompt_tokens(self, messages: List[Any], extra: str = "") -> int:
+        """Tokens of messages plus extra (the tool prompt)"""
+        total = TOKENS_PER_REPLY + TOKENS_PER_MESSAGE * len(messages)
+        keys, texts = [], []
+        parts = [("", extra)] if extra else []
+        parts.extend(prompt_parts(messages))
+        for part in parts:
+            key = part_key(*part)
+            count = self.lookup(key)
+            if count is None:
+                keys.append(key)
+                texts.append(part[1])
+            else:
+                total += count
+        if not texts:
+            return total
+        chars = sum(len(text) for text in texts)
+        self.tokenized_chars += chars
+        if chars >= self.offload_chars:
+            counts = await self.run_off_loop(texts)
+        else:
+            counts = count_texts(texts)
+        self.store(keys, counts)
+        return total + sum(counts)
+
+    def text_count(self, text: str) -> int:
+        """count_text, cached like message counts"""
+        key = part_key("", text)
+        count = self.lookup(key)
+        if count is None:
+            count = count_text(text)
+            self.store([key], [count])
+        return count
+
+    async def run_off_loop(self, texts: List[str]) -> List[int]:
+        self.offloaded += 1
+        if self.processes <= 0:
+            return await asyncio.to_thread(count_texts, texts)
+        if self.pool is None:
+            # Not forked: the server process has event loop and executor threads
+            self.pool = ProcessPoolExecutor(
+                self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                # A spawned worker has none of the server's module state
+                initializer=load_encoding,
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, count_texts, texts)
+
+    async def text_tokens(self, text: str) -> int:
+        """Tokens of a whole reply, off the event loop when it is large"""
+        if len(text) >= self.offload_chars:
+            return (await self.run_off_loop([text]))[0]
+        return count_text(text)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "tokenizer": encoding.name if encoding is not None else "approx",
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "tokenized_chars": self.tokenized_chars,
+                "offloaded": self.offloaded,
+                "processes": self.processes,
+            }
+
+
+class TokenUsage:
+    """Token usage of one completion
+
+    The prompt is counted in finish, once the backend has replied. Streamed
+    replies are counted as the deltas arrive: text is tokenized up to its
+    last whitespace, where BPE tokens do not straddle, and the rest waits
+    for the next delta. Text without whitespace is tokenized every
+    STREAM_CHUNK_CHARS.
+    """
+
+    def __init__(self, counter: TokenCounter, messages: List[Any], extra: str = ""):
+        self.counter = counter
+        self.messages = messages
+        self.extra = extra
+        self.completion = 0
+        self.pending: List[str] = []
+        self.pending_chars = 0
+        self.labels: Tuple[str, str] = request_labels.get()
+        self.usage: dict = None
+
+    def feed(self, delta: str):
+        if not delta:
+            return
+        # Only the new delta is searched, pending has no whitespace to cut at
+        cut = max(delta.rfind(" "), delta.rfind("\n"))
+        if cut >= 0:
+            self.pending.append(delta[:cut])
+            self.completion += count_text("".join(self.pending))
+            self.pending = [delta[cut:]]
+            self.pending_chars = len(delta) - cut
+            return
+        self.pending.append(delta)
+        self.pending_chars += len(delta)
+        if self.pending_chars >= STREAM_CHUNK_CHARS:
+            self.completion += count_text("".join(self.pending))
+            self.pending = []
+            self.pending_chars = 0
+
+    async def finish(self, text: str = None) -> dict:
+        """Usage dict, counting text as the whole reply if given
+
+        The counts are added to chatbridge_tokens_total once.
+        """
+        if self.usage is not None:
+            return self.usage
+        if text is not None:
+            self.completion = await self.counter.text_tokens(text)
+        else:
+            rest = "".join(self.pending)
+            self.completion += await self.counter.text_tokens(rest)
+        self.pending = []
+        self.pending_chars = 0
+        prompt = await self.counter.prompt_tokens(self.messages, self.extra)
+        self.usage = {
+            "prompt_tokens": prompt,
+            "completion_tokens": self.completion,
+            "total_tokens": prompt + self.completion,
+        }
+        if self.labels is not None:
+            backend, model = self.labels
+            tokens_counted.inc((backend, model, "prompt"), prompt)
+            tokens_counted.inc((backend, model, "completion"), self.completion)
+        return self.usage
+
+
+token_counter = TokenCounter(processes=int(os.getenv(TOKEN_PROCESSES_ENV, "0")))
+
+
+def get_token_stats() -> dict:
+    """Tokenizer cache and offloading counters"""
+    return token_counter.stats()
@@ -0,0 +1,229 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+
+TRACE_ENV = "CHATBRIDGE_TRACE"
+TRACE_SAMPLE_ENV = "CHATBRIDGE_TRACE_SAMPLE"
+
+
+class Span:
+    """One timed operation of a trace"""
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "started",
+        "attributes",
+        "ended",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: str,
+        attributes: dict,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.attributes = attributes
+        self.ended = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Any = None, **attributes):
+        """Finish the span and hand it to the exporter, only the first call counts"""
+        if self.ended:
+            return
+        self.ended = True
+        self.attributes.update(attributes)
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": time.perf_counter() - self.started,
+            "status": "ok" if error is None else "error",
+            "attributes": self.attributes,
+        }
+        if error is not None:
+            record["error"] = (
+                repr(error) if isinstance(error, BaseException) else str(error)
+            )
+        self.tracer.export(record)
+
+
+class StdoutExporter:
+    """Print every span as one JSON line"""
+
+    def export(self, record: dict):
+        print(json.dumps(record, ensure_ascii=False, default=str), file=sys.stdout)
+
+
+class JSONLExporter:
+    """Append every span as one JSON line to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", buffering=1, encoding="utf-8")
+
+    def export(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+
+# Span the code running in this task reports to
+active_span: ContextVar[Optional[Span]] = ContextVar("chatbridge_span", default=None)
+
+
+def parse_traceparent(header: str):
+    """(trace_id, parent_id) of a sampled W3C traceparent header, or None"""
+    parts = header.split("-") if header else ()
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = int(parts[3], 16) & 1
+    except ValueError:
+        return None
+    return (parts[1], parts[2]) if sampled else None
+
+
+class Tracer:
+    """Head-sampled tracer, the decision is taken once per completion
+
+    Without an exporter, or for requests that are not sampled, no span is
+    created at all and every helper returns right away. A request carrying
+    a sampled traceparent header is always traced and joins that trace.
+    """
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.traces = 0
+        self.spans = 0
+        self.export_errors = 0
+
+    def start_trace(
+        self, name: str, traceparent: str = None, **attributes
+    ) -> Optional[Span]:
+        """Root span of a completion, made the active span of this task if sampled"""
+        if self.exporter is None:
+            return None
+        parent = parse_traceparent(traceparent)
+        if parent is None:
+            if random.random() >= self.sample_rate:
+                active_span.set(None)
+                return None
+            parent = ("%032x" % random.getrandbits(128), None)
+        span = Span(self, name, parent[0], parent[1], attributes)
+        self.traces += 1
+        active_span.set(span)
+        return span
+
+    def export(self, record: dict):
+        self.spans += 1
+        try:
+            self.exporter.export(record)
+        except Exception as e:
+            self.export_errors += 1
+            print(f"Exporting span {record['name']} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.exporter is not None,
+            "sample_rate": self.sample_rate,
+            "traces": self.traces,
+            "spans": self.spans,
+            "export_errors": self.export_errors,
+        }
+
+
+def exporter_from_env():
+    target = os.getenv(TRACE_ENV, "")
+    if not target or target == "0":
+        return None
+    if target == "stdout":
+        return StdoutExporter()
+    return JSONLExporter(target)
+
+
+tracer = Tracer(exporter_from_env(), float(os.getenv(TRACE_SAMPLE_ENV, "1.0")))
+
+
+def configure_tracing(exporter, sample_rate: float = 1.0):
+    """Send spans to exporter (anything with export(record)), None turns tracing off"""
+    tracer.exporter = exporter
+    tracer.sample_rate = sample_rate
+
+
+def current_span() -> Optional[Span]:
+    return active_span.get()
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """Child of the active span, None when the request is not traced"""
+    parent = active_span.get()
+    if parent is None:
+        return None
+    return Span(parent.tracer, name, parent.trace_id, parent.span_id, attributes)
+
+
+def end_span(span: Optional[Span], error: Any = None, **attributes):
+    if span is not None:
+        span.end(error, **attributes)
+
+
+@contextmanager
+def activate(span: Optional[Span]):
+    """Make span the parent of spans started inside the block"""
+    if span is None:
+        yield span
+        return
+    token = active_span.set(span)
+    try:
+        yield span
+    finally:
+        active_span.reset(token)
+
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """Span around a block, also usable in backends
+
+    with trace_span("login", user=name) as span:
+        ...
+    """
+    span = start_span(name, **attributes)
+    if span is None:
+        yield None
+        return
+    token = active_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(e)
+        raise
+    finally:
+        active_span.reset(token)
+        span.end()
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from typing import Any, List
+import hashlib
+import threading
+
+
+TRANSCRIPT_CACHE_SIZE = 256
+TRANSCRIPT_CACHE_CHARS = 64 * 1024 * 1024
+PREFIX_KEY_SIZE = 16
+
+
+def message_text(message: Any) -> str:
+    """Text of a message, multimodal content keeps only its text parts"""
+    content = message.content
+    if isinstance(content, list):
+        # Simple handling of multimodal content, only extract text parts
+        return " ".join(
+            [item.get("text", "") for item in content if item.get("type") == "text"]
+        )
+    return content
+
+
+def render_message(message: Any, content: str = None) -> str:
+    """Render one message as a Human:/Assistant:/Tool: transcript turn
+
+    content replaces the text of the message, e.g. a shortened version.
+    """
+    role = message.role
+    if content is None:
+        content = message_text(message)
+    if role == "system":
+        # System messages as prefix for Human messages
+        return f"\n\nHuman: <system>{content}</system>"
+    elif role == "user":
+        return f"\n\nHuman: {content}"
+    elif role == "assistant" and not message.tool_calls:
+        return f"\n\nAssistant: {content}"
+    elif role == "assistant" and message.tool_calls:
+        tool_call = message.tool_calls[0].function
+        return f"\n\nAssistant: 正在调用: {tool_call.name}({tool_call.arguments})"
+    elif role == "tool":
+        # Tool messages as prefix for Tool messages
+        return f"\n\nTool: <tool>{content}</tool>"
+    return ""
+
+
+def render_transcript(header: str, messages: List[Any]) -> str:
+    """header followed by every message, rendered in one pass"""
+    return "".join([header] + [render_message(message) for message in messages])
+
+
+class TranscriptBuilder:
+    """Build build_all_prompt transcripts, reusing the rendered prefix of earlier turns
+
+    Every message prefix is identified by a rolling hash. The full rendering of
+    each request is cached under the hash of its messages, so the next turn of
+    the same conversation only renders the messages appended since then.
+    Hashing every message costs about as much as rendering short ones, so
+    this only pays off where the rendering is needed again, e.g. to measure
+    it against a context budget; plain transcripts use render_transcript.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = TRANSCRIPT_CACHE_SIZE,
+        max_chars: int = TRANSCRIPT_CACHE_CHARS,
+    ):
+        self.maxsize = maxsize
+        self.max_chars = max_chars
+        self.entries = OrderedDict()
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.rendered_messages = 0
+        self.reused_messages = 0
+        self.lock = threading.Lock()
+
+    def prefix_keys(self, header: str, messages: List[Any]) -> List[tuple]:
+        """Rolling digest of header + messages[: i + 1] for every i
+
+        BLAKE2b of the previous digest and the message, so keys are the same
+        in every process and can be shared between workers. The prefix
+        length is part of every key.
+        """
+        key = hashlib.blake2b(header.encode(), digest_size=PREFIX_KEY_SIZE).digest()
+        keys = []
+        for length, message in enumerate(messages, 1):
+            content = message.content
+            if not isinstance(content, str):
+                content = message_text(message)
+            parts = [message.role, content]
+            if message.tool_calls:
+                function = message.tool_calls[0].function
+                parts += [function.name, function.arguments]
+            digest = hashlib.blake2b(key, digest_size=PREFIX_KEY_SIZE)
+            digest.update("\x00".join(parts).encode("utf-8", "surrogatepass"))
+            key = digest.digest()
+            keys.append((length, key))
+        return keys
+
+    def build(self, header: str, messages: List[Any], budget: Any = None) -> str:
+        """Render header followed by every message
+
+        With a budget (a ContextBudget) the cached rendering is returned if it
+        fits, otherwise the budget builds a shortened transcript.
+        """
+        if budget is not None:
+            transcript = None
+            if budget.limit() is not None:
+                transcript = self.build(header, messages)
+            return budget.build(header, messages, transcript)
+        if self.maxsize <= 0:
+            return render_transcript(header, messages)
+        keys = self.prefix_keys(header, messages)
+        start, prefix = 0, header
+        with self.lock:
+            for index in range(len(keys) - 1, -1, -1):
+                cached = self.entries.get(keys[index])
+                if cached is not None:
+                    self.entries.move_to_end(keys[index])
+                    start, prefix = index + 1, cached
+                    self.hits += 1
+                    break
+            else:
+                self.misses += 1
+            self.reused_messages += start
+            self.rendered_messages += len(messages) - start
+
+        parts = [prefix]
+        parts.extend(render_message(message) for message in messages[start:])
+        transcript = "".join(parts)
+        if keys and start < len(keys):
+            self.store(keys[-1], transcript)
+        return transcript
+
+    def store(self, key: tuple, transcript: str):
+        """Insert a rendered transcript, evicting least recently used entries"""
+        if len(transcript) > self.max_chars:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.chars -= len(previous)
+            self.entries[key] = transcript
+            self.chars += len(transcript)
+            while self.entries and (
+                len(self.entries) > self.maxsize or self.chars > self.max_chars
+            ):
+                _, evicted = self.entries.popitem(last=False)
+                self.chars -= len(evicted)
+
+    def stats(self) -> dict:
+        """Cache counters"""
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "chars": self.chars,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rendered_messages": self.rendered_messages,
+                "reused_messages": self.reused_messages,
+            }
@@ -0,0 +1,202 @@
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Dict
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+from chatbridge.metrics import metrics_registry
+
+
+LOOP_STALL_THRESHOLD = float(os.getenv("CHATBRIDGE_LOOP_STALL_MS", "100")) / 1000
+LOOP_STALL_RECORDS = 100
+STACK_LIMIT = 30
+
+current_backend: ContextVar[str] = ContextVar("chatbridge_backend", default="")
+loop_stall_seconds = metrics_registry.histogram(
+    "chatbridge_loop_stall_seconds",
+    "Event-loop stalls detected by the watchdog, by the backend that caused them",
+    ("backend",),
+)
+
+
+class LoopWatchdog:
+    """Detect event-loop stalls and record which backend and stack caused them
+
+    A heartbeat coroutine ticks on the loop while a daemon thread watches the
+    ticks. When the loop misses a tick by more than the threshold, the thread
+    grabs the loop thread's stack while it is still blocked; the heartbeat
+    then records how long the stall lasted.
+    """
+
+    def __init__(
+        self,
+        threshold: float = LOOP_STALL_THRESHOLD,
+        max_records: int = LOOP_STALL_RECORDS,
+    ):
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self.enabled = False
+        self.loop = None
+        self.task: asyncio.Task = None
+        self.loop_thread_id = None
+        self.last_beat = 0.0
+        self.pending = None
+        self.backend_codes: Dict[object, str] = {}
+        self.records = deque(maxlen=max_records)
+        self.stalls = 0
+        self.stall_time_total = 0.0
+        self.stall_time_max = 0.0
+        self.by_backend: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def register_backend(self, func: Callable, name: str = None):
+        """Let stacks be attributed to a backend function"""
+        code = getattr(func, "__code__", None)
+        if code is not None:
+            self.backend_codes[code] = name or func.__name__
+
+    def enable(self, threshold: float = None):
+        """Turn the watchdog on, it starts with the next request"""
+        if threshold is not None:
+            self.threshold = threshold
+            self.interval = threshold / 2
+        self.enabled = True
+
+    def ensure_started(self):
+        """Start watching the running loop if enabled"""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        # Held here, the loop only keeps weak references to its tasks
+        self.task = loop.create_task(self.heartbeat(loop))
+        threading.Thread(
+            target=self.watch, args=(loop,), name="chatbridge-watchdog", daemon=True
+        ).start()
+
+    async def heartbeat(self, loop):
+        while self.enabled and self.loop is loop:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - self.last_beat - self.interval
+            self.last_beat = now
+            if lag >= self.threshold:
+                self.finish_stall(lag)
+            else:
+                self.pending = None
+
+    def watch(self, loop):
+        while self.enabled and self.loop is loop and not loop.is_closed():
+            time.sleep(self.interval)
+            blocked = time.monotonic() - self.last_beat - self.interval
+            if blocked >= self.threshold and self.pending is None:
+                self.pending = self.capture(loop)
+
+    def capture(self, loop) -> dict:
+        """Snapshot what the loop thread is running right now"""
+        backend = ""
+        try:
+            task = asyncio.current_task(loop)
+            if task is not None:
+                backend = task.get_context().get(current_backend, "")
+        except RuntimeError:
+            task = None
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = []
+        if frame is not None:
+            stack = traceback.format_stack(frame, limit=STACK_LIMIT)
+            walker = frame
+            while walker is not None and not backend:
+                backend = self.backend_codes.get(walker.f_code, "")
+                walker = walker.f_back
+        return {
+            "backend": backend or "unknown",
+            "task": task.get_name() if task is not None else "",
+            "started_at": time.time(),
+            "stack": "".join(stack),
+        }
+
+    def finish_stall(self, duration: float):
+        record = self.pending or {
+            "backend": "unknown",
+            "task": "",
+            "started_at": time.time() - duration,
+            "stack": "",
+        }
+        self.pending = None
+        record["duration"] = duration
+        with self.lock:
+            self.records.append(record)
+            self.stalls += 1
+            self.stall_time_total += duration
+            self.stall_time_max = max(self.stall_time_max, duration)
+            backend = self.by_backend.setdefault(
+                record["backend"], {"stalls": 0, "total": 0.0, "max": 0.0}
+            )
+            backend["stalls"] += 1
+            backend["total"] += duration
+            backend["max"] = max(backend["max"], duration)
+        loop_stall_seconds.observe((record["backend"],), duration)
+        print(
+            f"Event loop blocked for {duration * 1000:.0f} ms by {record['backend']}"
+        )
+
+    def stats(self) -> dict:
+        """Stall counts and durations, overall and per backend"""
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "stalls": self.stalls,
+                "stall_time_total": self.stall_time_total,
+                "stall_time_max": self.stall_time_max,
+                "by_backend": {name: dict(b) for name, b in self.by_backend.items()},
+                "recent": list(self.records),
+            }
+
+    def stop(self):
+        """Stop watching, until enable is called again"""
+        self.enabled = False
+        self.detach()
+
+    def detach(self):
+        """Stop watching the current loop, e.g. when the app shuts down
+
+        The next request on a new loop starts the watchdog again.
+        """
+        task, self.task = self.task, None
+        self.loop = None
+        if task is None or task.done():
+            return
+        loop = task.get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            task.cancel()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(task.cancel)
+
+
+loop_watchdog = LoopWatchdog()
+if os.getenv("CHATBRIDGE_LOOP_WATCHDOG", "") not in ("", "0"):
+    loop_watchdog.enable()
+
+
+def enable_loop_watchdog(threshold: float = None):
+    """Opt in to event-loop stall detection"""
+    loop_watchdog.enable(threshold)
+
+
+def get_loop_stall_stats() -> dict:
+    """Event-loop stall stats"""
+    return loop_watchdog.stats()
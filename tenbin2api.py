@@ -1,15 +1,18 @@
 from chatbridge.chatbridge import *
+from chatbridge.graphqlws import get_graphql_ws_client, graphql_ws_lifespan
 from curl_cffi import requests
+from curl_cffi.requests import AsyncSession
 from fastapi import FastAPI
 from dotenv import load_dotenv
 import json
 import os
 
-import uvicorn
-import websocket
 
 load_dotenv()
-app = FastAPI(title="retool2api")
+app = FastAPI(
+    title="retool2api", lifespan=chatbridge_lifespan(graphql_ws_lifespan())
+)
+app.add_api_route("/metrics", metrics_endpoint)
 session_id = os.getenv(
     "session_id",
     "",
@@ -17,6 +20,17 @@ session_id = os.getenv(
 if session_id == "":
     raise ValueError("session_id is not set in the environment variables.")
 print(f"Session ID: {session_id}")
+client = AsyncSession()
+captcha_poller = get_poller("tenbin-captcha", max_delay=1.0, deadline=120)
+GRAPHQL_WS_URL = "wss://graphql.tenbin.ai/graphql"
+WS_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
+    "Pragma": "no-cache",
+    "Cache-Control": "no-cache",
+    "Origin": "https://tenbin.ai",
+    "Accept-Language": "zh-CN,zh;q=0.9",
+    "Cookie": f"sessionId={session_id}",
+}
 
 
 @app.get("/v1/models")
@@ -62,34 +76,32 @@ def get_models():
     return model_ids
 
 
-def getTaskId():
+async def getTaskId():
 
     url = "http://127.0.0.1:5000/turnstile?url=https://tenbin.ai/workspace&sitekey=0x4AAAAAABGR2exxRproizri&action=issue_execution_token"
 
-    response = requests.get(url)
+    response = await client.get(url)
     response.raise_for_status()
     return response.json()["task_id"]
 
 
-def getCaptcha(task_id):
+async def getCaptcha(task_id):
 
     url = f"http://127.0.0.1:5000/result?id={task_id}"
 
-    while True:
+    async def check():
         try:
-            response = requests.get(url)
+            response = await client.get(url)
             response.raise_for_status()
-            captcha = response.json().get("value", "")
-            if captcha:
-                return captcha
-            else:
-                time.sleep(1)
+            return response.json().get("value", "")
         except Exception as e:
             print(e)
-            time.sleep(1)
+            return ""
+
+    return await captcha_poller.poll(check)
 
 
-def get_execute_token(captcha: str = None, model_name: str = None):
+async def get_execute_token(captcha: str = None, model_name: str = None):
     url = "https://graphql.tenbin.ai/graphql"
 
     payload = {
@@ -118,7 +130,7 @@ def get_execute_token(captcha: str = None, model_name: str = None):
         "Cookie": f"sessionId={session_id}",
     }
 
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
+    response = await client.post(url, data=json.dumps(payload), headers=headers)
 
     return response.json().get("data", {}).get("executionTokens", [])
 
@@ -238,72 +250,49 @@ def get_history_id_list():
 
 
 @app.post("/v1/chat/completions")
-@chatCompletions(1)
-def tenbin(prompt: str, res: ChatResponse, new_session: bool):
+@async_chatCompletions(1)
+async def tenbin(prompt: str, res: ChatResponse, new_session: bool):
     print(f"Prompt: {prompt}, Model: {res.model}, New Session: {new_session}")
-    task_id = getTaskId()
-    captcha = getCaptcha(task_id)
-    execution_token = get_execute_token(captcha, res.model)
+    task_id = await getTaskId()
+    try:
+        captcha = await getCaptcha(task_id)
+    except TimeoutError:
+        return {"error": "Timed out waiting for the turnstile solver"}
+    execution_token = await get_execute_token(captcha, res.model)
     print(execution_token)
-    url = "wss://graphql.tenbin.ai/graphql"
     if len(execution_token) == 0 or execution_token is None:
         print("Failed to get execution token.")
         return
     execution_token = execution_token[0]
-    headers = {
-        "Host": "graphql.tenbin.ai",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
-        "Connection": "Upgrade",
-        "Accept-Encoding": "gzip, deflate, br, zstd",
-        "Pragma": "no-cache",
-        "Cache-Control": "no-cache",
-        "Upgrade": "websocket",
-        "Origin": "https://tenbin.ai",
-        "Sec-WebSocket-Version": "13",
-        "Accept-Language": "zh-CN,zh;q=0.9",
-        "Sec-WebSocket-Key": "j69v2Cji3YAr5YZ31inBew==",
-        "Sec-WebSocket-Extensions": "permessage-deflate; client_max_window_bits",
-        "Sec-WebSocket-Protocol": "graphql-transport-ws",
-        "Cookie": f"sessionId={session_id}",
-    }
-
-    ws = websocket.create_connection(url, header=headers)
-    ws.send(json.dumps({"type": "connection_init"}))
-    ws.recv()
-    data = {
-        "id": "d4b0b72a-5b87-4027-b370-a52d4fe55ca4",
-        "type": "subscribe",
-        "payload": {
-            "variables": {
-                "prompt": f"{prompt}",
-                "executionToken": f"{execution_token}",
-                "stateToken": "",
-            },
-            "extensions": {},
-            "operationName": "StartConversation",
-            "query": "subscription StartConversation($executionToken: String!, $itemId: String, $itemDraftId: String, $systemPrompt: String, $prompt: String, $stateToken: String, $variables: [ConversationVariableInput!], $itemCallOption: ItemCallOption, $fileKey: String, $fileUploadIds: [String!], $selectedToolsByUser: [ToolType!]) {\n  startConversation(\n    executionToken: $executionToken\n    itemId: $itemId\n    itemDraftId: $itemDraftId\n    systemPrompt: $systemPrompt\n    prompt: $prompt\n    stateToken: $stateToken\n    variables: $variables\n    itemCallOption: $itemCallOption\n    fileKey: $fileKey\n    fileUploadIds: $fileUploadIds\n    selectedToolsByUser: $selectedToolsByUser\n  ) {\n    ...DeltaConversation\n    __typename\n  }\n}\n\nfragment DeltaConversation on AIConversationStreamResult {\n  seq\n  deltaToken\n  isFinished\n  newStateToken\n  error\n  fileUploadIds\n  toolResult {\n    id\n    title\n    url\n    faviconUrl\n    summary\n    __typename\n  }\n  action\n  activity\n  toolError\n  __typename\n}",
+    payload = {
+        "variables": {
+            "prompt": f"{prompt}",
+            "executionToken": f"{execution_token}",
+            "stateToken": "",
         },
+        "extensions": {},
+        "operationName": "StartConversation",
+        "query": "subscription StartConversation($executionToken: String!, $itemId: String, $itemDraftId: String, $systemPrompt: String, $prompt: String, $stateToken: String, $variables: [ConversationVariableInput!], $itemCallOption: ItemCallOption, $fileKey: String, $fileUploadIds: [String!], $selectedToolsByUser: [ToolType!]) {\n  startConversation(\n    executionToken: $executionToken\n    itemId: $itemId\n    itemDraftId: $itemDraftId\n    systemPrompt: $systemPrompt\n    prompt: $prompt\n    stateToken: $stateToken\n    variables: $variables\n    itemCallOption: $itemCallOption\n    fileKey: $fileKey\n    fileUploadIds: $fileUploadIds\n    selectedToolsByUser: $selectedToolsByUser\n  ) {\n    ...DeltaConversation\n    __typename\n  }\n}\n\nfragment DeltaConversation on AIConversationStreamResult {\n  seq\n  deltaToken\n  isFinished\n  newStateToken\n  error\n  fileUploadIds\n  toolResult {\n    id\n    title\n    url\n    faviconUrl\n    summary\n    __typename\n  }\n  action\n  activity\n  toolError\n  __typename\n}",
     }
-    ws.send(json.dumps(data))
-    ret_content = ""
-    while True:
-        content = ws.recv()
-        json_content = json.loads(content)
-        if json_content.get("type", "") == "complete":
-            break
-        content = (
-            json_content.get("payload", {})
-            .get("data", {})
-            .get("startConversation", {})
-            .get("deltaToken", "")
-        )
-        ret_content += content
-    print(ret_content)
-    return ret_content
+    # One shared connection, every request is a subscription on it
+    ws_client = get_graphql_ws_client(GRAPHQL_WS_URL, headers=WS_HEADERS)
+    return iter_delta_tokens(ws_client.subscribe(payload))
+
+
+async def iter_delta_tokens(subscription):
+    try:
+        async for payload in subscription:
+            yield (
+                payload.get("data", {})
+                .get("startConversation", {})
+                .get("deltaToken", "")
+            )
+    finally:
+        await subscription.aclose()
 
 
 def main():
-    uvicorn.run("tenbin2api:app", host="0.0.0.0", port=10005, reload=True)
+    serve("tenbin2api:app", port=10005)
 
 
 if __name__ == "__main__":
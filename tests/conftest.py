@@ -0,0 +1,70 @@
+import json
+import os
+from typing import Callable
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+# Token counts use the estimate, the tests never download an encoding
+os.environ.setdefault("CHATBRIDGE_TOKENIZER", "approx")
+
+CHAT_PATH = "/v1/chat/completions"
+
+
+def chat_body(*contents: str, **fields) -> dict:
+    """Chat completion body alternating user and assistant messages"""
+    roles = ("user", "assistant")
+    messages = [
+        {"role": roles[index % 2], "content": content}
+        for index, content in enumerate(contents or ("hi",))
+    ]
+    return {"model": "test-model", "messages": messages, **fields}
+
+
+def sse_events(text: str) -> list:
+    """Decoded data: payloads of an SSE body, [DONE] kept as a string"""
+    events = []
+    for line in text.splitlines():
+        if line.startswith("data: "):
+            data = line[len("data: ") :]
+            events.append(data if data == "[DONE]" else json.loads(data))
+    return events
+
+
+async def read_body(response) -> str:
+    """Whole body of a StreamingResponse, chunks may be bytes or str"""
+    parts = []
+    async for chunk in response.body_iterator:
+        parts.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+    return "".join(parts)
+
+
+def content_of(events: list) -> list:
+    """Content deltas of decoded stream chunks"""
+    return [
+        event["choices"][0]["delta"]["content"]
+        for event in events
+        if isinstance(event, dict)
+        and event.get("choices")
+        and event["choices"][0]["delta"].get("content")
+    ]
+
+
+@pytest.fixture
+def serve() -> Callable[..., TestClient]:
+    """TestClient of an app with endpoint on /v1/chat/completions"""
+    clients = []
+
+    def make(endpoint: Callable, lifespan=None) -> TestClient:
+        app = FastAPI(lifespan=lifespan)
+        app.post(CHAT_PATH)(endpoint)
+        client = TestClient(app)
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.__exit__(None, None, None)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.admission import AdmissionController
+from chatbridge.chatbridge import (
+    async_chatCompletions,
+    backend_name,
+    get_admission_stats,
+)
+from chatbridge.metrics import completion_in_flight
+from chatbridge.sessions import get_session_stats
+
+
+async def call_app(app: FastAPI, body: dict, send_message, spec_version: str):
+    """Run one request through the ASGI app with a custom send"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": CHAT_PATH,
+        "raw_path": CHAT_PATH.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    messages = [
+        {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+    ]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    try:
+        await app(scope, receive, send_message)
+    except Exception:
+        # The client is gone, whatever the server raises goes nowhere
+        pass
+
+
+async def stalled_send(message):
+    # The disconnect is noticed while the response head is still being sent
+    await asyncio.sleep(10)
+
+
+async def failing_send(message):
+    raise OSError("connection reset")
+
+
+@pytest.mark.parametrize(
+    "spec_version,send",
+    [("2.0", stalled_send), ("2.4", failing_send)],
+    ids=["listen-for-disconnect", "send-fails"],
+)
+def test_disconnect_before_first_chunk_releases_everything(spec_version, send):
+    started = []
+
+    async def early_disconnect_backend(prompt, res, new_session, session):
+        started.append(True)
+        await asyncio.sleep(0.01)
+        session.handle = "thread"
+        yield "never sent"
+
+    name = backend_name(early_disconnect_backend)
+    app = FastAPI()
+    app.post(CHAT_PATH)(async_chatCompletions(max_in_flight=1)(early_disconnect_backend))
+
+    async def run():
+        for _ in range(3):
+            await call_app(app, chat_body(stream=True), send, spec_version)
+
+    asyncio.run(run())
+    stats = get_admission_stats()[name]
+    assert stats["admitted"] == 3
+    assert stats["rejected"] == 0
+    assert stats["in_flight"] == 0
+    assert completion_in_flight.values[(name,)] == 0
+    assert get_session_stats()[name]["dropped"] == 3
+    assert started == []
+
+
+def test_slot_is_held_until_the_stream_is_sent(serve):
+    async def held_backend(prompt, res, new_session):
+        yield "a"
+        yield "b"
+
+    client = serve(async_chatCompletions(max_in_flight=1)(held_backend))
+    for _ in range(2):
+        response = client.post(CHAT_PATH, json=chat_body(stream=True))
+        assert response.status_code == 200
+    stats = get_admission_stats()["test_admission.held_backend"]
+    assert stats["completed"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_overload_is_rejected_with_retry_after():
+    controller = AdmissionController("overload_test", max_in_flight=1)
+
+    async def run():
+        await controller.acquire()
+        with pytest.raises(HTTPException) as rejected:
+            await controller.acquire()
+        return rejected.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 429
+    assert error.headers["Retry-After"] == "1"
+    assert controller.stats()["rejected"] == 1
+
+
+def test_queued_call_times_out():
+    controller = AdmissionController(
+        "timeout_test", max_in_flight=1, max_queued=1, queue_timeout=0.01
+    )
+
+    async def run():
+        await controller.acquire()
+        with pytest.raises(HTTPException):
+            await controller.acquire()
+
+    asyncio.run(run())
+    assert controller.stats()["timed_out"] == 1
+    assert controller.stats()["queued"] == 0
+
+
+def test_queued_call_gets_the_released_slot():
+    controller = AdmissionController("queue_test", max_in_flight=1, max_queued=1)
+
+    async def run():
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        controller.release(0.0)
+        return await waiter
+
+    assert asyncio.run(run()) >= 0
+    assert controller.stats()["in_flight"] == 1
+
+
+def test_memory_limit_is_shed_with_429():
+    controller = AdmissionController("shed_test", max_in_flight=1, max_rss_mb=0.001)
+
+    async def run():
+        with pytest.raises(HTTPException) as rejected:
+            await controller.acquire()
+        return rejected.value
+
+    assert asyncio.run(run()).status_code == 429
+    assert controller.stats()["shed"] == 1
@@ -0,0 +1,25 @@
+import json
+
+from benchmarks.bench_hotpath import BASELINE_PATH, build_cases, compare, measure
+
+
+def test_every_case_runs():
+    for name, case in build_cases().items():
+        case()
+
+
+def test_baseline_covers_every_case():
+    with open(BASELINE_PATH) as file:
+        baseline = json.load(file)
+    results = baseline.get("results", baseline)
+    assert set(build_cases()) <= set(results)
+
+
+def test_compare_reports_only_slower_cases():
+    baseline = {"fast": 1.0, "slow": 1.0}
+    regressions = compare({"fast": 1.05, "slow": 1.5, "new": 9.0}, baseline, 0.1)
+    assert [name for name, *_ in regressions] == ["slow"]
+
+
+def test_measure_returns_seconds_per_call():
+    assert 0 < measure(lambda: None, min_time=0.001, repeat=2) < 0.001
@@ -0,0 +1,82 @@
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import ChatResponse, chatCompletions
+from chatbridge.contextbudget import ContextBudget
+from chatbridge.transcript import TranscriptBuilder, render_transcript
+
+
+def conversation(*contents: str) -> list:
+    return ChatResponse.model_validate(chat_body(*contents)).messages
+
+
+def test_transcript_within_budget_is_unchanged():
+    budget = ContextBudget(max_chars=10_000, keep_recent=1, compact_chars=10)
+    messages = conversation("x" * 500, "y" * 500, "z")
+    assert budget.build("H", messages) == render_transcript("H", messages)
+    stats = budget.stats()
+    assert stats["builds"] == 1
+    assert stats["within_budget"] == 1
+    assert stats["compacted"] == 0
+    assert stats["saved_chars"] == 0
+
+
+def test_transcript_over_budget_is_compacted():
+    budget = ContextBudget(max_chars=400, keep_recent=1, compact_chars=100)
+    messages = conversation("x" * 500, "y" * 500, "z")
+    prompt = budget.build("H", messages)
+    assert len(prompt) < len(render_transcript("H", messages))
+    assert len(prompt) <= 400
+    assert "[... 400 characters omitted ...]" in prompt
+    assert prompt.endswith("\n\nHuman: z")
+    stats = budget.stats()
+    assert stats["within_budget"] == 0
+    assert stats["over_budget"] == 0
+    assert stats["compacted"] == 2
+    assert stats["saved_chars"] > 0
+
+
+def test_budget_reuses_the_cached_rendering():
+    builder = TranscriptBuilder()
+    budget = ContextBudget(max_chars=10_000)
+    first = conversation("a", "b", "c")
+    second = conversation("a", "b", "c", "d", "e")
+    assert builder.build("", first, budget) == render_transcript("", first)
+    assert builder.build("", second, budget) == render_transcript("", second)
+    assert builder.stats()["hits"] == 1
+    assert builder.stats()["reused_messages"] == 3
+
+
+def test_endpoint_sends_the_full_transcript_within_budget(serve):
+    prompts = []
+
+    def budget_backend(prompt, res, new_session):
+        prompts.append(prompt)
+        return "ok"
+
+    budget = ContextBudget(max_chars=10_000, keep_recent=1, compact_chars=10)
+    client = serve(chatCompletions(1, context_budget=budget)(budget_backend))
+    client.post(CHAT_PATH, json=chat_body("x" * 100, "b", "c"))
+    assert prompts == ["\n\nHuman: " + "x" * 100 + "\n\nAssistant: b\n\nHuman: c"]
+
+
+def test_large_last_message_leaves_less_room_for_older_ones():
+    budget = ContextBudget(max_chars=1500, keep_recent=20)
+    messages = conversation(*(["x" * 300] * 10 + ["z" * 1000]))
+    prompt = budget.build("", messages)
+    assert len(prompt) <= 1500
+    assert prompt.endswith("\n\nHuman: " + "z" * 1000)
+    assert prompt.count("x" * 300) == 1
+    stats = budget.stats()
+    assert stats["dropped"] == 9
+    assert stats["over_budget"] == 0
+
+
+def test_last_message_over_the_limit_is_over_budget():
+    budget = ContextBudget(max_chars=1500, keep_recent=20)
+    messages = conversation(*(["x" * 300] * 10 + ["z" * 2000]))
+    prompt = budget.build("", messages)
+    assert "x" * 300 not in prompt
+    assert prompt.endswith("\n\nHuman: " + "z" * 2000)
+    stats = budget.stats()
+    assert stats["dropped"] == 10
+    assert stats["over_budget"] == 1
@@ -0,0 +1,45 @@
+from chatbridge.chatbridge import FunctionCallDetector
+
+
+CALL = "<function_call><tool>search</tool><args><q>paris</q></args></function_call>"
+
+
+def feed_all(detector: FunctionCallDetector, deltas) -> str:
+    return "".join(detector.feed(delta) for delta in deltas)
+
+
+def test_plain_text_passes_through():
+    detector = FunctionCallDetector()
+    assert feed_all(detector, ["Hello", " wor", "ld"]) == "Hello world"
+    assert detector.finish() == ("", [])
+
+
+def test_fc_use_turn_is_held_and_parsed():
+    detector = FunctionCallDetector()
+    assert feed_all(detector, ["FC", "_USE\n", CALL[:20], CALL[20:]]) == ""
+    text, calls = detector.finish()
+    assert text == ""
+    assert calls == [{"function_name": "search", "arguments": {"q": "paris"}}]
+
+
+def test_marker_prefix_waits_for_more_text():
+    detector = FunctionCallDetector()
+    assert detector.feed("FC") == ""
+    assert detector.feed("C is a club") == "FCC is a club"
+
+
+def test_call_after_text_is_held_back():
+    detector = FunctionCallDetector()
+    sent = feed_all(detector, ["Let me check. FC_USE ", "<function", "_call>", CALL[15:]])
+    assert sent == "Let me check. FC_USE "
+    text, calls = detector.finish()
+    assert text == ""
+    assert calls[0]["function_name"] == "search"
+
+
+def test_unparsable_call_is_released_as_text():
+    detector = FunctionCallDetector()
+    sent = feed_all(detector, ["See <function_call>", " not a call"])
+    text, calls = detector.finish()
+    assert calls == []
+    assert sent + text == "See <function_call> not a call"
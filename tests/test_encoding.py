@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from chatbridge.chatbridge import (
+    FINISH_REASON_NULL,
+    FINISH_REASON_STOP,
+    OBJECT_CHAT_COMPLETION_CHUNK,
+    PROVIDER_CHUTES,
+    CompletionRes,
+    FastJSONResponse,
+    PydanticChunkEncoder,
+    build_stream_chunk,
+    create_usage_dict,
+    normal_body,
+)
+from chatbridge.encoding import ChunkTemplate
+
+
+def template(model: str = "gpt-4o") -> ChunkTemplate:
+    return ChunkTemplate(
+        "chatcmpl-1",
+        PROVIDER_CHUTES,
+        model,
+        OBJECT_CHAT_COMPLETION_CHUNK,
+        1700000000,
+        FINISH_REASON_NULL,
+    )
+
+
+@pytest.mark.parametrize("text", ["hello", "", 'quote " and \\ slash', "中文 ✓", "a\nb"])
+def test_content_chunk_matches_pydantic(text):
+    expected = build_stream_chunk(
+        "chatcmpl-1", "gpt-4o", 1700000000, {"content": text}
+    )
+    assert json.loads(template().content(text)[6:]) == json.loads(expected[6:])
+
+
+def test_encode_matches_pydantic_per_finish_reason():
+    chunks = template()
+    for delta, finish_reason in [
+        ({"role": "assistant", "content": ""}, FINISH_REASON_NULL),
+        ({}, FINISH_REASON_STOP),
+    ]:
+        expected = build_stream_chunk(
+            "chatcmpl-1", "gpt-4o", 1700000000, delta, finish_reason
+        )
+        assert json.loads(chunks.encode(delta, finish_reason)[6:]) == json.loads(
+            expected[6:]
+        )
+
+
+def test_usage_chunk_matches_pydantic():
+    usage = create_usage_dict(3, 4)
+    expected = PydanticChunkEncoder("chatcmpl-1", "gpt-4o", 1700000000).usage(usage)
+    assert json.loads(template().usage(usage)[6:]) == json.loads(expected[6:])
+
+
+def test_chunks_are_complete_sse_events():
+    chunk = template('model "x"').content("hi")
+    assert chunk.startswith(b"data: {")
+    assert chunk.endswith(b"}\n\n")
+    assert json.loads(chunk[6:])["model"] == 'model "x"'
+
+
+def test_fast_json_response_matches_the_model():
+    body = normal_body("gpt-4o", "héllo")
+    response = FastJSONResponse(body)
+    assert json.loads(response.body) == json.loads(
+        CompletionRes(**body).model_dump_json()
+    )
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import chatCompletions
+from chatbridge.executor import BackendExecutor, get_executor_stats
+
+
+def test_sync_backend_runs_on_its_own_pool(serve):
+    threads = []
+
+    def pooled_backend(prompt, res, new_session):
+        threads.append(threading.current_thread().name)
+        return "ok"
+
+    client = serve(chatCompletions(max_workers=2)(pooled_backend))
+    assert client.post(CHAT_PATH, json=chat_body()).status_code == 200
+    assert threads[0].startswith("chatbridge-test_executor.pooled_backend")
+    stats = get_executor_stats()["test_executor.pooled_backend"]
+    assert stats["max_workers"] == 2
+    assert stats["completed"] == 1
+    assert stats["queued"] == 0
+
+
+def test_iterate_closes_an_abandoned_generator():
+    executor = BackendExecutor("iterate_test", 1)
+    closed = []
+
+    def numbers():
+        try:
+            yield from range(10)
+        finally:
+            closed.append(threading.current_thread().name)
+
+    async def take_two():
+        items = executor.iterate(numbers())
+        taken = [await items.__anext__(), await items.__anext__()]
+        await items.aclose()
+        return taken
+
+    assert asyncio.run(take_two()) == [0, 1]
+    assert closed and closed[0].startswith("chatbridge-iterate_test")
+    executor.shutdown()
+
+
+def test_failures_are_counted():
+    executor = BackendExecutor("failing_test", 1)
+
+    def fail():
+        raise ValueError("boom")
+
+    async def run():
+        try:
+            await executor.run(fail)
+        except ValueError:
+            pass
+
+    asyncio.run(run())
+    assert executor.stats()["failed"] == 1
+    executor.shutdown()
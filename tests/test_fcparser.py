@@ -0,0 +1,54 @@
+from chatbridge.fcparser import scan_function_calls
+
+
+def test_single_call():
+    text = "FC_USE\n<function_call><tool>search</tool><args><q>paris</q><n>5</n></args></function_call>"
+    assert scan_function_calls(text) == [
+        {"function_name": "search", "arguments": {"q": "paris", "n": "5"}}
+    ]
+
+
+def test_several_calls_in_one_reply():
+    text = (
+        "<function_call><tool>a</tool><args><x>1</x></args></function_call>"
+        "and then"
+        "<function_call><tool>b</tool><args><empty>no arguments</empty></args></function_call>"
+    )
+    assert scan_function_calls(text) == [
+        {"function_name": "a", "arguments": {"x": "1"}},
+        {"function_name": "b", "arguments": {}},
+    ]
+
+
+def test_nested_and_repeated_arguments():
+    text = (
+        "<function_call><tool>book</tool><args>"
+        "<guest><name>Ann</name><age>30</age></guest>"
+        "<tag>a</tag><tag>b</tag>"
+        "</args></function_call>"
+    )
+    arguments = scan_function_calls(text)[0]["arguments"]
+    assert arguments == {"guest": {"name": "Ann", "age": "30"}, "tag": ["a", "b"]}
+
+
+def test_cdata_and_stray_brackets_stay_text():
+    text = (
+        "<function_call><tool>run</tool><args>"
+        "<code><![CDATA[if a < b: print('</code>')]]></code><cmp>1 < 2</cmp>"
+        "</args></function_call>"
+    )
+    arguments = scan_function_calls(text)[0]["arguments"]
+    assert arguments == {"code": "if a < b: print('</code>')", "cmp": "1 < 2"}
+
+
+def test_unclosed_block_is_closed_by_the_next_one():
+    text = (
+        "<function_call><tool>first</tool><args><q>x"
+        "<function_call><tool>second</tool><args></args></function_call>"
+    )
+    names = [call["function_name"] for call in scan_function_calls(text)]
+    assert names == ["first", "second"]
+
+
+def test_text_without_calls():
+    assert scan_function_calls("no calls <b>here</b>") == []
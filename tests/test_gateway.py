@@ -0,0 +1,150 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.exceptions import RequestValidationError
+from fastapi.testclient import TestClient
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import (
+    ChatEnvelope,
+    ChatResponse,
+    Messages,
+    async_chatCompletions,
+    async_get_model_list,
+    chatCompletions,
+    get_admission_stats,
+    get_executor_stats,
+    parse_lazy_request,
+    validate_request,
+)
+from chatbridge.gateway import Gateway
+
+IMAGE = "data:image/png;base64," + "A" * 8192
+
+
+@pytest.fixture
+def gateway():
+    seen = {}
+
+    @async_chatCompletions(aliases={"alpha-latest": "alpha-1"})
+    async def alpha(prompt, res, new_session):
+        seen["alpha"] = res
+        yield "from alpha"
+
+    @chatCompletions(lazy_parse=False)
+    def beta(prompt, res, new_session):
+        seen["beta"] = res
+        return "from beta"
+
+    @async_get_model_list
+    async def alpha_models():
+        return [("alpha-1", "alpha"), ("shared", "alpha")]
+
+    @async_get_model_list
+    async def beta_models():
+        return [("beta-1", "beta"), ("shared", "beta")]
+
+    gateway = Gateway()
+    gateway.add(alpha, alpha_models)
+    gateway.add(beta, beta_models)
+    with TestClient(gateway.app()) as client:
+        yield gateway, client, seen
+
+
+def reply_of(response) -> str:
+    assert response.status_code == 200, response.text
+    return response.json()["choices"][0]["message"]["content"]
+
+
+def test_requests_are_routed_by_model(gateway):
+    _, client, seen = gateway
+    assert reply_of(client.post(CHAT_PATH, json=chat_body(model="alpha-1"))) == "from alpha"
+    assert reply_of(client.post(CHAT_PATH, json=chat_body(model="beta-1"))) == "from beta"
+    # A shared model goes to the backend registered first
+    assert reply_of(client.post(CHAT_PATH, json=chat_body(model="shared"))) == "from alpha"
+    assert reply_of(client.post(CHAT_PATH, json=chat_body(model="test_gateway.beta/shared"))) == "from beta"
+    assert seen["beta"].model == "shared"
+
+
+def test_aliases_are_routed(gateway):
+    _, client, _ = gateway
+    assert reply_of(client.post(CHAT_PATH, json=chat_body(model="alpha-latest"))) == "from alpha"
+
+
+def test_unknown_model_is_404(gateway):
+    gateway_, client, _ = gateway
+    response = client.post(CHAT_PATH, json=chat_body(model="nope"))
+    assert response.status_code == 404
+    assert gateway_.stats()["unknown"] == 1
+
+
+def test_eager_backend_gets_a_validated_request(gateway):
+    _, client, seen = gateway
+    content = [
+        {"type": "image_url", "image_url": {"url": IMAGE}},
+        {"type": "text", "text": "what is this"},
+    ]
+    body = {"model": "beta-1", "messages": [{"role": "user", "content": content}]}
+    reply_of(client.post(CHAT_PATH, json=body))
+    res = seen["beta"]
+    assert isinstance(res, ChatResponse)
+    assert res.messages[0].content[0]["image_url"]["url"] == IMAGE
+
+
+def test_model_list_is_merged_with_an_etag(gateway):
+    _, client, _ = gateway
+    response = client.get("/v1/models")
+    assert [model["id"] for model in response.json()["data"]] == [
+        "alpha-1",
+        "shared",
+        "beta-1",
+    ]
+    etag = response.headers["ETag"]
+    cached = client.get("/v1/models", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+
+def test_validate_request_reports_invalid_messages():
+    body = json.dumps({"model": "m", "messages": [{"role": "user"}]}).encode()
+    envelope = parse_lazy_request(body, ChatEnvelope, Messages)
+    with pytest.raises(RequestValidationError) as error:
+        validate_request(envelope, ChatResponse)
+    assert error.value.errors()[0]["loc"][:3] == ("body", "messages", 0)
+
+
+def adapter(module: str, model_id: str) -> FastAPI:
+    """Adapter app of module whose backend is named chat, like the real ones"""
+
+    async def chat(prompt, res, new_session):
+        yield f"from {module}"
+
+    async def get_models():
+        return [(model_id, module)]
+
+    chat.__module__ = get_models.__module__ = module
+    app = FastAPI(title=module)
+    app.post(CHAT_PATH)(async_chatCompletions(max_in_flight=4)(chat))
+    app.get("/v1/models")(async_get_model_list(get_models))
+    return app
+
+
+def test_adapters_with_the_same_backend_name():
+    gateway = Gateway()
+    gateway.include(adapter("first2api", "first-1"))
+    gateway.include(adapter("second2api", "second-1"))
+    with TestClient(gateway.app()) as client:
+        assert reply_of(client.post(CHAT_PATH, json=chat_body(model="first-1"))) == (
+            "from first2api"
+        )
+        assert reply_of(client.post(CHAT_PATH, json=chat_body(model="second-1"))) == (
+            "from second2api"
+        )
+        explicit = chat_body(model="second2api.chat/second-1")
+        assert reply_of(client.post(CHAT_PATH, json=explicit)) == "from second2api"
+    assert set(gateway.stats()["backends"]) == {"first2api.chat", "second2api.chat"}
+    admission = get_admission_stats()
+    assert admission["first2api.chat"]["completed"] == 1
+    assert admission["second2api.chat"]["completed"] == 2
+    assert {"first2api.chat", "second2api.chat"} <= set(get_executor_stats())
@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import pytest
+from websockets.asyncio.server import serve
+
+from chatbridge.graphqlws import GRAPHQL_WS_PROTOCOL, GraphQLWSClient, GraphQLWSError
+
+
+def graphql_server(on_subscribe):
+    """Local graphql-transport-ws server calling on_subscribe(ws, message)"""
+
+    async def handler(ws):
+        async for raw in ws:
+            message = json.loads(raw)
+            if message["type"] == "connection_init":
+                await ws.send(json.dumps({"type": "connection_ack"}))
+            elif message["type"] == "subscribe":
+                await on_subscribe(ws, message)
+
+    return serve(handler, "127.0.0.1", 0, subprotocols=[GRAPHQL_WS_PROTOCOL])
+
+
+def url_of(server) -> str:
+    host, port = server.sockets[0].getsockname()[:2]
+    return f"ws://{host}:{port}"
+
+
+async def collect(client: GraphQLWSClient, payload: dict) -> list:
+    return [data async for data in client.subscribe(payload)]
+
+
+async def echo(ws, message):
+    prompt = message["payload"]["prompt"]
+    for part in (prompt, "!"):
+        await ws.send(json.dumps({"id": message["id"], "type": "next", "payload": part}))
+    await ws.send(json.dumps({"id": message["id"], "type": "complete"}))
+
+
+def test_subscriptions_share_one_connection():
+    async def run():
+        async with graphql_server(echo) as server:
+            client = GraphQLWSClient(url_of(server))
+            results = await asyncio.gather(
+                collect(client, {"prompt": "a"}), collect(client, {"prompt": "b"})
+            )
+            await client.aclose()
+            return results, client.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == [["a", "!"], ["b", "!"]]
+    assert stats["connects"] == 1
+    assert stats["subscriptions"] == 2
+    assert stats["peak_active"] == 2
+
+
+def test_server_errors_raise():
+    async def reject(ws, message):
+        error = {"id": message["id"], "type": "error", "payload": [{"message": "no"}]}
+        await ws.send(json.dumps(error))
+
+    async def run():
+        async with graphql_server(reject) as server:
+            client = GraphQLWSClient(url_of(server))
+            try:
+                with pytest.raises(GraphQLWSError) as error:
+                    await collect(client, {})
+            finally:
+                await client.aclose()
+            return error.value, client.stats()
+
+    error, stats = asyncio.run(run())
+    assert error.errors == [{"message": "no"}]
+    assert stats["failed"] == 1
+
+
+def test_malformed_message_is_skipped():
+    async def garbled(ws, message):
+        await ws.send("not json")
+        await echo(ws, message)
+
+    async def run():
+        async with graphql_server(garbled) as server:
+            client = GraphQLWSClient(url_of(server))
+            result = await collect(client, {"prompt": "a"})
+            await client.aclose()
+            return result, client.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == ["a", "!"]
+    assert stats["malformed"] == 1
+    assert stats["disconnects"] == 0
+
+
+def test_resubscribing_gives_up_after_the_cap():
+    async def hang_up(ws, message):
+        await ws.close()
+
+    async def run():
+        async with graphql_server(hang_up) as server:
+            client = GraphQLWSClient(url_of(server), resubscribe_attempts=2)
+            try:
+                with pytest.raises(ConnectionError):
+                    await collect(client, {})
+            finally:
+                await client.aclose()
+            return client.stats()
+
+    stats = asyncio.run(run())
+    assert stats["resubscribed"] == 2
+    assert stats["connects"] == 3
+    assert stats["failed"] == 1
@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+
+from chatbridge import httppool
+from chatbridge.httppool import HTTPClientPool, get_http_client, http_lifespan, origin_of
+
+
+def test_origin_of():
+    assert origin_of("https://api.example.com/v1/chat") == "https://api.example.com:443"
+    assert origin_of("http://localhost:8080/x?y=1") == "http://localhost:8080"
+    assert origin_of("example.com/path") == "https://example.com:443"
+
+
+def test_one_client_per_host():
+    pool = HTTPClientPool()
+    first = pool.client("https://a.example.com/one")
+    assert pool.client("https://a.example.com/two") is first
+    assert pool.client("https://b.example.com/") is not first
+    assert set(pool.stats()) == {"https://a.example.com:443", "https://b.example.com:443"}
+    asyncio.run(pool.aclose())
+    assert first.is_closed
+    assert pool.stats() == {}
+
+
+def test_closed_client_is_replaced():
+    pool = HTTPClientPool()
+    client = pool.client("https://a.example.com/")
+    asyncio.run(client.aclose())
+    assert pool.client("https://a.example.com/") is not client
+    asyncio.run(pool.aclose())
+
+
+def test_lifespan_closes_the_shared_pool():
+    async def run():
+        async with http_lifespan(max_connections_per_host=4)(None):
+            client = get_http_client("https://a.example.com/")
+            assert httppool.http_pool.limits.max_connections == 4
+        return client
+
+    assert asyncio.run(run()).is_closed
+
+
+def test_requests_and_server_errors_are_counted():
+    pool = HTTPClientPool()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503 if request.url.path == "/down" else 200)
+
+    async def run():
+        client = pool.client("http://mock.test/")
+        # Swap the network transport for a mock, keeping the pool's hooks
+        client._transport = httppool.TracingTransport(httpx.MockTransport(handler))
+        await client.get("http://mock.test/up")
+        await client.get("http://mock.test/down")
+        await pool.aclose()
+
+    asyncio.run(run())
+    assert pool.requests["http://mock.test:80"] == 2
+    assert pool.errors["http://mock.test:80"] == 1
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+from fastapi.exceptions import RequestValidationError
+
+from conftest import chat_body
+
+from chatbridge.chatbridge import ChatEnvelope, Messages
+from chatbridge.lazyrequest import BlobRef, extract_blobs, parse_lazy_request
+
+
+IMAGE = "data:image/png;base64," + "A" * 8192
+
+
+def image_message(url: str = IMAGE) -> dict:
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": "what is this"},
+            {"type": "image_url", "image_url": {"url": url}},
+        ],
+    }
+
+
+def test_messages_are_validated_on_access():
+    body = json.dumps(chat_body("a", "b", "c", stream=True)).encode()
+    res = parse_lazy_request(body, ChatEnvelope, Messages)
+    assert res.stream is True
+    assert len(res.messages) == 3
+    assert res.messages.materialized() == 0
+    assert res.messages[-1].content == "c"
+    assert res.messages.materialized() == 1
+    assert [message.role for message in res.messages] == ["user", "assistant", "user"]
+
+
+def test_large_data_urls_stay_in_the_body():
+    body = json.dumps({"model": "m", "messages": [image_message()]}).encode()
+    res = parse_lazy_request(body, ChatEnvelope, Messages)
+    url = res.messages[0].content[1]["image_url"]["url"]
+    assert isinstance(url, BlobRef)
+    assert len(url) == len(IMAGE)
+    assert str(url) == IMAGE
+
+
+def test_small_data_urls_are_parsed_normally():
+    small = "data:image/png;base64,AAAA"
+    body = json.dumps({"model": "m", "messages": [image_message(small)]}).encode()
+    stripped, blobs = extract_blobs(body)
+    assert blobs == []
+    assert stripped is body
+
+
+def test_invalid_message_reports_its_location():
+    body = json.dumps({"model": "m", "messages": [{"role": "user"}]}).encode()
+    res = parse_lazy_request(body, ChatEnvelope, Messages)
+    with pytest.raises(RequestValidationError) as error:
+        res.messages[0]
+    assert error.value.errors()[0]["loc"][:3] == ("body", "messages", 0)
+
+
+def test_invalid_envelope_fails_right_away():
+    with pytest.raises(RequestValidationError):
+        parse_lazy_request(b'{"model": "m"}', ChatEnvelope, Messages)
@@ -0,0 +1,50 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_upstream import GRAPHQL_WS_PROTOCOL, create_app
+from benchmarks.loadtest import percentile, synthetic_trace
+
+
+def test_percentile():
+    assert percentile([], 0.5) is None
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 51
+    assert percentile(values, 0.99) == 100
+    assert percentile([3, 1, 2], 0.0) == 1
+
+
+def test_synthetic_trace_is_reproducible():
+    first = synthetic_trace(20, [1, 4], 50, 0.5, seed=7)
+    assert first == synthetic_trace(20, [1, 4], 50, 0.5, seed=7)
+    for body in first:
+        roles = [message["role"] for message in body["messages"]]
+        assert roles[0] == "system" and roles[-1] == "user"
+        assert len(roles) in (2, 8)
+
+
+def test_fake_upstream_streams_sse_and_ndjson():
+    client = TestClient(create_app(tokens=5))
+    sse = client.post("/v1/chat/completions", json={"max_tokens": 3}).text
+    events = [line[6:] for line in sse.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    assert len(events) == 4
+    lines = client.post("/ndjson", json={}).text.splitlines()
+    assert len(lines) == 6
+    assert json.loads(lines[-1]) == {"done": True}
+
+
+def test_fake_upstream_injects_errors():
+    client = TestClient(create_app(error_rate=1.0))
+    assert client.post("/v1/chat/completions", json={}).status_code == 500
+    assert client.get("/health").json()["errors"] == 1
+
+
+def test_fake_upstream_speaks_graphql_ws():
+    client = TestClient(create_app(tokens=2))
+    with client.websocket_connect("/graphql", subprotocols=[GRAPHQL_WS_PROTOCOL]) as ws:
+        ws.send_text(json.dumps({"type": "connection_init"}))
+        assert json.loads(ws.receive_text())["type"] == "connection_ack"
+        ws.send_text(json.dumps({"id": "1", "type": "subscribe", "payload": {}}))
+        kinds = [json.loads(ws.receive_text())["type"] for _ in range(3)]
+    assert kinds == ["next", "next", "complete"]
@@ -0,0 +1,78 @@
+import asyncio
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge import graphqlws  # noqa: F401, registers its metrics on import
+from chatbridge.chatbridge import async_chatCompletions, async_get_model_list
+from chatbridge.metrics import (
+    MODEL_OTHER,
+    MetricsRegistry,
+    completion_requests,
+    metrics_endpoint,
+)
+from chatbridge.poller import Poller
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("h_seconds", "test", ("backend",), (0.1, 1.0))
+    histogram.observe(("b",), 0.05)
+    histogram.observe(("b",), 0.5)
+    histogram.observe(("b",), 5)
+    text = registry.render()
+    assert 'h_seconds_bucket{backend="b",le="0.1"} 1' in text
+    assert 'h_seconds_bucket{backend="b",le="1.0"} 2' in text
+    assert 'h_seconds_bucket{backend="b",le="+Inf"} 3' in text
+    assert 'h_seconds_count{backend="b"} 3' in text
+    assert text.endswith("# EOF\n")
+
+
+def test_collected_metrics_are_read_at_render():
+    registry = MetricsRegistry()
+    state = {"a": {"calls": 1}}
+    registry.collect_stats("x", lambda: state, "name", {"calls": ("counter", "calls")})
+    assert 'x_calls_total{name="a"} 1.0' in registry.render()
+    state["a"]["calls"] = 2
+    assert 'x_calls_total{name="a"} 2.0' in registry.render()
+
+
+def test_unknown_models_share_one_label(serve):
+    @async_get_model_list
+    async def labelled_models():
+        return [("listed-model", "test")]
+
+    async def labelled_backend(prompt, res, new_session):
+        yield "ok"
+
+    endpoint = async_chatCompletions(aliases={"alias-model": "upstream-model"})(
+        labelled_backend
+    )
+    client = serve(endpoint)
+    client.app.get("/v1/models")(labelled_models)
+    client.get("/v1/models")
+    for model in ("listed-model", "alias-model", "random-1", "random-2"):
+        client.post(CHAT_PATH, json=chat_body(model=model))
+    name = "test_metrics.labelled_backend"
+    models = {labels[1] for labels in completion_requests.values if labels[0] == name}
+    assert models == {"listed-model", "alias-model", MODEL_OTHER}
+
+
+def test_metrics_endpoint_includes_module_stats():
+    poller = Poller("metrics_poller", initial_delay=0.001)
+
+    async def check():
+        return True
+
+    asyncio.run(poller.poll(check))
+    text = metrics_endpoint().body.decode()
+    for name in (
+        "chatbridge_executor_active",
+        "chatbridge_admission_in_flight",
+        "chatbridge_response_cache_hit_ratio",
+        "chatbridge_single_flight_coalesced",
+        "chatbridge_http_pool_requests",
+        "chatbridge_graphql_ws_active",
+        "chatbridge_loop_stall_seconds",
+    ):
+        assert f"# TYPE {name} " in text
+    assert 'chatbridge_poll_seconds_count{poller="metrics_poller"} 1' in text
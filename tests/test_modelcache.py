@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from chatbridge.modelcache import ModelRegistry, etag_matches
+
+
+def test_etag_matches():
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('W/"a", "b"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"b"', '"a"')
+    assert not etag_matches(None, '"a"')
+
+
+def test_list_is_fetched_once_and_served_with_an_etag():
+    calls = []
+
+    async def fetch():
+        calls.append(True)
+        return [("m1", "owner")]
+
+    registry = ModelRegistry("fetched_once", fetch)
+
+    async def run():
+        first = await registry.respond()
+        second = await registry.respond(first.headers["ETag"])
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.status_code == 200
+    assert b'"m1"' in first.body
+    assert second.status_code == 304
+    assert len(calls) == 1
+    assert registry.stats()["not_modified"] == 1
+
+
+def test_concurrent_first_requests_share_one_fetch():
+    calls = []
+
+    async def fetch():
+        calls.append(True)
+        await asyncio.sleep(0.01)
+        return [("m1", "owner")]
+
+    registry = ModelRegistry("one_fetch", fetch)
+
+    async def run():
+        await asyncio.gather(*(registry.get() for _ in range(5)))
+
+    asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_stale_list_is_served_while_refreshing():
+    lists = iter([[("old", "o")], [("new", "o")]])
+
+    async def fetch():
+        return next(lists)
+
+    registry = ModelRegistry("stale", fetch, ttl=0.01, refresh_ahead=0.5)
+
+    async def run():
+        await registry.get()
+        await asyncio.sleep(0.02)
+        stale = await registry.get()
+        await registry.task
+        return stale, await registry.get()
+
+    stale, fresh = asyncio.run(run())
+    assert stale["data"][0]["id"] == "old"
+    assert fresh["data"][0]["id"] == "new"
+    assert registry.stats()["stale_served"] >= 1
+
+
+def test_failed_refresh_keeps_the_last_good_list():
+    results = iter([[("m1", "o")], {"error": "down"}])
+
+    async def fetch():
+        return next(results)
+
+    registry = ModelRegistry("failed_refresh", fetch)
+
+    async def run():
+        await registry.refresh()
+        etag = registry.etag
+        await registry.refresh()
+        return etag
+
+    etag = asyncio.run(run())
+    assert registry.etag == etag
+    assert registry.model_ids == [("m1", "o")]
+    assert registry.stats()["failures"] == 1
+
+
+def test_first_fetch_failure_is_a_502():
+    async def fetch():
+        raise ConnectionError("unreachable")
+
+    registry = ModelRegistry("unavailable", fetch)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(registry.get())
+    assert error.value.status_code == 502
@@ -0,0 +1,75 @@
+import asyncio
+from itertools import islice
+
+import pytest
+
+from chatbridge.poller import Poller, get_poller
+
+
+def fast_poller(name: str, **options) -> Poller:
+    return Poller(name, initial_delay=0.001, max_delay=0.004, **options)
+
+
+def test_delays_back_off_up_to_the_maximum():
+    poller = Poller("delays", initial_delay=0.1, max_delay=1.0, backoff=2.0, jitter=0)
+    assert list(islice(poller.delays(), 6)) == [0.1, 0.2, 0.4, 0.8, 1.0, 1.0]
+
+
+def test_jitter_stays_within_bounds():
+    poller = Poller("jitter", initial_delay=1.0, max_delay=1.0, jitter=0.2)
+    assert all(0.8 <= delay <= 1.2 for delay in islice(poller.delays(), 50))
+
+
+def test_poll_until_done():
+    poller = fast_poller("done")
+    results = iter(["running", "running", "done"])
+
+    async def check():
+        return next(results)
+
+    assert asyncio.run(poller.poll(check, lambda status: status == "done")) == "done"
+    stats = poller.stats()
+    assert stats["completed"] == 1
+    assert stats["polls"] == 3
+    assert stats["poll_latency_buckets"]["+Inf"] == 3
+
+
+def test_deadline_raises_timeout():
+    poller = fast_poller("deadline")
+
+    async def check():
+        return None
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(poller.poll(check, deadline=0.02))
+    assert poller.stats()["timed_out"] == 1
+
+
+def test_push_wins_over_polling():
+    poller = Poller("push", initial_delay=10)
+
+    async def check():
+        return "polled"
+
+    async def push():
+        return "pushed"
+
+    assert asyncio.run(poller.poll(check, push=push)) == "pushed"
+    assert poller.stats()["pushed"] == 1
+
+
+def test_failed_push_falls_back_to_polling():
+    poller = fast_poller("push_failed")
+
+    async def check():
+        return "polled"
+
+    async def push():
+        raise ConnectionError("no stream")
+
+    assert asyncio.run(poller.poll(check, push=push)) == "polled"
+    assert poller.stats()["pushed"] == 0
+
+
+def test_get_poller_is_shared_per_name():
+    assert get_poller("shared_poller") is get_poller("shared_poller")
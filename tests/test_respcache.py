@@ -0,0 +1,101 @@
+import asyncio
+
+from starlette.datastructures import Headers
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import async_chatCompletions
+from chatbridge.respcache import (
+    CACHE_HEADER,
+    ResponseCache,
+    cache_directives,
+)
+
+
+def test_memory_tier_hit_and_miss():
+    cache = ResponseCache()
+
+    async def run():
+        assert await cache.get("k") is None
+        cache.put("k", "reply")
+        return await cache.get("k")
+
+    assert asyncio.run(run()) == "reply"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_expired_entries_are_dropped():
+    cache = ResponseCache(ttl=-1)
+
+    async def run():
+        cache.put("k", "reply")
+        return await cache.get("k")
+
+    assert asyncio.run(run()) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_disk_writes_are_batched(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(path=path, flush_interval=0.05)
+
+    async def run():
+        for i in range(5):
+            cache.put("k%d" % i, "reply %d" % i)
+        assert cache.stats()["disk_pending"] == 5
+        # Pending replies are served before they reach the disk
+        cache.entries.clear()
+        assert await cache.get("k0") == "reply 0"
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert stats["disk_pending"] == 0
+    assert stats["disk_flushes"] == 1
+
+    reopened = ResponseCache(path=path)
+    assert asyncio.run(reopened.get("k4")) == "reply 4"
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_put_outside_a_loop_writes_right_away(tmp_path):
+    path = str(tmp_path / "responses.db")
+    ResponseCache(path=path).put("k", "reply")
+    assert asyncio.run(ResponseCache(path=path).get("k")) == "reply"
+
+
+def test_cache_directives():
+    assert cache_directives(None) == (True, True)
+    assert cache_directives(Headers({"Cache-Control": "no-cache"})) == (False, True)
+    assert cache_directives(Headers({"Cache-Control": "no-store"})) == (False, False)
+    assert cache_directives(Headers({CACHE_HEADER: "refresh"})) == (False, True)
+    assert cache_directives(Headers({CACHE_HEADER: "bypass"})) == (False, False)
+
+
+def test_second_request_is_served_from_the_cache(serve):
+    calls = []
+
+    async def cached_backend(prompt, res, new_session):
+        calls.append(prompt)
+        yield "cached reply"
+
+    client = serve(async_chatCompletions(response_cache=ResponseCache())(cached_backend))
+    body = chat_body("hi", temperature=0)
+    first = client.post(CHAT_PATH, json=body)
+    second = client.post(CHAT_PATH, json=body)
+    assert first.headers[CACHE_HEADER] == "miss"
+    assert second.headers[CACHE_HEADER] == "hit"
+    assert second.json()["choices"][0]["message"]["content"] == "cached reply"
+    assert len(calls) == 1
+
+
+def test_no_cache_header_without_a_cache(serve):
+    async def uncached_backend(prompt, res, new_session):
+        yield "reply"
+
+    client = serve(async_chatCompletions()(uncached_backend))
+    response = client.post(CHAT_PATH, json=chat_body("hi"))
+    assert response.status_code == 200
+    assert CACHE_HEADER not in response.headers
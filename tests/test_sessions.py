@@ -0,0 +1,154 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import Messages, async_chatCompletions
+from chatbridge import launcher
+from chatbridge.sessions import SessionStore, turn_prompt
+from chatbridge.sharedstore import SHARED_STORE_ENV, SQLiteStore
+from chatbridge.transcript import TranscriptBuilder
+
+
+def keys_of(*contents: str) -> tuple:
+    messages = chat_body(*contents)["messages"]
+    messages = [Messages(**message) for message in messages]
+    return TranscriptBuilder().prefix_keys("header", messages), messages
+
+
+def test_turn_prompt_sends_only_new_messages():
+    messages = [Messages(role="user", content="next question")]
+    assert turn_prompt(messages) == "next question"
+    messages = [
+        Messages(role="assistant", content="seen"),
+        Messages(role="system", content="be brief"),
+        Messages(role="user", content="next"),
+    ]
+    prompt = turn_prompt(messages)
+    assert "seen" not in prompt
+    assert "be brief" in prompt and "next" in prompt
+
+
+def test_next_turn_resumes_the_session(serve):
+    handles = []
+
+    async def threaded_backend(prompt, res, new_session, session):
+        if session.handle is None:
+            session.handle = "thread-%d" % len(handles)
+        handles.append((session.handle, new_session, prompt))
+        yield "reply %d" % len(handles)
+
+    client = serve(async_chatCompletions()(threaded_backend))
+    client.post(CHAT_PATH, json=chat_body("first"))
+    client.post(CHAT_PATH, json=chat_body("first", "reply 1", "second"))
+    client.post(CHAT_PATH, json=chat_body("other"))
+    assert handles[0][0] == handles[1][0] == "thread-0"
+    assert handles[1][1] is False
+    assert handles[1][2] == "second"
+    assert handles[2][0] == "thread-2"
+
+
+def test_failed_turn_drops_the_session():
+    store = SessionStore("failed")
+    keys, messages = keys_of("first")
+
+    async def run():
+        turn = await store.begin(keys, messages)
+        turn.session.handle = "thread"
+        turn.finish(False)
+        return store.find(*keys_of("first", "reply", "second"))
+
+    assert asyncio.run(run()) == (0, None)
+    assert store.stats()["dropped"] == 1
+
+
+def test_concurrent_turns_are_serialized():
+    store = SessionStore("serialized")
+    first_keys, first = keys_of("first")
+    next_keys, following = keys_of("first", "reply", "second")
+
+    async def run():
+        turn = await store.begin(first_keys, first)
+        turn.session.handle = "thread"
+        turn.finish(True)
+        resumed = await store.begin(next_keys, following)
+        waiting = asyncio.create_task(store.begin(next_keys, following))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        resumed.finish(False)
+        return resumed, await waiting
+
+    resumed, waiting = asyncio.run(run())
+    assert resumed.resumed
+    # The session was dropped by the first turn, the second starts anew
+    assert not waiting.resumed
+    assert store.stats()["lock_waits"] == 1
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore("evicted", maxsize=1)
+
+    async def run():
+        for content in ("a", "b"):
+            keys, messages = keys_of(content)
+            turn = await store.begin(keys, messages)
+            turn.session.handle = content
+            turn.finish(True)
+
+    asyncio.run(run())
+    stats = store.stats()
+    assert stats["size"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_prefix_keys_are_stable_across_processes():
+    script = (
+        "from chatbridge.chatbridge import Messages\n"
+        "from chatbridge.transcript import TranscriptBuilder\n"
+        "messages = [Messages(role='user', content='hi')]\n"
+        "print(TranscriptBuilder().prefix_keys('header', messages)[0][1].hex())\n"
+    )
+    digests = set()
+    for seed in ("1", "2"):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH="src")
+        result = subprocess.run(
+            [sys.executable, "-c", script], env=env, capture_output=True, text=True
+        )
+        assert result.returncode == 0, result.stderr
+        digests.add(result.stdout.strip())
+    keys, _ = keys_of("hi")
+    assert digests == {keys[0][1].hex()}
+
+
+def test_shared_store_resumes_on_another_store(tmp_path):
+    shared = SQLiteStore(str(tmp_path / "shared.db"))
+    first_worker = SessionStore("worker", shared=shared)
+    second_worker = SessionStore("worker", shared=shared)
+    first_keys, first = keys_of("first")
+    next_keys, following = keys_of("first", "reply", "second")
+
+    async def run():
+        turn = await first_worker.begin(first_keys, first)
+        turn.session.handle = "thread"
+        turn.finish(True)
+        await asyncio.gather(*first_worker.pending_writes)
+        resumed = await second_worker.begin(next_keys, following)
+        # Taken out of the store, a concurrent turn starts a new session
+        concurrent = await first_worker.begin(next_keys, following)
+        return resumed, concurrent
+
+    resumed, concurrent = asyncio.run(run())
+    assert resumed.resumed and resumed.session.handle == "thread"
+    assert not concurrent.resumed
+
+
+def test_launcher_does_not_pin_the_hash_seed(monkeypatch, tmp_path):
+    monkeypatch.delenv("PYTHONHASHSEED", raising=False)
+    monkeypatch.setenv(SHARED_STORE_ENV, str(tmp_path / "store.db"))
+    calls = []
+    monkeypatch.setattr(launcher.uvicorn, "run", lambda app, **options: calls.append(options))
+    launcher.serve("app:app", workers=2)
+    assert calls[0]["workers"] == 2
+    assert "PYTHONHASHSEED" not in os.environ
@@ -0,0 +1,170 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import async_chatCompletions, get_single_flight_stats
+from chatbridge.singleflight import SingleFlight
+
+
+async def collect(deltas) -> str:
+    return "".join([delta async for delta in deltas])
+
+
+def test_identical_calls_share_one_backend_call():
+    group = SingleFlight("shared")
+    calls = []
+
+    async def call():
+        calls.append(True)
+
+        async def deltas():
+            for delta in ("a", "b", "c"):
+                await asyncio.sleep(0.01)
+                yield delta
+
+        return deltas()
+
+    async def request():
+        response, leader = await group.join("k", call)
+        return await collect(response), leader
+
+    async def run():
+        return await asyncio.gather(*(request() for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert [text for text, _ in results] == ["abc"] * 3
+    assert sum(leader for _, leader in results) == 1
+    assert len(calls) == 1
+    stats = group.stats()
+    assert stats["backend_calls"] == 1
+    assert stats["coalesced"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_late_joiner_gets_the_deltas_replayed():
+    group = SingleFlight("replay")
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def call():
+            async def deltas():
+                yield "early"
+                await gate.wait()
+                yield " late"
+
+            return deltas()
+
+        first, _ = await group.join("k", call)
+        first_text = asyncio.create_task(collect(first))
+        await asyncio.sleep(0.01)
+        second, leader = await group.join("k", call)
+        gate.set()
+        return await first_text, await collect(second), leader
+
+    first, second, leader = asyncio.run(run())
+    assert first == second == "early late"
+    assert leader is False
+
+
+def test_non_streaming_result_is_shared():
+    group = SingleFlight("result")
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return {"error": "busy"}
+
+    async def run():
+        return await asyncio.gather(group.join("k", call), group.join("k", call))
+
+    (first, _), (second, _) = asyncio.run(run())
+    assert first == second == {"error": "busy"}
+    assert group.stats()["backend_calls"] == 1
+
+
+def test_backend_error_reaches_every_waiter():
+    group = SingleFlight("error")
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("backend down")
+
+    async def run():
+        return await asyncio.gather(
+            group.join("k", call), group.join("k", call), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_backend_is_cancelled_when_every_waiter_leaves():
+    group = SingleFlight("cancel")
+    closed = []
+
+    async def call():
+        async def deltas():
+            try:
+                yield "a"
+                await asyncio.sleep(10)
+                yield "b"
+            finally:
+                closed.append(True)
+
+        return deltas()
+
+    async def run():
+        response, _ = await group.join("k", call)
+        assert await response.__anext__() == "a"
+        await response.aclose()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert closed == [True]
+    stats = group.stats()
+    assert stats["cancelled"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_different_keys_do_not_coalesce():
+    group = SingleFlight("keys")
+
+    async def call():
+        return "reply"
+
+    async def run():
+        for key in ("a", "b"):
+            response, leader = await group.join(key, call)
+            assert leader
+            assert await collect(response) == "reply"
+
+    asyncio.run(run())
+    assert group.stats()["backend_calls"] == 2
+
+
+def test_concurrent_requests_share_one_completion():
+    calls = []
+
+    async def coalesced_backend(prompt, res, new_session):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        yield "shared reply"
+
+    app = FastAPI()
+    app.post(CHAT_PATH)(async_chatCompletions(coalesce=True)(coalesced_backend))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = chat_body("hi", temperature=0)
+            return await asyncio.gather(*(client.post(CHAT_PATH, json=body) for _ in range(3)))
+
+    responses = asyncio.run(run())
+    assert [r.json()["choices"][0]["message"]["content"] for r in responses] == [
+        "shared reply"
+    ] * 3
+    assert len(calls) == 1
+    assert get_single_flight_stats()["test_singleflight.coalesced_backend"]["coalesced"] == 2
@@ -0,0 +1,59 @@
+import asyncio
+
+from conftest import CHAT_PATH, chat_body, content_of, read_body, sse_events
+
+from chatbridge.chatbridge import (
+    chatCompletions,
+    async_chatCompletions,
+    create_stream_delta_response,
+)
+
+
+def test_sync_generator_streams_every_delta(serve):
+    def stream_sync_backend(prompt, res, new_session):
+        yield "Hel"
+        yield "lo"
+        yield " world"
+
+    client = serve(chatCompletions()(stream_sync_backend))
+    response = client.post(CHAT_PATH, json=chat_body(stream=True))
+    events = sse_events(response.text)
+    assert events[0]["choices"][0]["delta"] == {"role": "assistant", "content": ""}
+    assert content_of(events) == ["Hel", "lo", " world"]
+    assert events[-2]["choices"][0]["finish_reason"] == "stop"
+    assert events[-1] == "[DONE]"
+
+
+def test_async_generator_streams_every_delta(serve):
+    async def stream_async_backend(prompt, res, new_session):
+        for delta in ("a", "b", "c"):
+            await asyncio.sleep(0)
+            yield delta
+
+    client = serve(async_chatCompletions()(stream_async_backend))
+    events = sse_events(client.post(CHAT_PATH, json=chat_body(stream=True)).text)
+    assert content_of(events) == ["a", "b", "c"]
+
+
+def test_generator_reply_is_joined_without_stream(serve):
+    def joined_sync_backend(prompt, res, new_session):
+        yield "Hello"
+        yield ""
+        yield " there"
+
+    client = serve(chatCompletions()(joined_sync_backend))
+    body = client.post(CHAT_PATH, json=chat_body()).json()
+    assert body["choices"][0]["message"]["content"] == "Hello there"
+
+
+def test_delta_response_detects_tool_calls():
+    async def deltas():
+        yield "FC_USE\n<function_call><tool>search</tool>"
+        yield "<args><q>paris</q></args></function_call>"
+
+    response = create_stream_delta_response("m", deltas(), detect_tool_calls=True)
+    events = sse_events(asyncio.run(read_body(response)))
+    assert content_of(events) == []
+    tool_call = events[1]["choices"][0]
+    assert tool_call["finish_reason"] == "tool_calls"
+    assert tool_call["delta"]["tool_calls"][0]["function"]["name"] == "search"
@@ -0,0 +1,130 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge import chatbridge, tokens
+from chatbridge.chatbridge import (
+    ChatEnvelope,
+    Messages,
+    async_chatCompletions,
+    chatbridge_lifespan,
+)
+from chatbridge.lazyrequest import parse_lazy_request
+from chatbridge.tokens import TokenCounter, TokenUsage, count_text
+
+
+def test_lazy_messages_are_counted_without_validation():
+    contents = ["message %d about tokens" % index for index in range(50)]
+    body = json.dumps(chat_body(*contents)).encode()
+    messages = parse_lazy_request(body, ChatEnvelope, Messages).messages
+    counter = TokenCounter()
+    lazy = asyncio.run(counter.prompt_tokens(messages))
+    assert messages.materialized() == 0
+    parsed = [Messages(**message) for message in json.loads(body)["messages"]]
+    assert asyncio.run(TokenCounter().prompt_tokens(parsed)) == lazy
+
+
+def test_resent_history_hits_the_cache():
+    counter = TokenCounter()
+    first = [Messages(role="user", content="hello there")]
+    asyncio.run(counter.prompt_tokens(first))
+    second = first + [Messages(role="assistant", content="general kenobi")]
+    asyncio.run(counter.prompt_tokens(second))
+    assert counter.stats()["hits"] == 1
+    assert counter.stats()["misses"] == 2
+
+
+def test_large_text_is_counted_off_the_loop():
+    counter = TokenCounter(offload_chars=10)
+    messages = [Messages(role="user", content="word " * 100)]
+    total = asyncio.run(counter.prompt_tokens(messages))
+    assert total > 100
+    assert asyncio.run(counter.text_tokens("word " * 100)) == count_text("word " * 100)
+    assert counter.stats()["offloaded"] == 2
+
+
+def test_usage_counts_the_prompt_in_finish():
+    counter = TokenCounter()
+    usage = TokenUsage(counter, [Messages(role="user", content="one two three")])
+    assert counter.stats()["misses"] == 0
+    usage.feed("four five ")
+    counts = asyncio.run(usage.finish())
+    assert counts["completion_tokens"] == count_text("four five ")
+    assert counts["prompt_tokens"] > 3
+    assert counter.stats()["misses"] == 1
+
+
+def test_count_text_does_not_load_the_encoding(monkeypatch):
+    monkeypatch.setattr(tokens, "encoding", None)
+    monkeypatch.setattr(tokens, "encoding_loaded", False)
+    assert count_text("a b c") == 3
+    assert tokens.get_token_stats()["tokenizer"] == "approx"
+    assert tokens.encoding_loaded is False
+
+
+def test_stream_without_include_usage_counts_nothing(serve, monkeypatch):
+    counted = []
+    original = TokenCounter.prompt_tokens
+
+    async def prompt_tokens(self, messages, extra=""):
+        counted.append(len(messages))
+        return await original(self, messages, extra)
+
+    monkeypatch.setattr(TokenCounter, "prompt_tokens", prompt_tokens)
+
+    async def usage_backend(prompt, res, new_session):
+        yield "reply"
+
+    client = serve(async_chatCompletions()(usage_backend))
+    client.post(CHAT_PATH, json=chat_body("a", "b", "c", stream=True))
+    assert counted == []
+    body = chat_body("a", "b", "c", stream=True, stream_options={"include_usage": True})
+    client.post(CHAT_PATH, json=body)
+    assert counted == [3]
+    client.post(CHAT_PATH, json=chat_body("a"))
+    assert counted == [3, 1]
+
+
+def test_text_without_whitespace_is_counted_in_chunks():
+    usage = TokenUsage(TokenCounter(), [])
+    for _ in range(3000):
+        usage.feed("中文")
+    assert usage.pending_chars < tokens.STREAM_CHUNK_CHARS
+    assert usage.completion > 0
+    counts = asyncio.run(usage.finish())
+    assert counts["completion_tokens"] == count_text("中文" * 3000)
+
+
+def test_spaced_deltas_are_cut_at_the_last_space():
+    usage = TokenUsage(TokenCounter(), [])
+    usage.feed("one tw")
+    assert usage.pending == [" tw"]
+    usage.feed("o three")
+    assert "".join(usage.pending) == " three"
+    assert asyncio.run(usage.finish())["completion_tokens"] == count_text("one two three")
+
+
+def test_cache_keys_are_digests():
+    assert tokens.part_key("user", "a") != tokens.part_key("assistant", "a")
+    assert tokens.part_key("user", "a") == tokens.part_key("user", "a")
+    assert len(tokens.part_key("", "\ud800")) == tokens.TOKEN_KEY_SIZE
+
+
+def test_lifespan_loads_the_encoding_once(serve, monkeypatch):
+    loads = []
+    monkeypatch.setattr(chatbridge, "load_encoding", lambda: loads.append(True))
+    entered = []
+
+    @asynccontextmanager
+    async def inner(app):
+        entered.append(loads[:])
+        yield
+
+    async def lifespan_backend(prompt, res, new_session):
+        yield "ok"
+
+    serve(async_chatCompletions()(lifespan_backend), chatbridge_lifespan(inner))
+    assert loads == [True]
+    assert entered == [[True]]
@@ -0,0 +1,47 @@
+from chatbridge.chatbridge import ToolPromptCache, Tools, tools_fingerprint
+
+
+def make_tools(*names: str, required=("city",)) -> list:
+    return [
+        Tools.model_validate(
+            {
+                "function": {
+                    "name": name,
+                    "description": "",
+                    "parameters": {
+                        "properties": {"city": {"type": "string"}},
+                        "required": list(required),
+                    },
+                }
+            }
+        )
+        for name in names
+    ]
+
+
+def test_fingerprint_depends_on_names_and_schema():
+    assert tools_fingerprint(make_tools("a")) == tools_fingerprint(make_tools("a"))
+    assert tools_fingerprint(make_tools("a")) != tools_fingerprint(make_tools("b"))
+    assert tools_fingerprint(make_tools("a")) != tools_fingerprint(
+        make_tools("a", required=())
+    )
+
+
+def test_rendered_prompt_is_reused():
+    cache = ToolPromptCache()
+    first = cache.get(make_tools("weather"))
+    assert "<tool>weather</tool>" in first
+    assert "string, required" in first
+    assert cache.get(make_tools("weather")) is first
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_prompt_is_evicted():
+    cache = ToolPromptCache(maxsize=2)
+    cache.get(make_tools("a"))
+    cache.get(make_tools("b"))
+    cache.get(make_tools("a"))
+    cache.get(make_tools("c"))
+    cache.get(make_tools("a"))
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 3}
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import async_chatCompletions, chatCompletions
+from chatbridge.tracing import (
+    JSONLExporter,
+    Tracer,
+    configure_tracing,
+    parse_traceparent,
+    start_span,
+    trace_span,
+)
+
+TRACEPARENT = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+
+
+class ListExporter:
+    def __init__(self):
+        self.records = []
+
+    def export(self, record: dict):
+        self.records.append(record)
+
+
+@pytest.fixture
+def spans():
+    exporter = ListExporter()
+    configure_tracing(exporter)
+    yield exporter.records
+    configure_tracing(None)
+
+
+def by_name(records: list) -> dict:
+    return {record["name"]: record for record in records}
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(TRACEPARENT) == ("a" * 32, "b" * 16)
+    assert parse_traceparent(TRACEPARENT[:-2] + "00") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_untraced_requests_create_no_spans():
+    assert Tracer().start_trace("root") is None
+    assert start_span("child") is None
+    with trace_span("block") as span:
+        assert span is None
+
+
+def test_sampling_rate_zero_skips_the_trace():
+    traced = Tracer(ListExporter(), sample_rate=0.0)
+    assert traced.start_trace("root") is None
+    # A sampled parent is always followed
+    assert traced.start_trace("root", TRACEPARENT) is not None
+
+
+def test_completion_spans_share_one_trace(serve, spans):
+    async def traced_backend(prompt, res, new_session):
+        with trace_span("login", user="me"):
+            pass
+        yield "ok"
+
+    client = serve(async_chatCompletions()(traced_backend))
+    response = client.post(CHAT_PATH, json=chat_body(), headers={"traceparent": TRACEPARENT})
+    assert response.status_code == 200
+    records = by_name(spans)
+    root = next(record for record in spans if record["parent_id"] == "b" * 16)
+    assert {"prompt", "backend", "login", "serialize"} <= set(records)
+    assert {record["trace_id"] for record in spans} == {"a" * 32}
+    assert records["login"]["attributes"] == {"user": "me"}
+    assert records["backend"]["parent_id"] == root["span_id"]
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_streaming_backend_spans_nest_under_the_backend_span(serve, spans, stream):
+    async def streamed_backend(prompt, res, new_session):
+        with trace_span("connect"):
+            pass
+        yield "a"
+        with trace_span("upstream_read"):
+            pass
+        yield "b"
+
+    client = serve(async_chatCompletions()(streamed_backend))
+    client.post(CHAT_PATH, json=chat_body(stream=stream))
+    records = by_name(spans)
+    backend = records["backend"]["span_id"]
+    assert records["connect"]["parent_id"] == backend
+    assert records["upstream_read"]["parent_id"] == backend
+
+
+def test_sync_backends_see_the_trace_context(serve, spans):
+    def sync_traced_backend(prompt, res, new_session):
+        with trace_span("sync_login"):
+            pass
+        return "ok"
+
+    client = serve(chatCompletions()(sync_traced_backend))
+    client.post(CHAT_PATH, json=chat_body())
+    records = by_name(spans)
+    assert records["sync_login"]["trace_id"] == records["backend"]["trace_id"]
+
+
+def test_failed_backend_span_is_an_error(serve, spans):
+    def failing_traced_backend(prompt, res, new_session):
+        raise RuntimeError("upstream down")
+
+    client = serve(chatCompletions()(failing_traced_backend))
+    with pytest.raises(RuntimeError):
+        client.post(CHAT_PATH, json=chat_body())
+    assert any(record["status"] == "error" for record in spans)
+
+
+def test_jsonl_exporter_appends_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = JSONLExporter(str(path))
+    exporter.export({"name": "a"})
+    exporter.export({"name": "b"})
+    exporter.file.close()
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["a", "b"]
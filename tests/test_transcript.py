@@ -0,0 +1,57 @@
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge.chatbridge import ChatResponse, chatCompletions, transcript_builder
+from chatbridge.transcript import TranscriptBuilder, render_transcript
+
+
+def conversation(*contents: str) -> list:
+    return ChatResponse.model_validate(chat_body(*contents)).messages
+
+
+def test_render_transcript():
+    messages = conversation("hi", "hello", "bye")
+    assert render_transcript("H", messages) == (
+        "H\n\nHuman: hi\n\nAssistant: hello\n\nHuman: bye"
+    )
+
+
+def test_builder_reuses_the_previous_turn():
+    builder = TranscriptBuilder()
+    first = conversation("a", "b", "c")
+    second = conversation("a", "b", "c", "d", "e")
+    assert builder.build("", first) == render_transcript("", first)
+    assert builder.build("", second) == render_transcript("", second)
+    stats = builder.stats()
+    assert stats["hits"] == 1
+    assert stats["reused_messages"] == 3
+    assert stats["rendered_messages"] == 5
+
+
+def test_edited_history_is_not_reused():
+    builder = TranscriptBuilder()
+    builder.build("", conversation("a", "b", "c"))
+    edited = conversation("a", "B", "c", "d", "e")
+    assert builder.build("", edited) == render_transcript("", edited)
+    assert builder.stats()["hits"] == 0
+
+
+def test_builder_is_bounded_by_characters():
+    builder = TranscriptBuilder(max_chars=100)
+    builder.build("", conversation("x" * 60))
+    builder.build("", conversation("y" * 60))
+    assert builder.stats()["size"] == 1
+    assert builder.stats()["chars"] <= 100
+
+
+def test_plain_transcripts_skip_the_prefix_cache(serve):
+    prompts = []
+
+    def transcript_backend(prompt, res, new_session):
+        prompts.append(prompt)
+        return "ok"
+
+    before = transcript_builder.stats()
+    client = serve(chatCompletions(build_all_prompt=1)(transcript_backend))
+    client.post(CHAT_PATH, json=chat_body("a", "b", "c"))
+    assert prompts == ["\n\nHuman: a\n\nAssistant: b\n\nHuman: c"]
+    assert transcript_builder.stats() == before
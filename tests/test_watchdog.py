@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from conftest import CHAT_PATH, chat_body
+
+from chatbridge import chatbridge
+from chatbridge.chatbridge import async_chatCompletions, chatbridge_lifespan
+from chatbridge.watchdog import LoopWatchdog, current_backend
+
+
+def test_blocking_call_is_recorded_with_its_backend():
+    watchdog = LoopWatchdog(threshold=0.05)
+    watchdog.enable()
+
+    def blocking_backend():
+        time.sleep(0.3)
+
+    watchdog.register_backend(blocking_backend)
+
+    async def run():
+        watchdog.ensure_started()
+        await asyncio.sleep(0.1)
+        current_backend.set("blocking_backend")
+        blocking_backend()
+        await asyncio.sleep(0.1)
+        watchdog.stop()
+
+    asyncio.run(run())
+    stats = watchdog.stats()
+    assert stats["stalls"] >= 1
+    record = stats["recent"][0]
+    assert record["backend"] == "blocking_backend"
+    assert record["duration"] >= 0.2
+    assert "blocking_backend" in record["stack"]
+    assert stats["by_backend"]["blocking_backend"]["stalls"] >= 1
+
+
+def test_disabled_watchdog_does_not_start():
+    watchdog = LoopWatchdog(threshold=0.05)
+
+    async def run():
+        watchdog.ensure_started()
+        time.sleep(0.2)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert watchdog.loop is None
+    assert watchdog.stats()["stalls"] == 0
+
+
+def test_heartbeat_task_is_held_and_cancelled_on_detach():
+    watchdog = LoopWatchdog(threshold=0.05)
+    watchdog.enable()
+
+    async def run():
+        watchdog.ensure_started()
+        task = watchdog.task
+        assert task is not None and not task.done()
+        watchdog.detach()
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert watchdog.task is None and watchdog.loop is None
+    assert watchdog.enabled
+
+
+def test_lifespan_detaches_the_watchdog(serve, monkeypatch):
+    watchdog = LoopWatchdog(threshold=0.05)
+    watchdog.enable()
+    monkeypatch.setattr(chatbridge, "loop_watchdog", watchdog)
+
+    async def watched_backend(prompt, res, new_session):
+        yield "ok"
+
+    client = serve(async_chatCompletions()(watched_backend), chatbridge_lifespan())
+    client.post(CHAT_PATH, json=chat_body())
+    task = watchdog.task
+    assert task is not None
+    client.__exit__(None, None, None)
+    assert watchdog.task is None
+    assert task.cancelled()